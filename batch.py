@@ -0,0 +1,269 @@
+"""
+Пакетная подготовка текстур для многих пар текстура x маска без окна.
+
+Задания берутся из папки (каждая текстура .jpg/.jpeg/.bmp с каждой маской
+.png) или из манифеста (.csv с колонками texture, mask и необязательными
+size, name или .json со списком таких объектов; texture может быть
+шумом noise:ВИД[:ЗЕРНО]). Каждое задание строит три
+текстуры (обычную, обратную мозаику и мозаику с маской) и сохраняет их в
+свою подпапку. Задания выполняются в пуле процессов; ошибка или падение
+одного задания не останавливает остальные. С --stream текстуры считаются и
+пишутся полосами (stream.py) - для огромных масок и размеров.
+
+Примеры:
+    python batch.py campaign/ -o library --workers 8
+    python batch.py campaign.csv -o library --size 3840x2160 --report batch.json
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from cache import TextureCache
+from noise import is_noise_spec
+from options import parse_size
+from pipeline import build_textures, output_names, save_texture
+from stream import BAND_HEIGHT, stream_textures
+from tracing import finish as finish_trace, run_traced, span, tracer
+
+TEXTURE_EXTENSIONS = ('.jpg', '.jpeg', '.bmp')
+MASK_EXTENSIONS = ('.png',)
+
+
+class Job:
+    """Одно задание: пара текстура + маска, размер и имя подпапки результата"""
+
+    def __init__(self, texture, mask, size, name=None):
+        self.texture = texture
+        self.mask = mask
+        self.size = size
+        texture_name = texture.replace(':', '-') if is_noise_spec(texture) \
+            else os.path.splitext(os.path.basename(texture))[0]
+        self.name = name or (f"{texture_name}__"
+                             f"{os.path.splitext(os.path.basename(mask))[0]}")
+
+
+def jobs_from_directory(directory, size):
+    """Все сочетания текстур и масок из папки"""
+    names = sorted(os.listdir(directory))
+    textures = [name for name in names if name.lower().endswith(TEXTURE_EXTENSIONS)]
+    masks = [name for name in names if name.lower().endswith(MASK_EXTENSIONS)]
+    return [Job(os.path.join(directory, texture), os.path.join(directory, mask), size)
+            for texture in textures for mask in masks]
+
+
+def jobs_from_manifest(path, size):
+    """Задания из манифеста .csv или .json; пути считаются от папки манифеста"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='') as file:
+        if path.lower().endswith('.json'):
+            rows = json.load(file)
+        else:
+            rows = list(csv.DictReader(file))
+
+    jobs = []
+    for row in rows:
+        # Шум noise:... - не файл, путь к нему не достраивается
+        texture = row['texture'] if is_noise_spec(row['texture']) else os.path.join(base_dir, row['texture'])
+        jobs.append(Job(texture,
+                        os.path.join(base_dir, row['mask']),
+                        parse_size(row['size']) if row.get('size') else size,
+                        row.get('name') or None))
+    return jobs
+
+
+def load_jobs(source, size):
+    """Задания из папки или манифеста"""
+    if os.path.isdir(source):
+        return jobs_from_directory(source, size)
+    return jobs_from_manifest(source, size)
+
+
+def limit_memory(max_bytes):
+    """Ограничивает адресное пространство процесса-исполнителя (только Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+
+
+def run_job(job, output_dir, cache_dir, cache_bytes, output_format='png', compress_level=None,
+            band_height=None):
+    """
+    Выполняет одно задание в процессе пула. band_height - строить полосами
+    такой высоты (без кэша, см. stream.py).
+    Возвращает словарь с результатом; исключения не выпускает наружу
+    """
+    started = time.perf_counter()
+    job_dir = os.path.join(output_dir, job.name)
+    try:
+        with span('job', job=job.name):
+            from_cache = _run_job(job, job_dir, cache_dir, cache_bytes, output_format, compress_level,
+                                  band_height)
+    except Exception as e:
+        return {'name': job.name, 'ok': False, 'error': f"{type(e).__name__}: {e}",
+                'seconds': time.perf_counter() - started}
+    return {'name': job.name, 'ok': True, 'from_cache': from_cache,
+            'seconds': time.perf_counter() - started}
+
+
+def _run_job(job, job_dir, cache_dir, cache_bytes, output_format, compress_level, band_height):
+    if band_height:
+        stream_textures(job.texture, job.mask, job_dir, job.size, output_format,
+                        compress_level, band_height)
+        return False
+
+    cache = TextureCache(cache_dir, cache_bytes) if cache_bytes else None
+    mosaic_normal, mosaic_reverse, mosaic_with_mask, from_cache = build_textures(
+        job.texture, job.mask, job.size, cache)
+
+    os.makedirs(job_dir, exist_ok=True)
+    names = output_names(job.size, output_format)
+    save_texture(mosaic_normal, os.path.join(job_dir, names['normal']), compress_level)
+    save_texture(mosaic_with_mask, os.path.join(job_dir, names['masked']), compress_level)
+    save_texture(mosaic_reverse, os.path.join(job_dir, names['reverse']), compress_level)
+    return from_cache
+
+
+class BatchRunner:
+    """Прогоняет задания через пул процессов и печатает ход работы"""
+
+    def __init__(self, output_dir, workers=None, tasks_per_child=20, memory_limit=None,
+                 cache_dir=None, cache_bytes=0, output_format='png', compress_level=None,
+                 band_height=None):
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.tasks_per_child = tasks_per_child
+        self.memory_limit = memory_limit
+        self.cache_dir = cache_dir
+        self.cache_bytes = cache_bytes
+        self.output_format = output_format
+        self.compress_level = compress_level
+        self.band_height = band_height
+        self.results = []
+        self.total = 0
+
+    def make_pool(self, workers):
+        # Исполнитель пересоздается каждые tasks_per_child заданий - память,
+        # накопленная PIL за прошлые задания, возвращается системе
+        initializer = limit_memory if self.memory_limit else None
+        initargs = (self.memory_limit,) if self.memory_limit else ()
+        return ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=self.tasks_per_child,
+                                   initializer=initializer, initargs=initargs)
+
+    def report(self, result):
+        self.results.append(result)
+        position = f"[{len(self.results)}/{self.total}]"
+        if result['ok']:
+            source = " (из кэша)" if result.get('from_cache') else ""
+            print(f"{position} ✅ {result['name']} - {result['seconds']:.1f} с{source}")
+        else:
+            print(f"{position} ❌ {result['name']}: {result['error']}")
+        sys.stdout.flush()
+
+    def run_round(self, jobs, workers):
+        """Один проход пула; возвращает задания, потерянные из-за падения процесса"""
+        crashed = []
+        with self.make_pool(workers) as pool:
+            futures = {}
+            for job in jobs:
+                args = (job, self.output_dir, self.cache_dir, self.cache_bytes,
+                        self.output_format, self.compress_level, self.band_height)
+                # С трассировкой исполнитель возвращает и свои записи участков
+                future = pool.submit(run_traced, run_job, *args) if tracer.enabled else pool.submit(run_job, *args)
+                futures[future] = job
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    crashed.append(futures[future])
+                    continue
+                if tracer.enabled:
+                    result, events = result
+                    tracer.add_events(events)
+                self.report(result)
+        return crashed
+
+    def run(self, jobs):
+        """Выполняет все задания, возвращает список результатов"""
+        self.total = len(jobs)
+        os.makedirs(self.output_dir, exist_ok=True)
+        crashed = self.run_round(jobs, min(self.workers, len(jobs)))
+
+        # Падение процесса ломает весь пул, и заодно теряются соседние задания.
+        # Их перезапускаем по одному в отдельном процессе, чтобы найти виновника
+        if crashed:
+            print(f"⚠️  Процесс пула упал, повторяем {len(crashed)} задани(й) по одному")
+        for job in crashed:
+            if self.run_round([job], 1):
+                self.report({'name': job.name, 'ok': False, 'seconds': 0.0,
+                             'error': "процесс-исполнитель аварийно завершился"})
+        return self.results
+
+
+def main(argv=None):
+    """Точка входа пакетного режима"""
+    parser = argparse.ArgumentParser(description="Пакетная подготовка текстур для многих пар текстура x маска")
+    parser.add_argument('source', help="папка с текстурами и масками или манифест (.csv/.json)")
+    parser.add_argument('-o', '--output', default='mosaic_library', help="папка результатов")
+    parser.add_argument('--size', type=parse_size, default=(1920, 1080), help="размер текстур по умолчанию")
+    parser.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument('--tasks-per-child', type=int, default=20,
+                        help="после стольких заданий процесс-исполнитель перезапускается")
+    parser.add_argument('--memory-limit', type=int, default=None,
+                        help="предел памяти одного процесса, МБ (только Unix)")
+    parser.add_argument('--save-format', choices=('png', 'raw'), default='png',
+                        help="формат файлов результатов: png или несжатый файл кадра .illf")
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=None, metavar='0-9',
+                        help="уровень сжатия PNG (0 - без сжатия, быстрее всего)")
+    parser.add_argument('--stream', action='store_true',
+                        help="строить и писать текстуры полосами (огромные маски и размеры, без кэша)")
+    parser.add_argument('--band-height', type=int, default=BAND_HEIGHT, help="высота полосы для --stream, строк")
+    parser.add_argument('--trace', nargs='?', const='', metavar='FILE',
+                        help="замерить этапы заданий (время и память) и напечатать сводку; "
+                             "с FILE - сохранить трассу Chrome (JSON)")
+    parser.add_argument('--report', help="сохранить результаты заданий в JSON")
+    parser.add_argument('--no-cache', action='store_true', help="не использовать кэш готовых текстур")
+    parser.add_argument('--cache-dir', help="папка кэша (по умолчанию ~/.cache/illusion)")
+    parser.add_argument('--cache-size', type=int, default=2048, help="предельный размер кэша, МБ")
+    args = parser.parse_args(argv)
+    if args.trace is not None:
+        tracer.enable()
+
+    jobs = load_jobs(args.source, args.size)
+    if not jobs:
+        print(f"❌ В '{args.source}' не найдено ни одной пары текстура + маска")
+        return 1
+
+    runner = BatchRunner(args.output, args.workers, args.tasks_per_child,
+                         args.memory_limit * 1024 * 1024 if args.memory_limit else None,
+                         args.cache_dir, 0 if args.no_cache else args.cache_size * 1024 * 1024,
+                         args.save_format, args.compress_level,
+                         args.band_height if args.stream else None)
+    print(f"=== Пакетная подготовка: {len(jobs)} заданий, процессов: {runner.workers} ===")
+
+    started = time.perf_counter()
+    results = runner.run(jobs)
+    elapsed = time.perf_counter() - started
+
+    done = sum(1 for result in results if result['ok'])
+    failed = len(results) - done
+    print(f"\n✅ Готово: {done}, ❌ ошибок: {failed}, за {elapsed:.1f} с "
+          f"({len(results) / max(elapsed, 1e-9):.2f} заданий/с)")
+    print(f"📁 Результаты сохранены в папку: '{args.output}'")
+
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump({'elapsed': elapsed, 'workers': runner.workers, 'results': results},
+                      file, indent=2, ensure_ascii=False)
+    finish_trace(args.trace)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
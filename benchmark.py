@@ -0,0 +1,228 @@
+"""
+Набор замеров производительности всего конвейера: генерация и показ.
+
+Работает без дисплея (SDL dummy), на синтетических текстурах и масках для
+нескольких разрешений и размеров плитки. Результаты сохраняются в JSON,
+чтобы прогоны можно было сравнивать между собой:
+
+    python benchmark.py -o bench_before.json
+    python benchmark.py -o bench_after.json --compare bench_before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['SDL_AUDIODRIVER'] = 'dummy'
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+import PIL
+import pygame
+from PIL import Image, ImageDraw
+
+import generator
+import genlin
+from mosaic import apply_mask_correct, create_mosaic_texture
+from options import parse_sizes
+
+SCREEN_SIZE = (1280, 720)
+
+
+def parse_ints(value):
+    """Разбирает список целых вида 100,16"""
+    return [int(item) for item in value.split(',')]
+
+
+def synthetic_texture(tile_size, seed=0):
+    """Случайная RGB-текстура tile_size x tile_size"""
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (tile_size, tile_size, 3), dtype=np.uint8))
+
+
+def synthetic_mask(size):
+    """Маска в оттенках серого: белый фон и черный эллипс в центре (как рисуют вручную)"""
+    mask = Image.new('L', size, 255)
+    width, height = size
+    ImageDraw.Draw(mask).ellipse((width * 3 // 8, height // 4, width * 5 // 8, height * 3 // 4), fill=0)
+    return mask
+
+
+def measure(function, repeat):
+    """Запускает function repeat раз, возвращает min/median/mean в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'min': min(timings), 'median': statistics.median(timings), 'mean': statistics.mean(timings)}
+
+
+def measure_startup(module, repeat):
+    """Холодный старт: время `import module` в новом процессе интерпретатора, мс"""
+    code = ("import time; started = time.perf_counter(); "
+            f"import {module}; print((time.perf_counter() - started) * 1000)")
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        timings.append(float(output.stdout.split()[-1]))
+    return {'min': min(timings), 'median': statistics.median(timings), 'mean': statistics.mean(timings)}
+
+
+def bench_startup(repeat):
+    """Время импорта модулей, которые грузят пакетные процессы и скрипты"""
+    results = []
+    for module in ('pipeline', 'generator', 'genlin'):
+        values = measure_startup(module, repeat)
+        results.append({'name': 'import', 'params': {'module': module}, **values})
+        print(f"   {'import ' + module:<53} {values['median']:>9.2f} мс")
+    return results
+
+
+def init_display():
+    """(Пере)запускает фиктивный дисплей - run_demo вызывает pygame.quit() в конце"""
+    pygame.display.init()
+    pygame.display.set_mode(SCREEN_SIZE)
+
+
+def run_loop(demo, frames):
+    """Прогоняет цикл демонстрации frames кадров без ограничения FPS, возвращает сводку кадров"""
+    demo.max_frames = frames
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        demo.run_demo()
+    elapsed = time.perf_counter() - started
+    summary = demo.stats.summary()
+    return {
+        'frames': frames,
+        'fps': frames / elapsed,
+        'frame_ms': summary['total'],
+        'blit_ms': summary['blit'],
+        'flip_ms': summary['flip'],
+    }
+
+
+def bench_case(output_size, tile_size, repeat, frames):
+    """Все замеры для одного разрешения и размера плитки"""
+    params = {'size': f"{output_size[0]}x{output_size[1]}", 'tile': tile_size}
+    results = []
+
+    def add(name, values, **extra):
+        results.append({'name': name, 'params': dict(params, **extra), **values})
+        print(f"   {name:<32} {json.dumps(extra, ensure_ascii=False) if extra else '':<20} "
+              f"{values.get('median', values.get('fps', 0)):>9.2f}{' мс' if 'median' in values else ' FPS'}")
+
+    base_texture = synthetic_texture(tile_size)
+    mask = synthetic_mask(output_size)
+
+    for reverse in (False, True):
+        add('create_mosaic_texture',
+            measure(lambda: create_mosaic_texture(base_texture, output_size, reverse), repeat),
+            reverse=reverse)
+
+    mosaic_normal = create_mosaic_texture(base_texture, output_size, False)
+    mosaic_reverse = create_mosaic_texture(base_texture, output_size, True)
+    add('apply_mask_correct', measure(lambda: apply_mask_correct(mosaic_normal, mask), repeat))
+    mosaic_with_mask = apply_mask_correct(mosaic_normal, mask)
+
+    init_display()
+    add('pil_to_pygame', measure(lambda: generator.pil_to_pygame(mosaic_with_mask), repeat), mode='RGBA')
+    surfaces = [generator.pil_to_pygame(image) for image in (mosaic_normal, mosaic_reverse, mosaic_with_mask)]
+
+    # Мерцание: refresh_rate без ограничения и смена фазы каждый кадр - худший случай
+    demo = generator.TextureDemo(*SCREEN_SIZE, refresh_rate=100000, switch_every=1)
+    add('TextureDemo.add_texture', measure(lambda: demo.add_texture(surfaces[2], 'bench'), repeat))
+    demo.textures = []
+    for surface in surfaces:
+        demo.add_texture(surface, 'bench')
+    add('flicker_loop', run_loop(demo, frames))
+
+    init_display()
+    demo = genlin.TextureDemo(*SCREEN_SIZE)
+    demo.max_fps = 0
+    for surface in surfaces:
+        demo.add_texture(surface, 'bench')
+    frame = pygame.Surface(SCREEN_SIZE).convert()
+    add('compose_scroll_frame', measure(lambda: demo.compose_scroll_frame(frame, SCREEN_SIZE[1] // 2), repeat))
+    add('scroll_loop', run_loop(demo, frames))
+
+    return results
+
+
+def compare(results, previous_path):
+    """Печатает отношение к прошлому прогону (меньше 1 - быстрее)"""
+    with open(previous_path) as file:
+        previous = json.load(file)
+
+    def key(item):
+        return item['name'], json.dumps(item['params'], sort_keys=True)
+
+    old = {key(item): item for item in previous['results']}
+    print(f"\n📈 Сравнение с {previous_path}:")
+    for item in results:
+        before = old.get(key(item))
+        if before is None:
+            continue
+        if 'median' in item:
+            ratio = item['median'] / before['median']
+            label = f"{before['median']:.2f} -> {item['median']:.2f} мс"
+        else:
+            ratio = before['fps'] / item['fps']
+            label = f"{before['fps']:.1f} -> {item['fps']:.1f} FPS"
+        print(f"   {item['name']:<32} {json.dumps(item['params'], ensure_ascii=False):<50} {label} (x{ratio:.2f})")
+
+
+def main(argv=None):
+    """Точка входа набора замеров"""
+    parser = argparse.ArgumentParser(description="Замеры производительности генерации и показа")
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('1920x1080,3840x2160'),
+                        help="разрешения через запятую")
+    parser.add_argument('--tiles', type=parse_ints, default=parse_ints('100,16'),
+                        help="размеры плитки через запятую")
+    parser.add_argument('--repeat', type=int, default=5, help="повторов каждого замера")
+    parser.add_argument('--frames', type=int, default=300, help="кадров в замерах циклов отрисовки")
+    parser.add_argument('-o', '--output', default='bench_results.json', help="файл результатов (JSON)")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    print("=== Замеры производительности ===")
+    results = []
+    print("\n🚀 Холодный старт")
+    results.extend(bench_startup(args.repeat))
+    for output_size in args.sizes:
+        for tile_size in args.tiles:
+            print(f"\n🎯 {output_size[0]}x{output_size[1]}, плитка {tile_size}x{tile_size}")
+            results.extend(bench_case(output_size, tile_size, args.repeat, args.frames))
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'pygame': pygame.version.ver,
+            'pillow': PIL.__version__,
+            'numpy': np.__version__,
+            'screen_size': list(SCREEN_SIZE),
+            'repeat': args.repeat,
+            'frames': args.frames,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"\n✅ Результаты сохранены: {os.path.abspath(args.output)}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Перевод изображений PIL в поверхности pygame.
+
+Данные передаются в pygame через frombuffer (поверхность ссылается на буфер,
+а не копирует его), после чего поверхность один раз переводится в формат
+экрана через convert()/convert_alpha(), чтобы blit больше не тратил время на
+преобразование пикселей. Счетчик copy_stats показывает, сколько байт
+реально скопировано.
+"""
+from lazy import lazy_import
+from tracing import span
+
+pygame = lazy_import('pygame')
+
+
+class CopyStats:
+    """Сколько изображений переведено и сколько байт при этом скопировано"""
+
+    def __init__(self):
+        self.images = 0
+        self.bytes_copied = 0
+
+    def add(self, nbytes):
+        self.bytes_copied += nbytes
+
+    def summary(self):
+        return f"{self.images} изобр., скопировано {self.bytes_copied / (1024 * 1024):.1f} МБ"
+
+
+copy_stats = CopyStats()
+
+
+def display_ready():
+    """Есть ли окно, под формат которого можно конвертировать поверхности"""
+    return pygame.display.get_init() and pygame.display.get_surface() is not None
+
+
+def to_display_format(surface, alpha):
+    """Переводит поверхность в формат экрана (одна копия), если окно уже открыто"""
+    if not display_ready():
+        return surface
+    converted = surface.convert_alpha() if alpha else surface.convert()
+    copy_stats.add(converted.get_height() * converted.get_pitch())
+    return converted
+
+
+def pil_to_pygame(pil_image, convert=True):
+    """Конвертирует изображение PIL в поверхность Pygame"""
+    with span('pygame.convert', size=f"{pil_image.width}x{pil_image.height}"):
+        if pil_image.mode not in ('RGB', 'RGBA'):
+            # Конвертируем в RGB если другой режим
+            pil_image = pil_image.convert('RGB')
+            copy_stats.add(pil_image.width * pil_image.height * len(pil_image.getbands()))
+
+        # tobytes - единственная неизбежная копия: PIL не отдает свою память наружу
+        data = pil_image.tobytes()
+        copy_stats.add(len(data))
+        surface = pygame.image.frombuffer(data, pil_image.size, pil_image.mode)
+        copy_stats.images += 1
+
+        if convert:
+            surface = to_display_format(surface, pil_image.mode == 'RGBA')
+        return surface
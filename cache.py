@@ -0,0 +1,105 @@
+"""
+Кэш готовых мозаик и текстур с маской на диске.
+
+Ключ - хэш содержимого входных файлов и параметров (размер, направление,
+фильтр), поэтому переименование файла не сбивает кэш, а правка маски -
+сбивает. Данные лежат в несжатом формате кадра (framefile) и грузятся
+без декодирования PNG. Общий размер ограничен, при переполнении удаляются
+давно не использованные записи (LRU по времени последнего обращения).
+"""
+import hashlib
+import os
+
+from framefile import load_frame, save_frame
+
+# Меняется, если меняется алгоритм построения - старые записи перестают совпадать
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.environ.get('ILLUSION_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'illusion'))
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+EXTENSION = '.illf'
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts):
+    """Ключ кэша из частей (хэшей файлов и параметров)"""
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode('ascii'))
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class TextureCache:
+    """Кэш изображений на диске с ограничением размера и вытеснением LRU"""
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + EXTENSION)
+
+    def get(self, key):
+        """Изображение по ключу или None"""
+        path = self.path(key)
+        try:
+            image = load_frame(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # Время изменения служит временем последнего обращения для LRU
+        os.utime(path)
+        self.hits += 1
+        return image
+
+    def put(self, key, image):
+        """Кладет изображение в кэш и при необходимости освобождает место"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_frame(image, path)
+        self.evict()
+        return path
+
+    def entries(self):
+        """Список (время обращения, размер, путь) всех записей"""
+        result = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(EXTENSION):
+                    path = os.path.join(directory, name)
+                    try:
+                        info = os.stat(path)
+                    except OSError:
+                        continue
+                    result.append((info.st_mtime, info.st_size, path))
+        return result
+
+    def evict(self):
+        """Удаляет самые давние записи, пока кэш не уложится в max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        return total
+
+    def summary(self):
+        return f"попаданий {self.hits}, промахов {self.misses}, вытеснено {self.evictions}"
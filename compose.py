@@ -0,0 +1,83 @@
+"""
+Предварительная сборка кадров демонстрации.
+
+Фон и текстура с маской заранее запекаются в непрозрачные поверхности в
+формате экрана, чтобы в цикле отрисовки оставался один непрозрачный blit
+без попиксельного альфа-смешивания. compose_frame - то же наложение для
+кадров PIL (офлайн-рендер и кадры мерцания).
+"""
+from lazy import lazy_import
+from mosaic import VirtualMosaic
+from tracing import span
+
+pygame = lazy_import('pygame')
+
+
+def compose_frame(background, overlay_rgb, overlay_alpha):
+    """Накладывает текстуру с маской на фон (PIL) и возвращает непрозрачный RGB-кадр"""
+    # Виртуальная мозаика собирается сразу в новый кадр, копировать нечего
+    with span('render.compose'):
+        frame = background.materialize() if isinstance(background, VirtualMosaic) else background.copy()
+        frame.paste(overlay_rgb, (0, 0), overlay_alpha)
+        return frame
+
+
+def precompose(background, overlay):
+    """Запекает фон и текстуру с маской в один непрозрачный кадр в формате экрана"""
+    frame = background.convert()
+    frame.blit(overlay, (0, 0))
+    return frame
+
+
+class FrameRing:
+    """
+    Ограниченное кольцо заранее собранных кадров.
+
+    Кадры ищутся по ключу (например, позиции прокрутки). При промахе кадр
+    собирается в следующий слот кольца, вытесняя самый старый.
+    """
+
+    def __init__(self, size, capacity):
+        self.size = size
+        self.capacity = capacity
+        self.slots = []
+        self.keys = []
+        self.index = {}
+        self.next_slot = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        """Возвращает кадр по ключу, при промахе собирает его через render(surface)"""
+        frame = self.index.get(key)
+        if frame is not None:
+            self.hits += 1
+            return frame
+
+        self.misses += 1
+        if len(self.slots) < self.capacity:
+            frame = pygame.Surface(self.size).convert()
+            self.slots.append(frame)
+            self.keys.append(key)
+        else:
+            slot = self.next_slot
+            del self.index[self.keys[slot]]
+            frame = self.slots[slot]
+            self.keys[slot] = key
+            self.next_slot = (slot + 1) % self.capacity
+
+        render(frame)
+        self.index[key] = frame
+        return frame
+
+    def clear(self):
+        """Очищает кольцо (например, после смены скорости прокрутки)"""
+        self.slots = []
+        self.keys = []
+        self.index = {}
+        self.next_slot = 0
+
+
+def ring_capacity(size, max_bytes):
+    """Сколько непрозрачных кадров экрана помещается в заданный объем памяти"""
+    return max(0, max_bytes // (size[0] * size[1] * 4))
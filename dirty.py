@@ -0,0 +1,91 @@
+"""
+Грязные прямоугольники для демонстрации.
+
+Между кадрами меняются только пиксели, где текстура с маской прозрачна - в
+остальных местах фон закрыт. Маска один раз разбирается на сетку плиток,
+соседние плитки склеиваются в прямоугольники, и дальше перерисовываются и
+отправляются на экран только они через pygame.display.update(rects).
+"""
+import numpy as np
+
+from lazy import lazy_import
+
+pygame = lazy_import('pygame')
+
+
+def tile_rects(tiles, tile_size, size):
+    """
+    Склеивает отмеченные плитки (строки плиток из bool) в прямоугольники:
+    соседние плитки строки - в серию, серии с теми же границами подряд - вниз
+    """
+    width, height = size
+    rects = []
+    open_rects = {}  # (x, ширина) -> прямоугольник, растущий вниз
+    for row, flags in enumerate(tiles):
+        y = row * tile_size
+        row_height = min(tile_size, height - y)
+
+        # Горизонтальные серии отмеченных плиток
+        runs = []
+        run_start = None
+        for column, flag in enumerate(flags):
+            x = column * tile_size
+            if flag:
+                if run_start is None:
+                    run_start = x
+            elif run_start is not None:
+                runs.append((run_start, x - run_start))
+                run_start = None
+        if run_start is not None:
+            runs.append((run_start, width - run_start))
+
+        # Серия с теми же границами, что и строкой выше, продлевает прямоугольник вниз
+        next_open = {}
+        for run in runs:
+            rect = open_rects.pop(run, None)
+            if rect is None:
+                rect = pygame.Rect(run[0], y, run[1], row_height)
+                rects.append(rect)
+            else:
+                rect.height += row_height
+            next_open[run] = rect
+        open_rects = next_open
+
+    return rects
+
+
+def mask_dirty_rects(overlay_surface, tile_size=32):
+    """
+    Возвращает список pygame.Rect, покрывающих все не полностью непрозрачные
+    пиксели текстуры с маской
+    """
+    # Бит маски = пиксель сквозь который виден фон (альфа < 255)
+    see_through = pygame.mask.from_surface(overlay_surface, 254)
+    see_through.invert()
+
+    width, height = overlay_surface.get_size()
+    tile = pygame.Mask((tile_size, tile_size), fill=True)
+    tiles = [[see_through.overlap(tile, (x, y)) is not None for x in range(0, width, tile_size)]
+             for y in range(0, height, tile_size)]
+    return tile_rects(tiles, tile_size, (width, height))
+
+
+def alpha_dirty_rects(alpha, tile_size=32):
+    """
+    То же по альфа-каналу (PIL 'L' или массив NumPy), без поверхности pygame -
+    годится для фоновых потоков, где кадры маски готовятся заранее
+    """
+    array = np.asarray(alpha)
+    height, width = array.shape
+    rows = -(-height // tile_size)
+    columns = -(-width // tile_size)
+    padded = np.full((rows * tile_size, columns * tile_size), 255, dtype=np.uint8)
+    padded[:height, :width] = array
+    tiles = (padded.reshape(rows, tile_size, columns, tile_size) < 255).any(axis=(1, 3))
+    return tile_rects(tiles.tolist(), tile_size, (width, height))
+
+
+def rects_coverage(rects, size):
+    """Доля площади экрана, покрытая прямоугольниками"""
+    area = sum(rect.width * rect.height for rect in rects)
+    return area / float(size[0] * size[1])
@@ -0,0 +1,100 @@
+"""
+Простой несжатый формат кадра: небольшой заголовок и сырые пиксели.
+
+Читается без декодирования (в отличие от PNG) и открывается через mmap.
+Заголовок (64 байта, little-endian):
+    4s  магия b'ILLF'
+    H   версия формата
+    H   размер заголовка
+    I   ширина
+    I   высота
+    8s  режим PIL ('RGB', 'RGBA', 'L'), дополненный нулями
+Дальше строки пикселей подряд, без выравнивания.
+"""
+import mmap
+import os
+import struct
+
+from PIL import Image
+
+MAGIC = b'ILLF'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII8s')
+HEADER_SIZE = 64
+BANDS = {'L': 1, 'RGB': 3, 'RGBA': 4}
+
+
+def pack_header(size, mode):
+    """Заголовок кадра заданного размера и режима"""
+    header = HEADER.pack(MAGIC, VERSION, HEADER_SIZE, size[0], size[1], mode.encode('ascii'))
+    return header.ljust(HEADER_SIZE, b'\0')
+
+
+def read_header(data):
+    """Разбирает заголовок -> (размер, режим, смещение пикселей)"""
+    magic, version, header_size, width, height, mode = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Это не файл кадра ILLF")
+    if version != VERSION:
+        raise ValueError(f"Неподдерживаемая версия файла кадра: {version}")
+    return (width, height), mode.rstrip(b'\0').decode('ascii'), header_size
+
+
+def save_frame(image, path):
+    """Сохраняет изображение в файл кадра (атомарно, через временный файл)"""
+    if image.mode not in BANDS:
+        image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(pack_header(image.size, image.mode))
+        file.write(image.tobytes())
+    os.replace(temp_path, path)
+    return path
+
+
+def load_frame(path):
+    """
+    Загружает изображение из файла кадра: пиксели копируются в PIL прямо из
+    отображенного в память файла, без декодирования и промежуточного буфера
+    """
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        size, mode, offset = read_header(mapped)
+        expected = size[0] * size[1] * BANDS[mode]
+        if len(mapped) - offset < expected:
+            raise ValueError(f"Файл кадра обрезан: {path}")
+        with memoryview(mapped) as view, view[offset:offset + expected] as pixels:
+            return Image.frombytes(mode, size, pixels)
+
+
+class FrameFileWriter:
+    """
+    Файл кадра, который пишется полосами сверху вниз (строки идут подряд,
+    поэтому целое изображение в памяти не нужно). Файл появляется под своим
+    именем только после close(), когда записаны все строки
+    """
+
+    def __init__(self, path, size, mode):
+        if mode not in BANDS:
+            raise ValueError(f"Неподдерживаемый режим файла кадра: {mode}")
+        self.path = path
+        self.size = size
+        self.mode = mode
+        self.rows = 0
+        self.temp_path = f"{path}.{os.getpid()}.tmp"
+        self.file = open(self.temp_path, 'wb')
+        self.file.write(pack_header(size, mode))
+
+    def write(self, band):
+        """Дописывает полосу (изображение во всю ширину кадра)"""
+        if band.mode != self.mode or band.width != self.size[0]:
+            raise ValueError("Полоса не совпадает с кадром по режиму или ширине")
+        self.file.write(band.tobytes())
+        self.rows += band.height
+
+    def close(self):
+        self.file.close()
+        if self.rows != self.size[1]:
+            os.remove(self.temp_path)
+            raise ValueError(f"Записано строк {self.rows} из {self.size[1]}: {self.path}")
+        os.replace(self.temp_path, self.path)
+        return self.path
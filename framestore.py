@@ -0,0 +1,148 @@
+"""
+Хранилище готовых кадров демонстрации в одном файле, открываемом через mmap.
+
+В файле лежат текстуры (обычная, обратная мозаика, текстура с маской) и
+запеченные кадры уже в размере окна и в порядке байт экрана (BGRA), поэтому
+демонстрация открывает их без декодирования PNG, без tobytes и без
+масштабирования: поверхности pygame и массивы NumPy ссылаются прямо на
+отображенные в память страницы файла. Несколько процессов, открывших один
+файл, делят эти страницы через страничный кэш ОС.
+
+Формат (little-endian):
+    заголовок, 64 байта:  4s магия b'ILLS', H версия, H размер заголовка,
+                          I число кадров, I выравнивание кадров
+    таблица, 64 байта на кадр: 32s имя, I ширина, I высота, I шаг строки,
+                          4s формат ('BGRA' - с прозрачностью, 'BGRX' - непрозрачный),
+                          Q смещение пикселей
+    пиксели: каждый кадр с границы выравнивания (страницы), 4 байта на пиксель
+"""
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from lazy import lazy_import
+
+pygame = lazy_import('pygame')
+
+MAGIC = b'ILLS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+ENTRY = struct.Struct('<32sIII4sQ')
+HEADER_SIZE = 64
+ENTRY_SIZE = 64
+ALIGNMENT = mmap.ALLOCATIONGRANULARITY
+# Имена текстур в хранилище в порядке TextureDemo.textures
+TEXTURE_NAMES = ('normal', 'reverse', 'masked')
+
+
+def _align(value, alignment=ALIGNMENT):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def frame_bytes(frame):
+    """
+    Пиксели кадра (PIL Image или поверхность pygame) в порядке BGRA.
+    Возвращает (размер, формат, байты)
+    """
+    if isinstance(frame, pygame.Surface):
+        opaque = not frame.get_flags() & pygame.SRCALPHA
+        return frame.get_size(), 'BGRX' if opaque else 'BGRA', pygame.image.tobytes(frame, 'BGRA')
+    opaque = 'A' not in frame.getbands()
+    return frame.size, 'BGRX' if opaque else 'BGRA', frame.convert('RGBA').tobytes('raw', 'BGRA')
+
+
+def write_store(path, frames):
+    """
+    Записывает кадры в файл хранилища (атомарно, через временный файл).
+    frames - список пар (имя, PIL Image или поверхность pygame)
+    """
+    entries = []
+    offset = _align(HEADER_SIZE + ENTRY_SIZE * len(frames))
+    prepared = []
+    for name, frame in frames:
+        size, pixel_format, data = frame_bytes(frame)
+        entries.append(ENTRY.pack(name.encode('utf-8'), size[0], size[1], size[0] * 4,
+                                  pixel_format.encode('ascii'), offset).ljust(ENTRY_SIZE, b'\0'))
+        prepared.append((offset, data))
+        offset = _align(offset + len(data))
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, HEADER_SIZE, len(frames), ALIGNMENT).ljust(HEADER_SIZE, b'\0'))
+        file.write(b''.join(entries))
+        for frame_offset, data in prepared:
+            file.seek(frame_offset)
+            file.write(data)
+        file.truncate(offset)
+    os.replace(temp_path, path)
+    return path
+
+
+class FrameStore:
+    """Открытое через mmap хранилище кадров: доступ к кадрам по имени без копирования"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mapped)
+        self.frames = {}
+
+        magic, version, header_size, count, _ = HEADER.unpack_from(self.mapped)
+        if magic != MAGIC:
+            raise ValueError(f"Это не хранилище кадров: {path}")
+        if version != VERSION:
+            raise ValueError(f"Неподдерживаемая версия хранилища кадров: {version}")
+        for index in range(count):
+            name, width, height, pitch, pixel_format, offset = ENTRY.unpack_from(
+                self.mapped, header_size + index * ENTRY_SIZE)
+            if offset + pitch * height > len(self.mapped):
+                raise ValueError(f"Хранилище кадров обрезано: {path}")
+            self.frames[name.rstrip(b'\0').decode('utf-8')] = (
+                (width, height), pitch, pixel_format.decode('ascii'), offset)
+
+    def __contains__(self, name):
+        return name in self.frames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def names(self):
+        return list(self.frames)
+
+    def size(self, name):
+        return self.frames[name][0]
+
+    def buffer(self, name):
+        """Пиксели кадра как memoryview на отображенный файл"""
+        (width, height), pitch, _, offset = self.frames[name]
+        return self.view[offset:offset + pitch * height]
+
+    def array(self, name):
+        """Кадр как массив NumPy (высота, ширина, 4) в порядке BGRA, только для чтения"""
+        (width, height), pitch, _, offset = self.frames[name]
+        return np.frombuffer(self.mapped, np.uint8, pitch * height, offset).reshape(height, width, 4)
+
+    def surface(self, name):
+        """
+        Поверхность pygame, которая ссылается на страницы файла, а не копирует их.
+        У непрозрачных кадров смешивание выключено - blit идет простым копированием
+        """
+        size, _, pixel_format, _ = self.frames[name]
+        surface = pygame.image.frombuffer(self.buffer(name), size, 'BGRA')
+        if pixel_format == 'BGRX':
+            surface.set_alpha(None)
+        return surface
+
+    def close(self):
+        """Закрывает файл; если поверхности еще живы, отображение остается до их удаления"""
+        try:
+            self.view.release()
+            self.mapped.close()
+        except BufferError:
+            pass
@@ -1,231 +1,558 @@
-from PIL import Image
-import os
-import sys
-import pygame
-import time
-
-# Инициализация pygame
-pygame.init()
-
-def create_mosaic_texture(base_texture, output_size=(1920, 1080), reverse_direction=False):
-    """
-    Создает мозаику из текстуры с возможностью размножения в разных направлениях
-    """
-    # Получаем размеры исходной текстуры
-    tex_width, tex_height = base_texture.size
-    
-    # Создаем холст для мозаики
-    mosaic = Image.new('RGB', output_size)
-    
-    if not reverse_direction:
-        # Классическое размножение: сверху вниз, слева направо
-        for y in range(0, output_size[1], tex_height):
-            for x in range(0, output_size[0], tex_width):
-                mosaic.paste(base_texture, (x, y))
-    else:
-        # Обратное размножение: снизу вверх, справа налево
-        for y in range(output_size[1] - tex_height, -tex_height, -tex_height):
-            for x in range(output_size[0] - tex_width, -tex_width, -tex_width):
-                mosaic.paste(base_texture, (x, y))
-    
-    return mosaic
-
-def apply_mask_correct(mosaic, mask):
-    """
-    Применяет маску к мозаичной текстуре
-    """
-    # Изменяем размер маски под размер мозаики
-    mask_resized = mask.resize(mosaic.size, Image.Resampling.LANCZOS)
-    
-    # Конвертируем мозаику в RGBA
-    mosaic_rgba = mosaic.convert('RGBA')
-    
-    # Создаем временное изображение для композиции
-    if mask_resized.mode == 'RGBA':
-        # Если маска уже в RGBA, используем ее альфа-канал
-        _, _, _, mask_alpha = mask_resized.split()
-        result = Image.merge('RGBA', (*mosaic_rgba.split()[:3], mask_alpha))
-    else:
-        # Если маска в оттенках серого, используем ее как альфа-канал
-        mask_gray = mask_resized.convert('L')
-        result = Image.merge('RGBA', (*mosaic_rgba.split()[:3], mask_gray))
-    
-    return result
-
-def pil_to_pygame(pil_image):
-    """Конвертирует изображение PIL в поверхность Pygame"""
-    mode = pil_image.mode
-    size = pil_image.size
-    data = pil_image.tobytes()
-    
-    if mode == 'RGB':
-        return pygame.image.fromstring(data, size, mode)
-    elif mode == 'RGBA':
-        return pygame.image.fromstring(data, size, mode)
-    else:
-        # Конвертируем в RGB если другой режим
-        pil_image = pil_image.convert('RGB')
-        return pygame.image.fromstring(pil_image.tobytes(), size, 'RGB')
-
-class TextureDemo:
-    def __init__(self, width=1280, height=720):
-        self.screen_width = width
-        self.screen_height = height
-        self.screen = pygame.display.set_mode((width, height))
-        pygame.display.set_caption("Демонстрация текстур")
-        
-        self.clock = pygame.time.Clock()
-        self.running = True
-        self.textures = []
-        self.current_background = 0
-        self.last_switch_time = time.time()
-        self.switch_interval = 0.001  # 0.001 секунды = 1000 смен в секунду!
-        self.animation_paused = False
-        
-    def add_texture(self, texture_surface, name):
-        """Добавляет текстуру в демонстрацию"""
-        # Масштабируем текстуру под размер окна
-        scaled_texture = pygame.transform.scale(texture_surface, (self.screen_width, self.screen_height))
-        self.textures.append((scaled_texture, name))
-    
-    def toggle_animation(self):
-        """Включает/выключает анимацию"""
-        self.animation_paused = not self.animation_paused
-        return self.animation_paused
-    
-    def run_demo(self):
-        """Запускает демонстрационный цикл"""
-        print("\n🎬 Запуск демонстрации...")
-        print("   Управление: ПРОБЕЛ - пауза, ESC - выход")
-        print(f"   Скорость смены: {self.switch_interval} секунды ({int(1/self.switch_interval)} смен/сек)")
-        
-        while self.running:
-            current_time = time.time()
-            
-            # Переключаем фоновую текстуру с максимальной скоростью
-            if not self.animation_paused and current_time - self.last_switch_time > self.switch_interval:
-                self.current_background = (self.current_background + 1) % 2
-                self.last_switch_time = current_time
-            
-            # Обработка событий
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.running = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        self.running = False
-                    elif event.key == pygame.K_SPACE:
-                        # Пауза/продолжение анимации
-                        self.toggle_animation()
-            
-            # Отрисовка
-            self.screen.fill((0, 0, 0))
-            
-            # Рисуем текущую фоновую текстуру (нормальную или обратную)
-            if len(self.textures) >= 3:
-                # Фоновая текстура (0 или 1 индекс)
-                bg_texture, bg_name = self.textures[self.current_background]
-                self.screen.blit(bg_texture, (0, 0))
-                
-                # Поверхностная текстура с маской (2 индекс)
-                overlay_texture, overlay_name = self.textures[2]
-                self.screen.blit(overlay_texture, (0, 0))
-            
-            pygame.display.flip()
-            self.clock.tick(60)  # Ограничиваем общий FPS чтобы не грузить систему
-        
-        pygame.quit()
-
-def main():
-    """
-    Основная функция скрипта
-    """
-    print("=== Генератор мозаичных текстур 1920x1080 ===\n")
-    print("Создает три варианта размножения текстуры + демонстрация")
-    print("=" * 60)
-    
-    # Запрашиваем пути к файлам
-    if len(sys.argv) > 2:
-        texture_path = sys.argv[1]
-        mask_path = sys.argv[2]
-    else:
-        texture_path = input("Введите путь к файлу текстуры: ")
-        mask_path = input("Введите путь к файлу маски (PNG): ")
-    
-    # Проверяем существование файлов
-    if not os.path.exists(texture_path):
-        print(f"\n❌ Ошибка: Файл текстуры '{texture_path}' не найден!")
-        input("Нажмите Enter для выхода...")
-        return
-    
-    if not os.path.exists(mask_path):
-        print(f"\n❌ Ошибка: Файл маски '{mask_path}' не найден!")
-        input("Нажмите Enter для выхода...")
-        return
-    
-    try:
-        # Загружаем текстуру и маску
-        base_texture = Image.open(texture_path)
-        mask = Image.open(mask_path)
-        
-        print(f"\n✅ Файлы загружены:")
-        print(f"   Текстура: {os.path.basename(texture_path)}")
-        print(f"   Размер текстуры: {base_texture.size}")
-        print(f"   Маска: {os.path.basename(mask_path)}")
-        print(f"   Размер маски: {mask.size}")
-        print(f"\n🎯 Создание текстур 1920x1080...")
-        
-    except Exception as e:
-        print(f"\n❌ Ошибка загрузки файлов: {e}")
-        input("Нажмите Enter для выхода...")
-        return
-    
-    # Создаем папку для результатов
-    output_dir = 'mosaic_textures'
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    # Создаем текстуры
-    print("\n1. Создание мозаичной текстуры...", end=" ")
-    mosaic_normal = create_mosaic_texture(base_texture, (1920, 1080), reverse_direction=False)
-    mosaic_normal.save(f'{output_dir}/mosaic_normal_1920x1080.png', 'PNG')
-    print("готово!")
-    
-    print("2. Создание текстуры с маской...", end=" ")
-    mosaic_with_mask = apply_mask_correct(mosaic_normal, mask)
-    mosaic_with_mask.save(f'{output_dir}/mosaic_with_mask_1920x1080.png', 'PNG')
-    print("готово!")
-    
-    print("3. Создание обратной мозаики...", end=" ")
-    mosaic_reverse = create_mosaic_texture(base_texture, (1920, 1080), reverse_direction=True)
-    mosaic_reverse.save(f'{output_dir}/mosaic_reverse_1920x1080.png', 'PNG')
-    print("готово!")
-    
-    # Сохраняем информацию о файлах
-    print(f"\n✅ Все текстуры успешно созданы!")
-    print(f"📁 Результаты сохранены в папку: '{output_dir}'")
-    
-    # Запускаем демонстрацию
-    demo = TextureDemo(1280, 720)
-    
-    # Добавляем текстуры в демонстрацию
-    demo.add_texture(pil_to_pygame(mosaic_normal), "Обычная мозаика")
-    demo.add_texture(pil_to_pygame(mosaic_reverse), "Обратная мозаика")
-    demo.add_texture(pil_to_pygame(mosaic_with_mask), "Текстура с маской")
-    
-    # Запускаем демонстрационный цикл
-    demo.run_demo()
-    
-    print("\n🎬 Демонстрация завершена!")
-    print(f"\nСозданные файлы (1920x1080):")
-    print(f"  • mosaic_normal_1920x1080.png - обычная мозаика")
-    print(f"  • mosaic_with_mask_1920x1080.png - мозаика с вырезанной маской")
-    print(f"  • mosaic_reverse_1920x1080.png - обратная мозаика")
-    
-    print(f"\n📂 Расположение результатов:")
-    print(f"  {os.path.abspath(output_dir)}")
-    
-    input("\nНажмите Enter для завершения...")
-
-if __name__ == "__main__":
-    main()
+from PIL import Image
+import argparse
+import os
+import time
+
+from bridge import copy_stats, pil_to_pygame
+from cache import TextureCache
+from compose import compose_frame, precompose
+from dirty import alpha_dirty_rects, mask_dirty_rects, rects_coverage
+from framestore import FrameStore, TEXTURE_NAMES, write_store
+from lazy import lazy_import
+from maskseq import MaskPrefetcher
+from mosaic import mask_alpha
+from noise import NoiseRing, NoiseSpec, is_noise_spec
+from options import parse_size, parse_sizes
+from pipeline import prepare_textures
+from pyramid import FILTERS, SurfacePyramid, scale_surface
+from scheduler import FlickerScheduler, detect_refresh_rate
+from stats import FrameStats, StatsHud
+from tracing import finish as finish_trace, tracer
+from watch import TextureReloader, scale_box
+
+# pygame грузится при первом обращении: модуль можно импортировать без pygame
+# и без дисплея
+pygame = lazy_import('pygame')
+
+class TextureDemo:
+    def __init__(self, width=1280, height=720, vsync=False, refresh_rate=None, switch_every=None,
+                 stats_path=None, resizable=False, fullscreen=False, scale_filter='nearest'):
+        # Демонстрации нужен только дисплей (шрифт HUD инициализирует себя сам)
+        pygame.display.init()
+        flags = 0
+        if fullscreen:
+            # Полный экран - в родном разрешении дисплея
+            flags |= pygame.FULLSCREEN
+            width, height = pygame.display.get_desktop_sizes()[0]
+        elif resizable:
+            flags |= pygame.RESIZABLE
+        self.screen_width = width
+        self.screen_height = height
+        self.vsync = vsync
+        if vsync:
+            try:
+                # Вертикальная синхронизация в pygame доступна только вместе с SCALED
+                self.screen = pygame.display.set_mode((width, height), pygame.SCALED | flags, vsync=1)
+            except pygame.error as e:
+                print(f"⚠️  Вертикальная синхронизация недоступна: {e}")
+                self.vsync = False
+        if not self.vsync:
+            self.screen = pygame.display.set_mode((width, height), flags)
+        pygame.display.set_caption("Демонстрация текстур")
+        self.refresh_rate = refresh_rate or detect_refresh_rate()
+        
+        self.clock = pygame.time.Clock()
+        self.running = True
+        self.max_frames = None  # если задано - демонстрация завершается после стольких кадров
+        self.textures = []
+        self.current_background = 0
+        self.switch_interval = 0.001  # 0.001 секунды = 1000 смен в секунду!
+        self.switch_every = switch_every  # если задано - смена фазы каждые N кадров дисплея
+        self.scheduler = None
+        self.animation_paused = False
+        self.dirty_rects = []
+        self.frames = []
+        self.mask_sequence = None  # MaskPrefetcher движущейся маски
+        self.mask_interval = None  # длительность одного кадра маски, с
+        self.mask_base = None
+        self.mask_reverse = None
+        self.mask_phase0 = None
+        self.reloader = None  # TextureReloader горячей перезагрузки
+        self.noise_ring = None  # NoiseRing динамического шума
+        self.noise_frame = None
+        # Копии текстур под размеры окна; кадры и области перерисовки для
+        # нового размера готовятся там же, в фоновом потоке
+        self.pyramid = SurfacePyramid(scale_filter, derive=self.derive_level)
+        self.resize_to = None  # размер окна, под который готовятся текстуры
+        self.stats = FrameStats()
+        self.stats_path = stats_path  # куда выгрузить статистику кадров после выхода (.json/.csv)
+        self.hud = None
+        
+    def add_texture(self, texture_surface, name):
+        """Добавляет текстуру в демонстрацию"""
+        # Исходник остается в пирамиде, под размер окна берется его копия
+        # (если текстура уже нужного размера - берется как есть)
+        self.pyramid.set_source(name, texture_surface)
+        self.textures.append((self.pyramid.surface(name, (self.screen_width, self.screen_height)), name))
+    
+    def load_store(self, store, names=("Обычная мозаика", "Обратная мозаика", "Текстура с маской")):
+        """Берет текстуры и запеченные кадры из хранилища кадров без копирования"""
+        for key, name in zip(TEXTURE_NAMES, names):
+            self.add_texture(store.surface(key), name)
+        stored = [f'frame{index}' for index in (0, 1)]
+        if all(key in store and store.size(key) == (self.screen_width, self.screen_height) for key in stored):
+            self.frames = [store.surface(key) for key in stored]
+    
+    def save_store(self, path):
+        """Сохраняет текстуры и запеченные кадры в хранилище для быстрого старта"""
+        frames = [(key, texture) for key, (texture, _) in zip(TEXTURE_NAMES, self.textures)]
+        frames += [(f'frame{index}', frame) for index, frame in enumerate(self.precompose_frames())]
+        return write_store(path, frames)
+    
+    def prepare_dirty_rects(self):
+        """Один раз находит области экрана, которые меняются между фазами"""
+        if len(self.textures) >= 3:
+            overlay_texture, overlay_name = self.textures[2]
+            self.dirty_rects = mask_dirty_rects(overlay_texture)
+            coverage = rects_coverage(self.dirty_rects, (self.screen_width, self.screen_height))
+            print(f"   Перерисовывается областей: {len(self.dirty_rects)} ({coverage:.0%} экрана)")
+        return self.dirty_rects
+    
+    def precompose_frames(self):
+        """Запекает обе фазы мерцания в готовые непрозрачные кадры (если их еще нет)"""
+        if len(self.textures) >= 3 and not self.frames:
+            overlay_texture, overlay_name = self.textures[2]
+            self.frames = [precompose(self.textures[index][0], overlay_texture) for index in (0, 1)]
+        return self.frames
+    
+    def derive_level(self, size, surfaces):
+        """Кадры и области перерисовки для нового размера окна (в фоновом потоке)"""
+        if len(surfaces) < 3:
+            return [], []
+        return [precompose(surfaces[index], surfaces[2]) for index in (0, 1)], mask_dirty_rects(surfaces[2])
+    
+    def request_resize(self):
+        """Окно изменило размер: текстуры под него заказываются в фоне"""
+        self.screen = pygame.display.get_surface()
+        size = self.screen.get_size()
+        if size != (self.screen_width, self.screen_height):
+            self.resize_to = size
+            self.pyramid.request(size)
+        else:
+            self.resize_to = None
+    
+    def apply_resize(self):
+        """Подменяет текстуры и кадры, если под новый размер окна они уже готовы"""
+        level = self.pyramid.level(self.resize_to)
+        if level is None:
+            return False
+        self.screen_width, self.screen_height = level.size
+        self.textures = [(surface, name) for name, surface in level.surfaces.items()]
+        self.frames, self.dirty_rects = level.derived
+        self.resize_to = None
+        return True
+    
+    def start_mask_sequence(self, path, mosaic_normal, mosaic_reverse, fps=30, depth=8, workers=None):
+        """
+        Включает движущуюся маску из папки PNG или видео. Кадры маски
+        готовятся в фоновых потоках (render_mask_frame), пока идет показ
+        """
+        size = (self.screen_width, self.screen_height)
+        # Масштаб как в add_texture (pygame.transform.scale - ближайший сосед)
+        self.mask_base = mosaic_normal.resize(size, Image.Resampling.NEAREST)
+        self.mask_reverse = mosaic_reverse.resize(size, Image.Resampling.NEAREST)
+        # Текстура с маской - это та же обычная мозаика, поэтому кадр фазы 0
+        # от маски не зависит: он один на всю последовательность
+        self.mask_phase0 = pil_to_pygame(self.mask_base)
+        self.mask_interval = 1 / fps
+        self.mask_sequence = MaskPrefetcher(path, size, self.render_mask_frame, depth, workers).start()
+        self.stats.extra_lines.append(self.mask_sequence.line)
+        return self.mask_sequence
+    
+    def render_mask_frame(self, mask):
+        """Готовит кадры обеих фаз мерцания для кадра маски (в фоновом потоке)"""
+        alpha = mask_alpha(mask, self.mask_base.size)
+        phase1 = pil_to_pygame(compose_frame(self.mask_reverse, self.mask_base, alpha))
+        return [self.mask_phase0, phase1], alpha_dirty_rects(alpha)
+    
+    def start_dynamic_noise(self, spec, depth=4):
+        """
+        Включает динамический шум: каждый кадр показа - новый шум с
+        неподвижным объектом под маской. Кадры готовит фоновый поток
+        """
+        self.noise_ring = NoiseRing(spec, self.textures[2][0], depth).start()
+        self.stats.extra_lines.append(self.noise_ring.line)
+        return self.noise_ring
+    
+    def watch_files(self, texture_path, mask_path, textures, interval=0.5):
+        """
+        Включает горячую перезагрузку: при изменении файлов текстуры или маски
+        текстуры пересчитываются в фоне и подменяются между кадрами
+        """
+        self.reloader = TextureReloader(texture_path, mask_path, textures[0].size, textures,
+                                        self.prepare_reload, interval)
+        return self.reloader
+    
+    def prepare_reload(self, update):
+        """Переводит обновленные текстуры в поверхности окна (в фоновом потоке)"""
+        size = (self.screen_width, self.screen_height)
+        if update.boxes is None:
+            images = (update.normal, update.reverse, update.masked)
+            rects = None
+        else:
+            # Мозаики не менялись - переводим только текстуру с маской
+            images = (update.masked,)
+            rects = [pygame.Rect(left, top, right - left, bottom - top) for left, top, right, bottom in
+                     (scale_box(box, update.masked.size, size) for box in update.boxes)]
+        sources = [pil_to_pygame(image) for image in images]
+        surfaces = [scale_surface(source, size, self.pyramid.scale_filter) for source in sources]
+        if rects is not None:
+            surfaces = [self.textures[0][0], self.textures[1][0]] + surfaces
+        return size, sources, surfaces, rects, mask_dirty_rects(surfaces[2])
+    
+    def apply_reload(self, result):
+        """Подменяет текстуры и кадры результатом перезагрузки (в цикле отрисовки)"""
+        size, sources, surfaces, rects, dirty_rects = result
+        names = [name for _, name in self.textures]
+        for name, source, surface in zip(names[-len(sources):], sources, surfaces[-len(sources):]):
+            self.pyramid.set_source(name, source, {size: surface})
+        if size != (self.screen_width, self.screen_height):
+            # Окно успело сменить размер - текстуры под него готовятся заново
+            self.resize_to = (self.screen_width, self.screen_height)
+            return
+        self.textures = [(surface, name) for surface, name in zip(surfaces, names)]
+        self.dirty_rects = dirty_rects
+        if rects is None:
+            self.frames = []
+            self.precompose_frames()
+            return
+        # Изменилась часть маски - допекаем кадры только в этих областях
+        overlay_texture = self.textures[2][0]
+        for frame, (background, _) in zip(self.frames, self.textures):
+            for rect in rects:
+                frame.blit(background, rect, rect)
+                frame.blit(overlay_texture, rect, rect)
+    
+    def toggle_animation(self):
+        """Включает/выключает анимацию"""
+        self.animation_paused = not self.animation_paused
+        if self.scheduler is not None:
+            self.scheduler.reset_measurement()
+        return self.animation_paused
+    
+    def toggle_hud(self):
+        """Включает/выключает панель статистики кадров"""
+        self.hud = StatsHud(self.stats) if self.hud is None else None
+        return self.hud is not None
+    
+    def report_stats(self):
+        """Печатает статистику кадров и выгружает ее в файл, если он задан"""
+        print("\n⏱️  Время кадра (последние кадры):")
+        for line in self.stats.lines():
+            print(f"   {line}")
+        if self.stats_path:
+            self.stats.export(self.stats_path)
+            print(f"   Статистика сохранена: {os.path.abspath(self.stats_path)}")
+    
+    def run_demo(self):
+        """Запускает демонстрационный цикл"""
+        print("\n🎬 Запуск демонстрации...")
+        print("   Управление: ПРОБЕЛ - пауза, F1 - статистика кадров, ESC - выход")
+        
+        self.scheduler = FlickerScheduler(self.refresh_rate, self.switch_interval, self.switch_every)
+        print(f"   Смена фазы каждые {self.scheduler.switch_every} кадр(а) при {self.refresh_rate:g} Гц "
+              f"= {self.scheduler.nominal_rate:g} смен/сек")
+        warning = self.scheduler.warning()
+        if warning:
+            print(f"   ⚠️  {warning}")
+        
+        self.prepare_dirty_rects()
+        self.precompose_frames()
+        if self.mask_sequence is not None:
+            # Первый кадр маски ждем, дальше только забираем готовые
+            self.frames, self.dirty_rects = self.mask_sequence.get(block=True)
+            next_mask_time = time.perf_counter() + self.mask_interval
+        if self.noise_ring is not None:
+            self.noise_frame = self.noise_ring.get(block=True)
+        full_redraw = True
+        
+        while self.running:
+            self.stats.begin_frame()
+            phase_changed = False
+            
+            # Фаза считается в показанных кадрах, а не по часам
+            if not self.animation_paused and self.scheduler.advance():
+                self.current_background = self.scheduler.phase
+                phase_changed = True
+            
+            # Движущаяся маска: следующий кадр берется, только если уже готов
+            if self.mask_sequence is not None and not self.animation_paused:
+                now = time.perf_counter()
+                if now >= next_mask_time:
+                    ready = self.mask_sequence.get()
+                    if ready is not None:
+                        self.frames, self.dirty_rects = ready
+                        full_redraw = True
+                        next_mask_time = max(next_mask_time + self.mask_interval, now)
+            
+            # Динамический шум: каждый кадр - следующий готовый кадр из кольца
+            if self.noise_ring is not None and not self.animation_paused:
+                fresh = self.noise_ring.get()
+                if fresh is not None:
+                    self.noise_frame = fresh
+                    full_redraw = True
+            
+            # Горячая перезагрузка: готовые текстуры подменяются целиком между кадрами
+            if self.reloader is not None:
+                reloaded = self.reloader.poll()
+                if reloaded is not None:
+                    self.apply_reload(reloaded)
+                    full_redraw = True
+                    print(f"🔄 Текстуры перезагружены: {self.reloader.summary()}")
+            
+            # Обработка событий
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    self.running = False
+                elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    # Окно перекрывали - содержимое надо восстановить целиком
+                    full_redraw = True
+                elif event.type == pygame.VIDEORESIZE:
+                    # Пока текстуры под новый размер готовятся, показываются прежние
+                    self.request_resize()
+                    full_redraw = True
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        self.running = False
+                    elif event.key == pygame.K_SPACE:
+                        # Пауза/продолжение анимации
+                        self.toggle_animation()
+                    elif event.key == pygame.K_F1:
+                        # Показать/скрыть статистику кадров
+                        self.toggle_hud()
+                        full_redraw = True
+            
+            # Текстуры под новый размер окна подменяются, как только готовы
+            if self.resize_to is not None and self.apply_resize():
+                full_redraw = True
+                print(f"🖥️  Окно {self.screen_width}x{self.screen_height}: {self.pyramid.summary()}")
+            self.stats.mark('events')
+            
+            # Отрисовка
+            update_rects = []
+            if self.noise_frame is not None:
+                if full_redraw:
+                    self.screen.blit(self.noise_frame, (0, 0))
+            elif self.frames:
+                # Готовый кадр текущей фазы: фон (0 или 1 индекс) + текстура с маской (2 индекс)
+                frame = self.frames[self.current_background]
+                
+                if full_redraw:
+                    if frame.get_size() != self.screen.get_size():
+                        self.screen.fill((0, 0, 0))
+                    self.screen.blit(frame, (0, 0))
+                elif phase_changed:
+                    # Меняются только прозрачные места маски - их и перерисовываем
+                    for rect in self.dirty_rects:
+                        self.screen.blit(frame, rect, rect)
+                    update_rects = self.dirty_rects
+            elif full_redraw:
+                self.screen.fill((0, 0, 0))
+            
+            if self.hud is not None:
+                update_rects = update_rects + [self.hud.draw(self.screen)]
+            self.stats.mark('blit')
+            
+            if full_redraw or (self.vsync and not update_rects):
+                # При вертикальной синхронизации кадр показывается даже без изменений
+                pygame.display.flip()
+            elif update_rects:
+                pygame.display.update(update_rects)
+            full_redraw = False
+            self.stats.mark('flip')
+            
+            if self.vsync:
+                self.clock.tick()
+            else:
+                self.clock.tick(self.refresh_rate)
+            self.stats.mark('idle')
+            self.stats.end_frame()
+            if self.max_frames and self.stats.frame_count >= self.max_frames:
+                self.running = False
+        
+        print(f"\n📊 Фактическая частота смен: {self.scheduler.achieved_rate():.1f} смен/сек "
+              f"(по расписанию {self.scheduler.nominal_rate:g}, кадров в секунду: {self.clock.get_fps():.1f})")
+        if self.mask_sequence is not None:
+            self.mask_sequence.stop()
+            print(f"🎭 Движущаяся маска: {self.mask_sequence.summary()}")
+        if self.noise_ring is not None:
+            self.noise_ring.stop()
+            print(f"📺 Динамический шум: {self.noise_ring.summary()}")
+        if self.reloader is not None:
+            self.reloader.close()
+        self.pyramid.close()
+        self.report_stats()
+        pygame.quit()
+
+def main():
+    """
+    Основная функция скрипта
+    """
+    print("=== Генератор мозаичных текстур 1920x1080 ===\n")
+    print("Создает три варианта размножения текстуры + демонстрация")
+    print("=" * 60)
+    
+    parser = argparse.ArgumentParser(description="Генератор мозаичных текстур и демонстрация мерцания")
+    parser.add_argument('texture', nargs='?',
+                        help="файл начальной текстуры или шум noise:ВИД[:ЗЕРНО][:mono] (white, value, blue)")
+    parser.add_argument('mask', nargs='?', help="файл маски (PNG)")
+    parser.add_argument('--vsync', action='store_true', help="вертикальная синхронизация")
+    parser.add_argument('--refresh-rate', type=float, help="частота обновления дисплея, Гц (если не определилась)")
+    parser.add_argument('--switch-every', type=int, help="менять фазу каждые N кадров дисплея")
+    parser.add_argument('--stats', help="сохранить статистику кадров в файл (.json или .csv)")
+    parser.add_argument('--no-cache', action='store_true', help="не использовать кэш готовых текстур")
+    parser.add_argument('--cache-dir', help="папка кэша (по умолчанию ~/.cache/illusion)")
+    parser.add_argument('--cache-size', type=int, default=2048, help="предельный размер кэша, МБ")
+    parser.add_argument('--mask-sequence', help="движущаяся маска: папка PNG-кадров или видеофайл")
+    parser.add_argument('--mask-fps', type=float, default=30, help="частота кадров движущейся маски")
+    parser.add_argument('--prefetch-depth', type=int, default=8, help="сколько кадров маски готовить заранее")
+    parser.add_argument('--prefetch-workers', type=int, help="потоков подготовки кадров маски (по умолчанию - ядра минус одно)")
+    parser.add_argument('--store', help="показать готовое хранилище кадров (.ills) без генерации")
+    parser.add_argument('--write-store', help="сохранить текстуры и кадры в хранилище (.ills) для быстрого старта")
+    parser.add_argument('--save-format', choices=('png', 'raw'), default='png',
+                        help="формат файлов результатов: png или несжатый файл кадра .illf")
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=None, metavar='0-9',
+                        help="уровень сжатия PNG (0 - без сжатия, быстрее всего)")
+    parser.add_argument('--watch', action='store_true',
+                        help="перезагружать текстуру и маску при изменении файлов во время показа")
+    parser.add_argument('--watch-interval', type=float, default=0.5, help="период проверки файлов, с")
+    parser.add_argument('--window-size', type=parse_size, default=(1280, 720), help="размер окна, например 1920x1080")
+    parser.add_argument('--resizable', action='store_true', help="окно с изменяемым размером")
+    parser.add_argument('--fullscreen', action='store_true', help="полный экран в разрешении дисплея")
+    parser.add_argument('--scale-filter', choices=FILTERS, default='nearest',
+                        help="фильтр масштабирования текстур под окно")
+    parser.add_argument('--prescale', type=parse_sizes, default=[],
+                        help="заранее подготовить текстуры для размеров окна, например 1920x1080,3840x2160")
+    parser.add_argument('--dynamic-noise', action='store_true',
+                        help="новый шум каждый кадр (текстура - noise:...), объект под маской неподвижен")
+    parser.add_argument('--noise-depth', type=int, default=4, help="сколько кадров шума готовить заранее")
+    parser.add_argument('--trace', nargs='?', const='', metavar='FILE',
+                        help="замерить этапы подготовки (время и память) и напечатать сводку; "
+                             "с FILE - сохранить трассу Chrome (JSON)")
+    args = parser.parse_args()
+    if args.trace is not None:
+        tracer.enable()
+    if args.watch and (args.mask_sequence or args.store):
+        parser.error("--watch нельзя совмещать с --mask-sequence и --store")
+    if args.resizable and args.mask_sequence:
+        parser.error("--resizable нельзя совмещать с --mask-sequence")
+    if args.dynamic_noise:
+        if not is_noise_spec(args.texture):
+            parser.error("--dynamic-noise работает только с текстурой-шумом noise:ВИД[:ЗЕРНО]")
+        if args.mask_sequence or args.watch or args.resizable or args.store:
+            parser.error("--dynamic-noise нельзя совмещать с --mask-sequence, --watch, --resizable и --store")
+    
+    # Готовое хранилище кадров: без генерации, декодирования и масштабирования
+    if args.store:
+        demo = TextureDemo(*args.window_size, vsync=args.vsync, refresh_rate=args.refresh_rate,
+                           switch_every=args.switch_every, stats_path=args.stats, resizable=args.resizable,
+                           fullscreen=args.fullscreen, scale_filter=args.scale_filter)
+        with FrameStore(args.store) as store:
+            demo.load_store(store)
+            demo.pyramid.prewarm(args.prescale)
+            print(f"🗃️  Кадры из хранилища: {os.path.abspath(args.store)}")
+            demo.run_demo()
+        finish_trace(args.trace)
+        return
+    
+    # Запрашиваем пути к файлам
+    if args.texture and args.mask:
+        texture_path = args.texture
+        mask_path = args.mask
+    else:
+        texture_path = input("Введите путь к файлу текстуры: ")
+        mask_path = input("Введите путь к файлу маски (PNG): ")
+    
+    # Проверяем существование файлов
+    if not is_noise_spec(texture_path) and not os.path.exists(texture_path):
+        print(f"\n❌ Ошибка: Файл текстуры '{texture_path}' не найден!")
+        input("Нажмите Enter для выхода...")
+        return
+    
+    if not os.path.exists(mask_path):
+        print(f"\n❌ Ошибка: Файл маски '{mask_path}' не найден!")
+        input("Нажмите Enter для выхода...")
+        return
+    
+    try:
+        # Загружаем текстуру (шум строится сразу во весь кадр) и маску
+        if is_noise_spec(texture_path):
+            texture_name, texture_size = f"шум {NoiseSpec.parse(texture_path)}", "во весь кадр"
+        else:
+            base_texture = Image.open(texture_path)
+            texture_name, texture_size = os.path.basename(texture_path), base_texture.size
+        mask = Image.open(mask_path)
+        
+        print(f"\n✅ Файлы загружены:")
+        print(f"   Текстура: {texture_name}")
+        print(f"   Размер текстуры: {texture_size}")
+        print(f"   Маска: {os.path.basename(mask_path)}")
+        print(f"   Размер маски: {mask.size}")
+        print(f"\n🎯 Создание текстур 1920x1080...")
+        
+    except Exception as e:
+        print(f"\n❌ Ошибка загрузки файлов: {e}")
+        input("Нажмите Enter для выхода...")
+        return
+    
+    # Создаем папку для результатов
+    output_dir = 'mosaic_textures'
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    # Создаем текстуры (или берем из кэша, если текстура, маска и размер не менялись)
+    cache = None if args.no_cache else TextureCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    # Файлы результатов пишутся в фоне, пока готовится демонстрация
+    mosaic_normal, mosaic_reverse, mosaic_with_mask, saver = prepare_textures(
+        texture_path, mask_path, output_dir, (1920, 1080), cache,
+        args.save_format, args.compress_level)
+    
+    print(f"\n✅ Все текстуры успешно созданы!")
+    print(f"📁 Результаты сохраняются в папку: '{output_dir}'")
+    
+    # Запускаем демонстрацию
+    demo = TextureDemo(*args.window_size, vsync=args.vsync, refresh_rate=args.refresh_rate,
+                       switch_every=args.switch_every, stats_path=args.stats, resizable=args.resizable,
+                       fullscreen=args.fullscreen, scale_filter=args.scale_filter)
+    
+    # Добавляем текстуры в демонстрацию
+    demo.add_texture(pil_to_pygame(mosaic_normal), "Обычная мозаика")
+    demo.add_texture(pil_to_pygame(mosaic_reverse), "Обратная мозаика")
+    demo.add_texture(pil_to_pygame(mosaic_with_mask), "Текстура с маской")
+    print(f"📦 PIL -> pygame: {copy_stats.summary()}")
+    if args.mask_sequence:
+        demo.start_mask_sequence(args.mask_sequence, mosaic_normal, mosaic_reverse, args.mask_fps,
+                                 args.prefetch_depth, args.prefetch_workers)
+        print(f"🎭 Движущаяся маска: {args.mask_sequence}, {args.mask_fps:g} кадр/с")
+    if args.watch:
+        demo.watch_files(texture_path, mask_path, (mosaic_normal, mosaic_reverse, mosaic_with_mask),
+                         args.watch_interval)
+        print(f"🔄 Файлы текстуры и маски отслеживаются (раз в {args.watch_interval:g} с)")
+    if args.dynamic_noise:
+        demo.start_dynamic_noise(NoiseSpec.parse(texture_path), args.noise_depth)
+        print("📺 Динамический шум: новый кадр шума каждый кадр показа")
+    demo.pyramid.prewarm(args.prescale)
+    if args.write_store:
+        demo.save_store(args.write_store)
+        print(f"🗃️  Хранилище кадров сохранено: {os.path.abspath(args.write_store)}")
+    
+    # Запускаем демонстрационный цикл
+    demo.run_demo()
+    
+    # Дожидаемся фонового сохранения
+    saver.wait()
+    print("\n🎬 Демонстрация завершена!")
+    print(f"💾 Сохранение: {saver.summary()}")
+    finish_trace(args.trace)
+    print(f"\nСозданные файлы (1920x1080):")
+    print(f"  • {saver.names['normal']} - обычная мозаика")
+    print(f"  • {saver.names['masked']} - мозаика с вырезанной маской")
+    print(f"  • {saver.names['reverse']} - обратная мозаика")
+    
+    print(f"\n📂 Расположение результатов:")
+    print(f"  {os.path.abspath(output_dir)}")
+    
+    input("\nНажмите Enter для завершения...")
+
+if __name__ == "__main__":
+    main()
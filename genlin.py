@@ -1,280 +1,689 @@
-from PIL import Image
-import os
-import sys
-import pygame
-import time
-
-# Инициализация pygame
-pygame.init()
-
-def create_mosaic_texture(base_texture, output_size=(1920, 1080), reverse_direction=False):
-    """
-    Создает мозаику из текстуры с возможностью размножения в разных направлениях
-    """
-    # Получаем размеры исходной текстуры
-    tex_width, tex_height = base_texture.size
-    
-    # Создаем холст для мозаики
-    mosaic = Image.new('RGB', output_size)
-    
-    if not reverse_direction:
-        # Классическое размножение: сверху вниз, слева направо
-        for y in range(0, output_size[1], tex_height):
-            for x in range(0, output_size[0], tex_width):
-                mosaic.paste(base_texture, (x, y))
-    else:
-        # Обратное размножение: снизу вверх, справа налево
-        for y in range(output_size[1] - tex_height, -tex_height, -tex_height):
-            for x in range(output_size[0] - tex_width, -tex_width, -tex_width):
-                mosaic.paste(base_texture, (x, y))
-    
-    return mosaic
-
-def apply_mask_correct(mosaic, mask):
-    """
-    Применяет маску к мозаичной текстуре
-    """
-    # Изменяем размер маски под размер мозаики
-    mask_resized = mask.resize(mosaic.size, Image.Resampling.LANCZOS)
-    
-    # Конвертируем мозаику в RGBA
-    mosaic_rgba = mosaic.convert('RGBA')
-    
-    # Создаем временное изображение для композиции
-    if mask_resized.mode == 'RGBA':
-        # Если маска уже в RGBA, используем ее альфа-канал
-        _, _, _, mask_alpha = mask_resized.split()
-        result = Image.merge('RGBA', (*mosaic_rgba.split()[:3], mask_alpha))
-    else:
-        # Если маска в оттенках серого, используем ее как альфа-канал
-        mask_gray = mask_resized.convert('L')
-        result = Image.merge('RGBA', (*mosaic_rgba.split()[:3], mask_gray))
-    
-    return result
-
-def pil_to_pygame(pil_image):
-    """Конвертирует изображение PIL в поверхность Pygame"""
-    mode = pil_image.mode
-    size = pil_image.size
-    data = pil_image.tobytes()
-    
-    if mode == 'RGB':
-        return pygame.image.fromstring(data, size, mode)
-    elif mode == 'RGBA':
-        return pygame.image.fromstring(data, size, mode)
-    else:
-        # Конвертируем в RGB если другой режим
-        pil_image = pil_image.convert('RGB')
-        return pygame.image.fromstring(pil_image.tobytes(), size, 'RGB')
-
-class TextureDemo:
-    def __init__(self, width=1280, height=720):
-        self.screen_width = width
-        self.screen_height = height
-        self.screen = pygame.display.set_mode((width, height))
-        pygame.display.set_caption("Демонстрация текстур")
-        
-        self.clock = pygame.time.Clock()
-        self.running = True
-        self.textures = []
-        self.scroll_speed = 2  # начальная скорость прокрутки (пикселей за кадр)
-        self.min_speed = 0.1   # минимальная скорость
-        self.max_speed = 20    # максимальная скорость
-        self.scroll_position = 0
-        self.animation_paused = False
-        self.scroll_surface = None
-        
-    def add_texture(self, texture_surface, name):
-        """Добавляет текстуру в демонстрацию"""
-        # Масштабируем текстуру под размер окна
-        scaled_texture = pygame.transform.scale(texture_surface, (self.screen_width, self.screen_height))
-        self.textures.append((scaled_texture, name))
-    
-    def create_infinite_scroll_surface(self):
-        """Создает бесконечную поверхность для прокрутки"""
-        if len(self.textures) < 2:
-            return None
-            
-        # Создаем поверхность достаточной высоты для плавной прокрутки
-        # Используем 3 копии текстур для бесконечного эффекта
-        scroll_height = self.screen_height * 3
-        self.scroll_surface = pygame.Surface((self.screen_width, scroll_height))
-        
-        # Заполняем поверхность прокрутки: текстура1, текстура2, текстура1 (для бесконечности)
-        texture1, name1 = self.textures[0]
-        texture2, name2 = self.textures[1]
-        
-        # Три слоя для бесконечной прокрутки
-        self.scroll_surface.blit(texture1, (0, 0))
-        self.scroll_surface.blit(texture2, (0, self.screen_height))
-        self.scroll_surface.blit(texture1, (0, self.screen_height * 2))
-        
-        return self.scroll_surface
-    
-    def toggle_animation(self):
-        """Включает/выключает анимацию"""
-        self.animation_paused = not self.animation_paused
-        return self.animation_paused
-    
-    def increase_speed(self):
-        """Увеличивает скорость прокрутки"""
-        self.scroll_speed = min(self.scroll_speed + 0.5, self.max_speed)
-    
-    def decrease_speed(self):
-        """Уменьшает скорость прокрутки"""
-        self.scroll_speed = max(self.scroll_speed - 0.5, self.min_speed)
-    
-    def run_demo(self):
-        """Запускает демонстрационный цикл"""
-        print("\n🎬 Запуск демонстрации...")
-        print("   Управление:")
-        print("   - ПРОБЕЛ: пауза/продолжить")
-        print("   - +: увеличить скорость")
-        print("   - -: уменьшить скорость") 
-        print("   - ESC: выход")
-        print("   Бесконечная прокрутка текстур сверху вниз")
-        
-        # Создаем бесконечную поверхность для прокрутки
-        self.create_infinite_scroll_surface()
-        
-        while self.running:
-            # Обновляем позицию прокрутки если анимация не на паузе
-            if not self.animation_paused:
-                self.scroll_position += self.scroll_speed
-                # Бесконечная прокрутка - возвращаемся к началу когда достигаем высоты двух текстур
-                if self.scroll_position >= self.screen_height * 2:
-                    self.scroll_position = 0
-            
-            # Обработка событий
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.running = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        self.running = False
-                    elif event.key == pygame.K_SPACE:
-                        # Пауза/продолжение анимации
-                        self.toggle_animation()
-                    elif event.key == pygame.K_PLUS or event.key == pygame.K_EQUALS:
-                        # Увеличение скорости (+ или =)
-                        self.increase_speed()
-                        print(f"   Скорость увеличена: {self.scroll_speed:.1f} px/кадр")
-                    elif event.key == pygame.K_MINUS:
-                        # Уменьшение скорости (-)
-                        self.decrease_speed()
-                        print(f"   Скорость уменьшена: {self.scroll_speed:.1f} px/кадр")
-            
-            # Отрисовка
-            self.screen.fill((0, 0, 0))
-            
-            # Рисуем прокручивающийся фон
-            if self.scroll_surface and len(self.textures) >= 3:
-                # Вычисляем область для отображения из scroll_surface
-                source_rect = pygame.Rect(0, self.scroll_position, self.screen_width, self.screen_height)
-                self.screen.blit(self.scroll_surface, (0, 0), area=source_rect)
-                
-                # Поверхностная текстура с маской (3-я текстура)
-                overlay_texture, overlay_name = self.textures[2]
-                self.screen.blit(overlay_texture, (0, 0))
-            
-            pygame.display.flip()
-            self.clock.tick(60)
-        
-        pygame.quit()
-
-def main():
-    """
-    Основная функция скрипта
-    """
-    print("=== Генератор мозаичных текстур 1920x1080 ===\n")
-    print("Создает три варианта размножения текстуры + демонстрация")
-    print("=" * 60)
-    
-    # Запрашиваем пути к файлам
-    if len(sys.argv) > 2:
-        texture_path = sys.argv[1]
-        mask_path = sys.argv[2]
-    else:
-        texture_path = input("Введите путь к файлу текстуры: ")
-        mask_path = input("Введите путь к файлу маски (PNG): ")
-    
-    # Проверяем существование файлов
-    if not os.path.exists(texture_path):
-        print(f"\n❌ Ошибка: Файл текстуры '{texture_path}' не найден!")
-        input("Нажмите Enter для выхода...")
-        return
-    
-    if not os.path.exists(mask_path):
-        print(f"\n❌ Ошибка: Файл маски '{mask_path}' не найден!")
-        input("Нажмите Enter для выхода...")
-        return
-    
-    try:
-        # Загружаем текстуру и маску
-        base_texture = Image.open(texture_path)
-        mask = Image.open(mask_path)
-        
-        print(f"\n✅ Файлы загружены:")
-        print(f"   Текстура: {os.path.basename(texture_path)}")
-        print(f"   Размер текстуры: {base_texture.size}")
-        print(f"   Маска: {os.path.basename(mask_path)}")
-        print(f"   Размер маски: {mask.size}")
-        print(f"\n🎯 Создание текстур 1920x1080...")
-        
-    except Exception as e:
-        print(f"\n❌ Ошибка загрузки файлов: {e}")
-        input("Нажмите Enter для выхода...")
-        return
-    
-    # Создаем папку для результатов
-    output_dir = 'mosaic_textures'
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    # Создаем текстуры
-    print("\n1. Создание мозаичной текстуры...", end=" ")
-    mosaic_normal = create_mosaic_texture(base_texture, (1920, 1080), reverse_direction=False)
-    mosaic_normal.save(f'{output_dir}/mosaic_normal_1920x1080.png', 'PNG')
-    print("готово!")
-    
-    print("2. Создание текстуры с маской...", end=" ")
-    mosaic_with_mask = apply_mask_correct(mosaic_normal, mask)
-    mosaic_with_mask.save(f'{output_dir}/mosaic_with_mask_1920x1080.png', 'PNG')
-    print("готово!")
-    
-    print("3. Создание обратной мозаики...", end=" ")
-    mosaic_reverse = create_mosaic_texture(base_texture, (1920, 1080), reverse_direction=True)
-    mosaic_reverse.save(f'{output_dir}/mosaic_reverse_1920x1080.png', 'PNG')
-    print("готово!")
-    
-    # Сохраняем информацию о файлах
-    print(f"\n✅ Все текстуры успешно созданы!")
-    print(f"📁 Результаты сохранены в папку: '{output_dir}'")
-    
-    # Запускаем демонстрацию
-    demo = TextureDemo(1280, 720)
-    
-    # Добавляем текстуры в демонстрацию в правильном порядке:
-    # 0 - обычная мозаика (первая в прокрутке)
-    # 1 - обратная мозаика (вторая в прокрутке)  
-    # 2 - текстура с маской (верхний слой)
-    demo.add_texture(pil_to_pygame(mosaic_normal), "Обычная мозаика")
-    demo.add_texture(pil_to_pygame(mosaic_reverse), "Обратная мозаика")
-    demo.add_texture(pil_to_pygame(mosaic_with_mask), "Текстура с маской")
-    
-    # Запускаем демонстрационный цикл
-    demo.run_demo()
-    
-    print("\n🎬 Демонстрация завершена!")
-    print(f"\nСозданные файлы (1920x1080):")
-    print(f"  • mosaic_normal_1920x1080.png - обычная мозаика")
-    print(f"  • mosaic_with_mask_1920x1080.png - мозаика с вырезанной маской")
-    print(f"  • mosaic_reverse_1920x1080.png - обратная мозаика")
-    
-    print(f"\n📂 Расположение результатов:")
-    print(f"  {os.path.abspath(output_dir)}")
-    
-    input("\nНажмите Enter для завершения...")
-
-if __name__ == "__main__":
-    main()
+from PIL import Image
+import argparse
+import os
+import math
+import time
+from fractions import Fraction
+
+from bridge import copy_stats, pil_to_pygame
+from cache import TextureCache
+from compose import FrameRing, ring_capacity
+from dirty import alpha_dirty_rects, mask_dirty_rects, rects_coverage
+from framestore import FrameStore, TEXTURE_NAMES, write_store
+from lazy import lazy_import
+from maskseq import MaskPrefetcher
+from mosaic import mask_alpha
+from motion import MOTIONS, MotionField, MotionSampler, load_displacement, motion_plane
+from noise import NoiseSpec, is_noise_spec
+from options import parse_size, parse_sizes
+from pipeline import prepare_textures
+from pyramid import FILTERS, SurfacePyramid, scale_surface
+from scrollloop import scroll_loop_frames, scroll_step, write_loop
+from stats import FrameStats, StatsHud
+from tracing import finish as finish_trace, tracer
+from watch import TextureReloader
+
+# pygame грузится при первом обращении: модуль можно импортировать без pygame
+# и без дисплея
+pygame = lazy_import('pygame')
+
+class TextureDemo:
+    def __init__(self, width=1280, height=720, stats_path=None, resizable=False, fullscreen=False,
+                 scale_filter='nearest'):
+        # Демонстрации нужен только дисплей (шрифт HUD инициализирует себя сам)
+        pygame.display.init()
+        flags = 0
+        if fullscreen:
+            # Полный экран - в родном разрешении дисплея
+            flags |= pygame.FULLSCREEN
+            width, height = pygame.display.get_desktop_sizes()[0]
+        elif resizable:
+            flags |= pygame.RESIZABLE
+        self.screen_width = width
+        self.screen_height = height
+        self.screen = pygame.display.set_mode((width, height), flags)
+        pygame.display.set_caption("Демонстрация текстур")
+        
+        self.clock = pygame.time.Clock()
+        self.running = True
+        self.max_frames = None  # если задано - демонстрация завершается после стольких кадров
+        self.max_fps = 60  # 0 - без ограничения
+        self.textures = []
+        self.scroll_speed = 2  # начальная скорость прокрутки (пикселей за кадр)
+        self.min_speed = 0.1   # минимальная скорость
+        self.max_speed = 20    # максимальная скорость
+        self.scroll_position = Fraction(0)
+        self.subpixel = True  # смешивать соседние пиксельные позиции при дробной скорости
+        self.animation_paused = False
+        self.blend_surface = None
+        self.dirty_rects = []
+        self.frame_ring = None
+        self.ring_bounds = None
+        self.max_ring_bytes = 256 * 1024 * 1024  # память под кольцо готовых кадров
+        self.mask_sequence = None  # MaskPrefetcher движущейся маски
+        self.mask_interval = None  # длительность одного кадра маски, с
+        self.mask_base = None
+        self.reloader = None  # TextureReloader горячей перезагрузки
+        self.motion = None  # MotionField: движение фона, отличное от вертикального
+        self.motion_sampler = None
+        self.motion_surface = None
+        self.motion_position = None  # позиция, для которой собран motion_surface
+        # Копии текстур под размеры окна; области перерисовки для нового
+        # размера готовятся там же, в фоновом потоке
+        self.pyramid = SurfacePyramid(scale_filter, derive=self.derive_level)
+        self.resize_to = None  # размер окна, под который готовятся текстуры
+        self.stats = FrameStats()
+        self.stats_path = stats_path  # куда выгрузить статистику кадров после выхода (.json/.csv)
+        self.hud = None
+        
+    def add_texture(self, texture_surface, name):
+        """Добавляет текстуру в демонстрацию"""
+        # Исходник остается в пирамиде, под размер окна берется его копия
+        # (если текстура уже нужного размера - берется как есть)
+        self.pyramid.set_source(name, texture_surface)
+        self.textures.append((self.pyramid.surface(name, (self.screen_width, self.screen_height)), name))
+    
+    def load_store(self, store, names=("Обычная мозаика", "Обратная мозаика", "Текстура с маской")):
+        """Берет текстуры из хранилища кадров без копирования"""
+        for key, name in zip(TEXTURE_NAMES, names):
+            self.add_texture(store.surface(key), name)
+    
+    def save_store(self, path):
+        """Сохраняет текстуры в хранилище для быстрого старта"""
+        frames = [(key, texture) for key, (texture, _) in zip(TEXTURE_NAMES, self.textures)]
+        return write_store(path, frames)
+    
+    def export_loop(self, path, fps=60):
+        """Записывает цикл прокрутки при текущей скорости в компактный файл (scrollloop.py)"""
+        (texture1, _), (texture2, _), (overlay, _) = self.textures[:3]
+        return write_loop(path, texture1, texture2, overlay, self.scroll_speed, fps, self.subpixel)
+    
+    def blit_scroll_area(self, target, dest, area, position):
+        """
+        Рисует в target (в точку dest) область area бесконечной ленты
+        текстура1 + текстура2 при позиции прокрутки position. Лента не
+        собирается целиком: на стыке текстур делается второй blit
+        """
+        period = self.screen_height * 2
+        row = (position + area.y) % period
+        x, y = dest
+        remaining = area.height
+        while remaining > 0:
+            index, offset = divmod(row, self.screen_height)
+            chunk = min(remaining, self.screen_height - offset)
+            texture, name = self.textures[index]
+            target.blit(texture, (x, y), pygame.Rect(area.x, offset, area.width, chunk))
+            y += chunk
+            remaining -= chunk
+            row = (row + chunk) % period
+    
+    def prepare_dirty_rects(self):
+        """Один раз находит области экрана, где сквозь маску видна прокрутка"""
+        if len(self.textures) >= 3:
+            overlay_texture, overlay_name = self.textures[2]
+            self.dirty_rects = mask_dirty_rects(overlay_texture)
+            coverage = rects_coverage(self.dirty_rects, (self.screen_width, self.screen_height))
+            print(f"   Перерисовывается областей: {len(self.dirty_rects)} ({coverage:.0%} экрана)")
+        return self.dirty_rects
+    
+    def set_motion(self, kind, displacement_path=None):
+        """
+        Включает движение фона из motion.py вместо вертикальной прокрутки.
+        Таблицы считаются в run_demo, когда известны области перерисовки
+        """
+        size = (self.screen_width, self.screen_height)
+        displacement = load_displacement(displacement_path, size) if displacement_path else None
+        self.motion = MotionField(kind, size, displacement)
+        # Движение идет целыми пикселями плоскости, смешивание соседних позиций не нужно
+        self.subpixel = False
+        return self.motion
+    
+    def prepare_motion(self):
+        """
+        Готовит gather движения для области, где сквозь маску виден фон:
+        плоскость из двух мозаик в формате экрана и таблица индексов
+        """
+        bounds = self.dirty_rects[0].unionall(self.dirty_rects[1:]) if self.dirty_rects else self.screen.get_rect()
+        texture1, _ = self.textures[0]
+        texture2, _ = self.textures[1]
+        # Кадр в том же формате пикселей, что и мозаики: пиксели копируются как есть
+        self.motion_surface = texture1.subsurface(bounds).copy()
+        # Плоскость в типе пикселей самой поверхности, чтобы gather писал в нее без приведения
+        pixel_type = pygame.surfarray.pixels2d(self.motion_surface).dtype
+        plane = motion_plane(pygame.surfarray.array2d(texture1).T.astype(pixel_type, copy=False),
+                             pygame.surfarray.array2d(texture2).T.astype(pixel_type, copy=False))
+        self.motion_sampler = MotionSampler(self.motion, plane, tuple(bounds))
+        self.motion_position = None
+        print(f"   Движение {self.motion.kind}: таблицы {self.motion_sampler.nbytes / 1024 / 1024:.0f} МБ, "
+              f"область {bounds.width}x{bounds.height}")
+    
+    def draw_motion(self, rects, position):
+        """Рисует области rects кадра движения: один gather на кадр, сверху текстура с маской"""
+        x, y, width, height = self.motion_sampler.bounds
+        if position != self.motion_position:
+            pixels = pygame.surfarray.pixels2d(self.motion_surface)
+            # pixels2d - вид (ширина, высота); gather пишет в транспонированный вид без копии
+            self.motion_sampler.gather(position, out=pixels.T)
+            del pixels
+            self.motion_position = position
+        overlay_texture, overlay_name = self.textures[2]
+        for rect in rects:
+            area = rect.clip(pygame.Rect(x, y, width, height))
+            self.screen.blit(self.motion_surface, area, area.move(-x, -y))
+            self.screen.blit(overlay_texture, rect, rect)
+    
+    def prepare_frame_ring(self):
+        """
+        Готовит кольцо собранных кадров прокрутки, если весь цикл при текущей
+        скорости помещается в отведенную память. Хранится только область
+        экрана, где сквозь маску видна прокрутка
+        """
+        self.frame_ring = None
+        if not self.dirty_rects or self.mask_sequence is not None or self.motion is not None:
+            # С движущейся маской готовые кадры устаревают с каждым ее кадром
+            return None
+        
+        bounds = self.dirty_rects[0].unionall(self.dirty_rects[1:])
+        capacity = ring_capacity(bounds.size, self.max_ring_bytes)
+        # За один цикл прокрутки позиция проходит две высоты экрана
+        period = self.screen_height * 2
+        positions = min(scroll_loop_frames(self.scroll_speed, period), period)
+        if self.subpixel and scroll_step(self.scroll_speed).denominator > 1:
+            # При смешивании нужна еще и следующая позиция
+            positions = min(positions * 2, period)
+        
+        if positions <= capacity:
+            self.frame_ring = FrameRing(bounds.size, positions)
+            self.ring_bounds = bounds
+        return self.frame_ring
+    
+    def compose_scroll_frame(self, frame, position, area=None):
+        """Собирает в frame кадр прокрутки (или его область area) для позиции position"""
+        if area is None:
+            area = pygame.Rect(0, 0, self.screen_width, self.screen_height)
+        self.blit_scroll_area(frame, (0, 0), area, position)
+        overlay_texture, overlay_name = self.textures[2]
+        frame.blit(overlay_texture, (0, 0), area=area)
+    
+    def draw_scroll_position(self, rects, position, alpha=None):
+        """Рисует на экране области rects кадра для целой позиции (с прозрачностью alpha)"""
+        position %= self.screen_height * 2
+        if self.frame_ring is not None and rects is self.dirty_rects:
+            # Весь цикл помещается в кольцо: каждая позиция смешивается один раз
+            frame = self.frame_ring.get(
+                position, lambda target: self.compose_scroll_frame(target, position, self.ring_bounds))
+            origin = self.ring_bounds.topleft
+            frame.set_alpha(alpha)
+            for rect in rects:
+                self.screen.blit(frame, rect, rect.move(-origin[0], -origin[1]))
+            frame.set_alpha(None)
+        elif alpha is None:
+            # Прокрутка видна только сквозь прозрачные места маски - их и перерисовываем
+            overlay_texture, overlay_name = self.textures[2]
+            for rect in rects:
+                self.blit_scroll_area(self.screen, rect.topleft, rect, position)
+                self.screen.blit(overlay_texture, rect, rect)
+        else:
+            # Полупрозрачный кадр собирается на вспомогательной поверхности
+            if self.blend_surface is None:
+                self.blend_surface = pygame.Surface((self.screen_width, self.screen_height)).convert()
+            for rect in rects:
+                self.compose_scroll_frame(self.blend_surface.subsurface(rect), position, rect)
+            self.blend_surface.set_alpha(alpha)
+            for rect in rects:
+                self.screen.blit(self.blend_surface, rect, rect)
+            self.blend_surface.set_alpha(None)
+    
+    def draw_scroll(self, rects, position):
+        """
+        Рисует области rects кадра прокрутки для дробной позиции: при
+        включенном subpixel поверх целой позиции с долей прозрачности
+        накладывается следующая, и медленная прокрутка идет без рывков
+        """
+        whole = math.floor(position)
+        if self.motion_sampler is not None:
+            self.draw_motion(rects, whole)
+            return
+        self.draw_scroll_position(rects, whole)
+        alpha = int((position - whole) * 255) if self.subpixel else 0
+        if alpha:
+            self.draw_scroll_position(rects, whole + 1, alpha)
+    
+    def start_mask_sequence(self, path, mosaic_normal, fps=30, depth=8, workers=None):
+        """
+        Включает движущуюся маску из папки PNG или видео. Текстуры с маской
+        готовятся в фоновых потоках (render_mask_frame), пока идет показ
+        """
+        size = (self.screen_width, self.screen_height)
+        # Масштаб как в add_texture (pygame.transform.scale - ближайший сосед)
+        self.mask_base = mosaic_normal.resize(size, Image.Resampling.NEAREST).convert('RGBA')
+        self.mask_interval = 1 / fps
+        self.mask_sequence = MaskPrefetcher(path, size, self.render_mask_frame, depth, workers).start()
+        self.stats.extra_lines.append(self.mask_sequence.line)
+        return self.mask_sequence
+    
+    def render_mask_frame(self, mask):
+        """Готовит текстуру с маской для кадра маски (в фоновом потоке)"""
+        alpha = mask_alpha(mask, self.mask_base.size)
+        overlay = self.mask_base.copy()
+        overlay.putalpha(alpha)
+        return pil_to_pygame(overlay), alpha_dirty_rects(alpha)
+    
+    def set_overlay(self, overlay_surface, dirty_rects):
+        """Подменяет текстуру с маской (верхний слой) и области перерисовки"""
+        overlay_texture, overlay_name = self.textures[2]
+        self.textures[2] = (overlay_surface, overlay_name)
+        self.dirty_rects = dirty_rects
+        self.prepare_frame_ring()
+    
+    def watch_files(self, texture_path, mask_path, textures, interval=0.5):
+        """
+        Включает горячую перезагрузку: при изменении файлов текстуры или маски
+        текстуры пересчитываются в фоне и подменяются между кадрами
+        """
+        self.reloader = TextureReloader(texture_path, mask_path, textures[0].size, textures,
+                                        self.prepare_reload, interval)
+        return self.reloader
+    
+    def prepare_reload(self, update):
+        """Переводит обновленные текстуры в поверхности окна (в фоновом потоке)"""
+        size = (self.screen_width, self.screen_height)
+        # Если менялась только маска, мозаики прокрутки остаются прежними
+        images = (update.masked,) if update.boxes is not None else (update.normal, update.reverse, update.masked)
+        sources = [pil_to_pygame(image) for image in images]
+        surfaces = [scale_surface(source, size, self.pyramid.scale_filter) for source in sources]
+        return size, sources, surfaces, mask_dirty_rects(surfaces[-1])
+    
+    def apply_reload(self, result):
+        """Подменяет текстуры результатом перезагрузки (в цикле отрисовки)"""
+        size, sources, surfaces, dirty_rects = result
+        names = [name for _, name in self.textures]
+        for name, source, surface in zip(names[-len(sources):], sources, surfaces):
+            self.pyramid.set_source(name, source, {size: surface})
+        if size != (self.screen_width, self.screen_height):
+            # Окно успело сменить размер - текстуры под него готовятся заново
+            self.resize_to = (self.screen_width, self.screen_height)
+            return
+        for index, surface in enumerate(surfaces[:-1]):
+            self.textures[index] = (surface, names[index])
+        self.set_overlay(surfaces[-1], dirty_rects)
+    
+    def derive_level(self, size, surfaces):
+        """Области перерисовки для нового размера окна (в фоновом потоке)"""
+        return mask_dirty_rects(surfaces[2]) if len(surfaces) >= 3 else []
+    
+    def request_resize(self):
+        """Окно изменило размер: текстуры под него заказываются в фоне"""
+        self.screen = pygame.display.get_surface()
+        size = self.screen.get_size()
+        if size != (self.screen_width, self.screen_height):
+            self.resize_to = size
+            self.pyramid.request(size)
+        else:
+            self.resize_to = None
+    
+    def apply_resize(self):
+        """Подменяет текстуры, если под новый размер окна они уже готовы"""
+        level = self.pyramid.level(self.resize_to)
+        if level is None:
+            return False
+        # Позиция прокрутки сохраняется в долях ленты
+        self.scroll_position = self.scroll_position * level.size[1] / self.screen_height
+        self.screen_width, self.screen_height = level.size
+        self.textures = [(surface, name) for name, surface in level.surfaces.items()]
+        self.dirty_rects = level.derived
+        self.blend_surface = None
+        self.prepare_frame_ring()
+        self.resize_to = None
+        return True
+    
+    def toggle_subpixel(self):
+        """Включает/выключает субпиксельное смешивание"""
+        self.subpixel = not self.subpixel
+        self.prepare_frame_ring()
+        return self.subpixel
+    
+    def toggle_animation(self):
+        """Включает/выключает анимацию"""
+        self.animation_paused = not self.animation_paused
+        return self.animation_paused
+    
+    def increase_speed(self):
+        """Увеличивает скорость прокрутки"""
+        self.scroll_speed = min(self.scroll_speed + 0.5, self.max_speed)
+    
+    def decrease_speed(self):
+        """Уменьшает скорость прокрутки"""
+        self.scroll_speed = max(self.scroll_speed - 0.5, self.min_speed)
+    
+    def toggle_hud(self):
+        """Включает/выключает панель статистики кадров"""
+        self.hud = StatsHud(self.stats) if self.hud is None else None
+        return self.hud is not None
+    
+    def report_stats(self):
+        """Печатает статистику кадров и выгружает ее в файл, если он задан"""
+        print("\n⏱️  Время кадра (последние кадры):")
+        for line in self.stats.lines():
+            print(f"   {line}")
+        if self.stats_path:
+            self.stats.export(self.stats_path)
+            print(f"   Статистика сохранена: {os.path.abspath(self.stats_path)}")
+    
+    def run_demo(self):
+        """Запускает демонстрационный цикл"""
+        print("\n🎬 Запуск демонстрации...")
+        print("   Управление:")
+        print("   - ПРОБЕЛ: пауза/продолжить")
+        print("   - +: увеличить скорость")
+        print("   - -: уменьшить скорость") 
+        print("   - S: субпиксельная плавность вкл/выкл")
+        print("   - F1: статистика кадров")
+        print("   - ESC: выход")
+        print("   Бесконечная прокрутка текстур сверху вниз")
+        
+        self.prepare_dirty_rects()
+        self.prepare_frame_ring()
+        if self.motion is not None:
+            self.prepare_motion()
+        if self.mask_sequence is not None:
+            # Первый кадр маски ждем, дальше только забираем готовые
+            self.set_overlay(*self.mask_sequence.get(block=True))
+            next_mask_time = time.perf_counter() + self.mask_interval
+        full_redraw = True
+        drawn_key = None
+        
+        while self.running:
+            self.stats.begin_frame()
+            
+            # Обновляем позицию прокрутки если анимация не на паузе
+            if not self.animation_paused:
+                self.scroll_position += scroll_step(self.scroll_speed)
+                # Бесконечная прокрутка - по кругу длиной в две текстуры (или в цикл
+                # движения), без скачка на стыке
+                self.scroll_position %= self.motion.cycle if self.motion is not None else self.screen_height * 2
+            
+            # Движущаяся маска: следующий кадр берется, только если уже готов
+            if self.mask_sequence is not None and not self.animation_paused:
+                now = time.perf_counter()
+                if now >= next_mask_time:
+                    ready = self.mask_sequence.get()
+                    if ready is not None:
+                        self.set_overlay(*ready)
+                        full_redraw = True
+                        next_mask_time = max(next_mask_time + self.mask_interval, now)
+            
+            # Горячая перезагрузка: готовые текстуры подменяются целиком между кадрами
+            if self.reloader is not None:
+                reloaded = self.reloader.poll()
+                if reloaded is not None:
+                    self.apply_reload(reloaded)
+                    full_redraw = True
+                    print(f"🔄 Текстуры перезагружены: {self.reloader.summary()}")
+            
+            # Обработка событий
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    self.running = False
+                elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    # Окно перекрывали - содержимое надо восстановить целиком
+                    full_redraw = True
+                elif event.type == pygame.VIDEORESIZE:
+                    # Пока текстуры под новый размер готовятся, показываются прежние
+                    self.request_resize()
+                    full_redraw = True
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        self.running = False
+                    elif event.key == pygame.K_SPACE:
+                        # Пауза/продолжение анимации
+                        self.toggle_animation()
+                    elif event.key == pygame.K_PLUS or event.key == pygame.K_EQUALS:
+                        # Увеличение скорости (+ или =)
+                        self.increase_speed()
+                        self.prepare_frame_ring()
+                        print(f"   Скорость увеличена: {self.scroll_speed:.1f} px/кадр")
+                    elif event.key == pygame.K_MINUS:
+                        # Уменьшение скорости (-)
+                        self.decrease_speed()
+                        self.prepare_frame_ring()
+                        print(f"   Скорость уменьшена: {self.scroll_speed:.1f} px/кадр")
+                    elif event.key == pygame.K_s:
+                        # Субпиксельная плавность
+                        state = "вкл" if self.toggle_subpixel() else "выкл"
+                        print(f"   Субпиксельная плавность: {state}")
+                    elif event.key == pygame.K_F1:
+                        # Показать/скрыть статистику кадров
+                        self.toggle_hud()
+                        full_redraw = True
+            
+            # Текстуры под новый размер окна подменяются, как только готовы
+            if self.resize_to is not None and self.apply_resize():
+                full_redraw = True
+                print(f"🖥️  Окно {self.screen_width}x{self.screen_height}: {self.pyramid.summary()}")
+            self.stats.mark('events')
+            
+            # Отрисовка
+            update_rects = []
+            if len(self.textures) >= 3:
+                # Кадр меняется, когда меняется целая позиция или доля смешивания
+                position = self.scroll_position
+                key = (math.floor(position), int((position - math.floor(position)) * 255) if self.subpixel else 0)
+                
+                if full_redraw:
+                    if self.screen.get_size() != (self.screen_width, self.screen_height):
+                        self.screen.fill((0, 0, 0))
+                    self.draw_scroll([pygame.Rect(0, 0, self.screen_width, self.screen_height)], position)
+                elif key != drawn_key:
+                    self.draw_scroll(self.dirty_rects, position)
+                    update_rects = self.dirty_rects
+                drawn_key = key
+            elif full_redraw:
+                self.screen.fill((0, 0, 0))
+            
+            if self.hud is not None:
+                update_rects = update_rects + [self.hud.draw(self.screen)]
+            self.stats.mark('blit')
+            
+            if full_redraw:
+                pygame.display.flip()
+            elif update_rects:
+                pygame.display.update(update_rects)
+            full_redraw = False
+            self.stats.mark('flip')
+            
+            self.clock.tick(self.max_fps)
+            self.stats.mark('idle')
+            self.stats.end_frame()
+            if self.max_frames and self.stats.frame_count >= self.max_frames:
+                self.running = False
+        
+        if self.mask_sequence is not None:
+            self.mask_sequence.stop()
+            print(f"🎭 Движущаяся маска: {self.mask_sequence.summary()}")
+        if self.reloader is not None:
+            self.reloader.close()
+        self.pyramid.close()
+        self.report_stats()
+        pygame.quit()
+
+def main():
+    """
+    Основная функция скрипта
+    """
+    print("=== Генератор мозаичных текстур 1920x1080 ===\n")
+    print("Создает три варианта размножения текстуры + демонстрация")
+    print("=" * 60)
+    
+    parser = argparse.ArgumentParser(description="Генератор мозаичных текстур и демонстрация прокрутки")
+    parser.add_argument('texture', nargs='?',
+                        help="файл начальной текстуры или шум noise:ВИД[:ЗЕРНО][:mono] (white, value, blue)")
+    parser.add_argument('mask', nargs='?', help="файл маски (PNG)")
+    parser.add_argument('--stats', help="сохранить статистику кадров в файл (.json или .csv)")
+    parser.add_argument('--no-cache', action='store_true', help="не использовать кэш готовых текстур")
+    parser.add_argument('--cache-dir', help="папка кэша (по умолчанию ~/.cache/illusion)")
+    parser.add_argument('--cache-size', type=int, default=2048, help="предельный размер кэша, МБ")
+    parser.add_argument('--mask-sequence', help="движущаяся маска: папка PNG-кадров или видеофайл")
+    parser.add_argument('--mask-fps', type=float, default=30, help="частота кадров движущейся маски")
+    parser.add_argument('--prefetch-depth', type=int, default=8, help="сколько кадров маски готовить заранее")
+    parser.add_argument('--prefetch-workers', type=int, help="потоков подготовки кадров маски (по умолчанию - ядра минус одно)")
+    parser.add_argument('--store', help="показать готовое хранилище кадров (.ills) без генерации")
+    parser.add_argument('--write-store', help="сохранить текстуры и кадры в хранилище (.ills) для быстрого старта")
+    parser.add_argument('--motion', choices=MOTIONS, default='vertical',
+                        help="движение фона: vertical (прокрутка), horizontal, diagonal, radial, rotate, displace")
+    parser.add_argument('--displacement', help="карта смещений для --motion displace (R - x, G - y, 128 - ноль)")
+    parser.add_argument('--export-loop', metavar='FILE',
+                        help="сохранить цикл прокрутки (лента и смещения, .illscroll) для scrollloop.py play")
+    parser.add_argument('--scroll-speed', type=float, default=2, help="скорость прокрутки, пикселей за кадр")
+    parser.add_argument('--save-format', choices=('png', 'raw'), default='png',
+                        help="формат файлов результатов: png или несжатый файл кадра .illf")
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=None, metavar='0-9',
+                        help="уровень сжатия PNG (0 - без сжатия, быстрее всего)")
+    parser.add_argument('--watch', action='store_true',
+                        help="перезагружать текстуру и маску при изменении файлов во время показа")
+    parser.add_argument('--watch-interval', type=float, default=0.5, help="период проверки файлов, с")
+    parser.add_argument('--window-size', type=parse_size, default=(1280, 720), help="размер окна, например 1920x1080")
+    parser.add_argument('--resizable', action='store_true', help="окно с изменяемым размером")
+    parser.add_argument('--fullscreen', action='store_true', help="полный экран в разрешении дисплея")
+    parser.add_argument('--scale-filter', choices=FILTERS, default='nearest',
+                        help="фильтр масштабирования текстур под окно")
+    parser.add_argument('--prescale', type=parse_sizes, default=[],
+                        help="заранее подготовить текстуры для размеров окна, например 1920x1080,3840x2160")
+    parser.add_argument('--trace', nargs='?', const='', metavar='FILE',
+                        help="замерить этапы подготовки (время и память) и напечатать сводку; "
+                             "с FILE - сохранить трассу Chrome (JSON)")
+    args = parser.parse_args()
+    if args.trace is not None:
+        tracer.enable()
+    if args.watch and (args.mask_sequence or args.store):
+        parser.error("--watch нельзя совмещать с --mask-sequence и --store")
+    if args.resizable and args.mask_sequence:
+        parser.error("--resizable нельзя совмещать с --mask-sequence")
+    if (args.motion == 'displace') != bool(args.displacement):
+        parser.error("--displacement задается вместе с --motion displace")
+    if args.motion != 'vertical' and (args.mask_sequence or args.watch or args.resizable or args.export_loop):
+        parser.error("--motion нельзя совмещать с --mask-sequence, --watch, --resizable и --export-loop")
+    if args.store and (args.motion != 'vertical' or args.export_loop or args.mask_sequence or args.write_store):
+        # Хранилище показывается как есть, без генерации: эти ключи к нему не применить
+        parser.error("--store нельзя совмещать с --motion, --export-loop, --mask-sequence и --write-store")
+    
+    # Готовое хранилище кадров: без генерации, декодирования и масштабирования
+    if args.store:
+        demo = TextureDemo(*args.window_size, stats_path=args.stats, resizable=args.resizable,
+                           fullscreen=args.fullscreen, scale_filter=args.scale_filter)
+        demo.scroll_speed = args.scroll_speed
+        with FrameStore(args.store) as store:
+            demo.load_store(store)
+            demo.pyramid.prewarm(args.prescale)
+            print(f"🗃️  Кадры из хранилища: {os.path.abspath(args.store)}")
+            demo.run_demo()
+        finish_trace(args.trace)
+        return
+    
+    # Запрашиваем пути к файлам
+    if args.texture and args.mask:
+        texture_path = args.texture
+        mask_path = args.mask
+    else:
+        texture_path = input("Введите путь к файлу текстуры: ")
+        mask_path = input("Введите путь к файлу маски (PNG): ")
+    
+    # Проверяем существование файлов
+    if not is_noise_spec(texture_path) and not os.path.exists(texture_path):
+        print(f"\n❌ Ошибка: Файл текстуры '{texture_path}' не найден!")
+        input("Нажмите Enter для выхода...")
+        return
+    
+    if not os.path.exists(mask_path):
+        print(f"\n❌ Ошибка: Файл маски '{mask_path}' не найден!")
+        input("Нажмите Enter для выхода...")
+        return
+    
+    try:
+        # Загружаем текстуру (шум строится сразу во весь кадр) и маску
+        if is_noise_spec(texture_path):
+            texture_name, texture_size = f"шум {NoiseSpec.parse(texture_path)}", "во весь кадр"
+        else:
+            base_texture = Image.open(texture_path)
+            texture_name, texture_size = os.path.basename(texture_path), base_texture.size
+        mask = Image.open(mask_path)
+        
+        print(f"\n✅ Файлы загружены:")
+        print(f"   Текстура: {texture_name}")
+        print(f"   Размер текстуры: {texture_size}")
+        print(f"   Маска: {os.path.basename(mask_path)}")
+        print(f"   Размер маски: {mask.size}")
+        print(f"\n🎯 Создание текстур 1920x1080...")
+        
+    except Exception as e:
+        print(f"\n❌ Ошибка загрузки файлов: {e}")
+        input("Нажмите Enter для выхода...")
+        return
+    
+    # Создаем папку для результатов
+    output_dir = 'mosaic_textures'
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    # Создаем текстуры (или берем из кэша, если текстура, маска и размер не менялись)
+    cache = None if args.no_cache else TextureCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    # Файлы результатов пишутся в фоне, пока готовится демонстрация
+    mosaic_normal, mosaic_reverse, mosaic_with_mask, saver = prepare_textures(
+        texture_path, mask_path, output_dir, (1920, 1080), cache,
+        args.save_format, args.compress_level)
+    
+    print(f"\n✅ Все текстуры успешно созданы!")
+    print(f"📁 Результаты сохраняются в папку: '{output_dir}'")
+    
+    # Запускаем демонстрацию
+    demo = TextureDemo(*args.window_size, stats_path=args.stats, resizable=args.resizable,
+                       fullscreen=args.fullscreen, scale_filter=args.scale_filter)
+    demo.scroll_speed = args.scroll_speed
+    
+    # Добавляем текстуры в демонстрацию в правильном порядке:
+    # 0 - обычная мозаика (первая в прокрутке)
+    # 1 - обратная мозаика (вторая в прокрутке)  
+    # 2 - текстура с маской (верхний слой)
+    demo.add_texture(pil_to_pygame(mosaic_normal), "Обычная мозаика")
+    demo.add_texture(pil_to_pygame(mosaic_reverse), "Обратная мозаика")
+    demo.add_texture(pil_to_pygame(mosaic_with_mask), "Текстура с маской")
+    print(f"📦 PIL -> pygame: {copy_stats.summary()}")
+    if args.mask_sequence:
+        demo.start_mask_sequence(args.mask_sequence, mosaic_normal, args.mask_fps,
+                                 args.prefetch_depth, args.prefetch_workers)
+        print(f"🎭 Движущаяся маска: {args.mask_sequence}, {args.mask_fps:g} кадр/с")
+    if args.watch:
+        demo.watch_files(texture_path, mask_path, (mosaic_normal, mosaic_reverse, mosaic_with_mask),
+                         args.watch_interval)
+        print(f"🔄 Файлы текстуры и маски отслеживаются (раз в {args.watch_interval:g} с)")
+    demo.pyramid.prewarm(args.prescale)
+    if args.write_store:
+        demo.save_store(args.write_store)
+        print(f"🗃️  Хранилище кадров сохранено: {os.path.abspath(args.write_store)}")
+    if args.motion != 'vertical':
+        demo.set_motion(args.motion, args.displacement)
+        print(f"🌀 Движение фона: {args.motion}")
+    if args.export_loop:
+        count = demo.export_loop(args.export_loop)
+        print(f"🔁 Цикл прокрутки сохранен: {os.path.abspath(args.export_loop)} ({count} кадров)")
+    
+    # Запускаем демонстрационный цикл
+    demo.run_demo()
+    
+    # Дожидаемся фонового сохранения
+    saver.wait()
+    print("\n🎬 Демонстрация завершена!")
+    print(f"💾 Сохранение: {saver.summary()}")
+    finish_trace(args.trace)
+    print(f"\nСозданные файлы (1920x1080):")
+    print(f"  • {saver.names['normal']} - обычная мозаика")
+    print(f"  • {saver.names['masked']} - мозаика с вырезанной маской")
+    print(f"  • {saver.names['reverse']} - обратная мозаика")
+    
+    print(f"\n📂 Расположение результатов:")
+    print(f"  {os.path.abspath(output_dir)}")
+    
+    input("\nНажмите Enter для завершения...")
+
+if __name__ == "__main__":
+    main()
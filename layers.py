@@ -0,0 +1,403 @@
+"""
+Сцена из нескольких слоев: несколько независимых "невидимых" объектов.
+
+TextureDemo знает ровно три текстуры: два фона и одну текстуру с маской.
+Здесь сцена - список слоев, у каждого своя текстура, маска (необязательна),
+анимация и порядок наложения. Маска, как и везде в проекте, белая вокруг и
+черная на объекте: слой с маской рисует свою текстуру только на объекте,
+вырезая его из слоев ниже, а вокруг объекта прозрачен. Слой без маски
+занимает весь кадр. Анимации:
+- static - неподвижный слой (обычная мозаика);
+- flicker - обычная и обратная мозаика по очереди, со своим интервалом и
+  фазой;
+- scroll - лента обычная + обратная мозаика, едет со своей скоростью.
+
+Соседние неподвижные слои заранее сводятся (Image.alpha_composite) в одну
+поверхность, поэтому цена кадра зависит от числа анимированных слоев, а не
+от общего. Слой с маской занимает только прямоугольник своего объекта, и
+кадр перерисовывается только там, где сменилось состояние какого-то
+анимированного слоя.
+
+Сцена задается JSON-файлом (пути - от папки файла сцены):
+    {"layers": [
+        {"name": "фон", "texture": "01.jpg", "animation": "flicker", "interval": 0.1},
+        {"name": "кот", "texture": "02.jpg", "mask": "cat.png"},
+        {"name": "пес", "texture": "noise:blue:3", "mask": "dog.png",
+         "animation": "flicker", "interval": 0.2, "phase": 1},
+        {"name": "лента", "texture": "03.jpg", "mask": "band.png", "animation": "scroll", "speed": 1.5}
+    ]}
+
+Пример:
+    python layers.py scene.json --window-size 1280x720
+"""
+import argparse
+import json
+from abc import ABC, abstractmethod
+import math
+import os
+import sys
+
+from PIL import Image, ImageChops
+
+from bridge import copy_stats, pil_to_pygame
+from cache import TextureCache
+from lazy import lazy_import
+from mosaic import create_mosaic_pair
+from noise import NoiseSpec, is_noise_spec, noise_pair
+from options import frames_per_phase, parse_size
+from pipeline import build_textures
+from scrollloop import scroll_step
+from stats import FrameStats
+
+pygame = lazy_import('pygame')
+
+ANIMATIONS = ('static', 'flicker', 'scroll')
+
+
+def alpha_bounds(images, size):
+    """Прямоугольник (x, y, ширина, высота), вне которого все изображения прозрачны"""
+    boxes = [image.getchannel('A').getbbox() if 'A' in image.getbands() else (0, 0) + image.size
+             for image in images]
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    left, top = min(box[0] for box in boxes), min(box[1] for box in boxes)
+    right, bottom = max(box[2] for box in boxes), max(box[3] for box in boxes)
+    return left, top, right - left, bottom - top
+
+
+class Layer(ABC):
+    """
+    Слой сцены: изображения PIL во весь кадр, анимация и порядок.
+    prepare() вырезает из них прямоугольник rect и переводит в поверхности
+    pygame; state(кадр) меняется, только когда меняется картинка слоя
+    """
+
+    animated = True
+
+    def __init__(self, name, order=0):
+        self.name = name
+        self.order = order
+        self.rect = None
+
+    @abstractmethod
+    def images(self):
+        """Изображения PIL слоя во весь кадр"""
+
+    @property
+    def opaque(self):
+        return all('A' not in image.getbands() for image in self.images())
+
+    def crop(self, image):
+        x, y, width, height = self.rect
+        return image.crop((x, y, x + width, y + height))
+
+    def prepare(self, rect):
+        self.rect = pygame.Rect(rect)
+
+    def state(self, frame):
+        return None
+
+    @abstractmethod
+    def draw(self, target, frame):
+        """Рисует слой в кадре frame в своем прямоугольнике"""
+
+
+class StaticLayer(Layer):
+    """Неподвижный слой"""
+
+    animated = False
+
+    def __init__(self, name, image, order=0):
+        super().__init__(name, order)
+        self.image = image
+        self.surface = None
+
+    def images(self):
+        return [self.image]
+
+    def prepare(self, rect):
+        super().prepare(rect)
+        self.surface = pil_to_pygame(self.crop(self.image))
+
+    def draw(self, target, frame):
+        target.blit(self.surface, self.rect)
+
+
+class FlickerLayer(Layer):
+    """Слой, который по очереди показывает свои кадры (обычная и обратная мозаика)"""
+
+    def __init__(self, name, frames, step=6, phase=0, order=0):
+        super().__init__(name, order)
+        self.frames = frames
+        self.step = max(1, step)  # кадров показа на одну фазу
+        self.phase = phase
+        self.surfaces = None
+
+    def images(self):
+        return self.frames
+
+    def prepare(self, rect):
+        super().prepare(rect)
+        self.surfaces = [pil_to_pygame(self.crop(image)) for image in self.frames]
+
+    def state(self, frame):
+        return (frame // self.step + self.phase) % len(self.frames)
+
+    def draw(self, target, frame):
+        target.blit(self.surfaces[self.state(frame)], self.rect)
+
+
+class ScrollLayer(Layer):
+    """
+    Лента texture1 + texture2, которая едет вниз со скоростью speed пикселей
+    за кадр, как в genlin.py. С alpha (PIL 'L', 255 на объекте) лента видна
+    только на объекте
+    """
+
+    def __init__(self, name, texture1, texture2, speed=2, alpha=None, order=0):
+        super().__init__(name, order)
+        self.texture1 = texture1
+        self.texture2 = texture2
+        self.step = scroll_step(speed)
+        self.alpha = alpha
+        self.strip = None
+        self.alpha_surface = None
+        self.window = None
+
+    def images(self):
+        if self.alpha is None:
+            return [self.texture1]
+        image = Image.new('RGBA', self.alpha.size)
+        image.putalpha(self.alpha)
+        return [image]
+
+    def prepare(self, rect):
+        super().prepare(rect)
+        x, _, width, _ = self.rect
+        height = self.texture1.height
+        # Лента с повтором первой текстуры: окно на стыке - один blit
+        strip = Image.new('RGB', (width, height * 3))
+        for index, texture in enumerate((self.texture1, self.texture2, self.texture1)):
+            strip.paste(texture.crop((x, 0, x + width, height)), (0, index * height))
+        self.strip = pil_to_pygame(strip)
+        if self.alpha is not None:
+            # Белый цвет и альфа маски: BLEND_RGBA_MULT оставляет цвет ленты и берет альфу маски
+            mask = Image.new('RGBA', self.rect.size, (255, 255, 255, 255))
+            mask.putalpha(self.crop(self.alpha))
+            self.alpha_surface = pil_to_pygame(mask)
+            self.window = pygame.Surface(self.rect.size, pygame.SRCALPHA, 32)
+
+    def state(self, frame):
+        return math.floor(frame * self.step) % (self.texture1.height * 2)
+
+    def draw(self, target, frame):
+        row = self.state(frame) + self.rect.y
+        area = pygame.Rect(0, row, self.rect.width, self.rect.height)
+        if self.alpha_surface is None:
+            target.blit(self.strip, self.rect, area)
+            return
+        self.window.blit(self.strip, (0, 0), area)
+        self.window.blit(self.alpha_surface, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+        target.blit(self.window, self.rect)
+
+
+def flatten(layers, size, opaque_base=False):
+    """Сводит неподвижные слои (снизу вверх) в один; opaque_base - на черной подложке"""
+    image = Image.new('RGBA', size, (0, 0, 0, 255 if opaque_base else 0))
+    for layer in layers:
+        image.alpha_composite(layer.image.convert('RGBA'))
+    if opaque_base:
+        image = image.convert('RGB')
+    return StaticLayer(' + '.join(layer.name for layer in layers), image, layers[0].order)
+
+
+class Compositor:
+    """
+    Собирает кадр сцены из слоев. Соседние неподвижные слои сводятся в
+    один, а у каждой группы есть прямоугольник, вне которого она прозрачна.
+    draw() перерисовывает только прямоугольники слоев, чье состояние
+    сменилось, и возвращает их для display.update
+    """
+
+    def __init__(self, size, layers):
+        self.size = size
+        self.layers = sorted(layers, key=lambda layer: layer.order)
+        self.groups = []
+        run = []
+        for layer in self.layers + [None]:
+            if layer is not None and not layer.animated:
+                run.append(layer)
+                continue
+            if run:
+                # Нижняя группа - подложка кадра: сводится на черном и непрозрачна
+                self.groups.append(flatten(run, size, opaque_base=not self.groups))
+                run = []
+            if layer is not None:
+                self.groups.append(layer)
+
+        self.base_opaque = bool(self.groups) and self.groups[0].opaque
+        screen_rect = (0, 0) + tuple(size)
+        for group in self.groups:
+            group.prepare(screen_rect if group is self.groups[0] else alpha_bounds(group.images(), size))
+        # Совсем прозрачные слои ничего не рисуют
+        self.groups = [group for group in self.groups if group.rect.width and group.rect.height]
+        self.animated = [group for group in self.groups if group.animated]
+        self.drawn_states = None
+
+    def summary(self):
+        return (f"слоев {len(self.layers)}, в кадре групп {len(self.groups)} "
+                f"(анимированных {len(self.animated)}, сведенных неподвижных "
+                f"{len(self.groups) - len(self.animated)})")
+
+    def draw(self, target, frame, full=False):
+        """Рисует кадр frame; возвращает измененные прямоугольники"""
+        states = [group.state(frame) for group in self.animated]
+        if full or self.drawn_states is None:
+            dirty = [target.get_rect()]
+        else:
+            dirty = [group.rect for group, state, drawn in zip(self.animated, states, self.drawn_states)
+                     if state != drawn]
+        self.drawn_states = states
+        for area in dirty:
+            target.set_clip(area)
+            if not self.base_opaque:
+                target.fill((0, 0, 0), area)
+            for group in self.groups:
+                if group.rect.colliderect(area):
+                    group.draw(target, frame)
+        target.set_clip(None)
+        return dirty
+
+
+def _mosaic_pair(texture, size):
+    if is_noise_spec(texture):
+        return noise_pair(NoiseSpec.parse(texture), size)
+    with Image.open(texture) as base_texture:
+        base_texture.load()
+        return create_mosaic_pair(base_texture, size)
+
+
+def build_layer(spec, size, fps=60, cache=None, order=0):
+    """
+    Слой по описанию из сцены: texture, mask (необязательна), animation,
+    interval (с, для flicker), phase, speed (px/кадр, для scroll), order
+    """
+    name = spec.get('name') or os.path.basename(spec['texture'])
+    animation = spec.get('animation', 'static')
+    if animation not in ANIMATIONS:
+        raise ValueError(f"Неизвестная анимация слоя '{name}': {animation} (доступны: {', '.join(ANIMATIONS)})")
+    order = spec.get('order', order)
+    mask_path = spec.get('mask')
+
+    alpha = None
+    if mask_path:
+        mosaic_normal, mosaic_reverse, mosaic_with_mask, _ = build_textures(
+            spec['texture'], mask_path, size, cache)
+        # Альфа текстуры с маской непрозрачна вокруг объекта; слою нужен сам
+        # объект (черная часть маски), поэтому альфа обращается
+        alpha = ImageChops.invert(mosaic_with_mask.getchannel('A'))
+    else:
+        mosaic_normal, mosaic_reverse = _mosaic_pair(spec['texture'], size)
+
+    if animation == 'scroll':
+        return ScrollLayer(name, mosaic_normal, mosaic_reverse, spec.get('speed', 2), alpha, order)
+    frames = [mosaic_normal, mosaic_reverse]
+    if alpha is not None:
+        frames = [frame.convert('RGBA') for frame in frames]
+        for frame in frames:
+            frame.putalpha(alpha)
+    if animation == 'static':
+        return StaticLayer(name, frames[0], order)
+    step = frames_per_phase(spec.get('interval', 0.1), fps)
+    return FlickerLayer(name, frames, step, spec.get('phase', 0), order)
+
+
+def load_scene(path, size, fps=60, cache=None):
+    """Слои сцены из JSON-файла; пути к текстурам и маскам - от папки сцены"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path) as file:
+        scene = json.load(file)
+
+    layers = []
+    for index, spec in enumerate(scene['layers']):
+        spec = dict(spec)
+        if not is_noise_spec(spec['texture']):
+            spec['texture'] = os.path.join(base_dir, spec['texture'])
+        if spec.get('mask'):
+            spec['mask'] = os.path.join(base_dir, spec['mask'])
+        layers.append(build_layer(spec, size, fps, cache, index))
+    return layers
+
+
+def run_scene(compositor, screen, fps=60):
+    """Показывает сцену; ПРОБЕЛ - пауза, ESC - выход"""
+    stats = FrameStats()
+    clock = pygame.time.Clock()
+    frame = 0
+    paused = False
+    full_redraw = True
+    running = True
+    while running:
+        stats.begin_frame()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    running = False
+                elif event.key == pygame.K_SPACE:
+                    paused = not paused
+        stats.mark('events')
+
+        dirty = compositor.draw(screen, frame, full_redraw)
+        stats.mark('blit')
+        if full_redraw:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+        full_redraw = False
+        stats.mark('flip')
+
+        if not paused:
+            frame += 1
+        clock.tick(fps)
+        stats.mark('idle')
+        stats.end_frame()
+
+    print("\n⏱️  Время кадра (последние кадры):")
+    for line in stats.lines():
+        print(f"   {line}")
+
+
+def main(argv=None):
+    """Точка входа: показ многослойной сцены"""
+    parser = argparse.ArgumentParser(description="Сцена из нескольких слоев с невидимыми объектами")
+    parser.add_argument('scene', help="файл сцены (.json)")
+    parser.add_argument('--window-size', type=parse_size, default=(1280, 720), help="размер окна, например 1920x1080")
+    parser.add_argument('--fps', type=int, default=60, help="частота кадров")
+    parser.add_argument('--no-cache', action='store_true', help="не использовать кэш готовых текстур")
+    parser.add_argument('--cache-dir', help="папка кэша (по умолчанию ~/.cache/illusion)")
+    args = parser.parse_args(argv)
+
+    # Окно открывается до подготовки слоев: поверхности сразу переводятся в формат экрана
+    pygame.display.init()
+    screen = pygame.display.set_mode(args.window_size)
+    pygame.display.set_caption("Многослойная сцена")
+
+    cache = None if args.no_cache else TextureCache(args.cache_dir)
+    layers = load_scene(args.scene, args.window_size, args.fps, cache)
+    compositor = Compositor(args.window_size, layers)
+    print(f"🧱 Сцена: {compositor.summary()}")
+    for group in compositor.groups:
+        kind = type(group).__name__.replace('Layer', '').lower()
+        print(f"   • {group.name}: {kind}, {group.rect.width}x{group.rect.height} в ({group.rect.x}, {group.rect.y})")
+    print(f"📦 PIL -> pygame: {copy_stats.summary()}")
+
+    run_scene(compositor, screen, args.fps)
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
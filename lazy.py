@@ -0,0 +1,27 @@
+"""
+Отложенный импорт тяжелых модулей.
+
+pygame грузится около сотни миллисекунд и тянет за собой SDL, а для
+построения текстур (пакетный режим, рендер, кэш) он не нужен вовсе.
+lazy_import возвращает модуль-заглушку, который загружается по-настоящему
+только при первом обращении к его атрибуту.
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """Модуль name, который выполнится при первом обращении к атрибуту"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"Модуль {name} не найден", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
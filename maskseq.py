@@ -0,0 +1,208 @@
+"""
+Последовательности масок: "невидимый" объект, который движется.
+
+Источник - папка с PNG (кадры по порядку имен) или видеофайл (декодирует
+ffmpeg, он должен быть установлен). MaskPrefetcher в фоновых потоках
+заранее декодирует следующие кадры маски, масштабирует их и накладывает на
+мозаику (функцией render, которую дает потребитель), складывая готовые
+результаты в ограниченную очередь. Цикл отрисовки только забирает готовое;
+если очередь пуста - это недобор (underrun), и кадр маски остается прежним.
+"""
+import os
+import queue
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+MASK_EXTENSIONS = ('.png',)
+_END = object()
+
+
+def png_mask_paths(directory):
+    """Файлы кадров маски из папки по порядку имен"""
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(MASK_EXTENSIONS)]
+
+
+def png_mask_frames(directory):
+    """Кадры маски из папки PNG (декодируются по мере чтения)"""
+    for path in png_mask_paths(directory):
+        with Image.open(path) as image:
+            image.load()
+            yield image
+
+
+def video_mask_frames(path, size):
+    """Кадры маски из видео: ffmpeg сразу отдает их в оттенках серого и нужного размера"""
+    width, height = size
+    command = [
+        'ffmpeg', '-v', 'error', '-i', path,
+        '-vf', f'scale={width}:{height}', '-f', 'rawvideo', '-pix_fmt', 'gray', '-',
+    ]
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError("Для масок из видео нужен ffmpeg - установите его и добавьте в PATH")
+
+    frame_size = width * height
+    try:
+        while True:
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            yield Image.frombytes('L', size, data)
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def mask_frames(path, size):
+    """Кадры маски из папки PNG или видеофайла"""
+    if os.path.isdir(path):
+        return png_mask_frames(path)
+    return video_mask_frames(path, size)
+
+
+class MaskPrefetcher:
+    """
+    Фоновая подготовка кадров последовательности масок.
+
+    render(mask) выполняется в пуле потоков (PIL и NumPy отпускают GIL на
+    больших операциях) и возвращает то, что нужно потребителю: готовые
+    кадры, поверхность pygame и т.п. Результаты идут в очередь глубиной depth
+    строго по порядку кадров
+    """
+
+    def __init__(self, path, size, render, depth=8, workers=None, loop=True):
+        self.path = path
+        self.size = size
+        self.render = render
+        # По умолчанию одно ядро оставляем циклу отрисовки
+        self.workers = max(1, workers or min(4, (os.cpu_count() or 2) - 1))
+        self.loop = loop
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.stopped = threading.Event()
+        self.thread = None
+        self.error = None
+        self.finished = False
+        self.produced = 0
+        self.consumed = 0
+        self.underruns = 0
+        self.render_seconds = 0.0
+        # render_seconds копят сразу несколько потоков подготовки
+        self._stats_lock = threading.Lock()
+        self._starved = False
+
+    @property
+    def depth(self):
+        """Сколько готовых кадров ждет в очереди"""
+        return self.queue.qsize()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._produce, name='mask-prefetch', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        # Освобождаем место, чтобы поток не висел на переполненной очереди
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _render(self, mask):
+        started = time.perf_counter()
+        result = self.render(mask)
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.render_seconds += elapsed
+        return result
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            if item is not _END:
+                self.produced += 1
+            return True
+        return False
+
+    def _produce(self):
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='mask-render') as pool:
+                pending = deque()
+                while not self.stopped.is_set():
+                    count = 0
+                    frames = mask_frames(self.path, self.size)
+                    try:
+                        for mask in frames:
+                            if self.stopped.is_set():
+                                return
+                            count += 1
+                            pending.append(pool.submit(self._render, mask))
+                            # Вперед считаем не больше кадров, чем потоков в пуле
+                            if len(pending) >= self.workers and not self._put(pending.popleft().result()):
+                                return
+                    finally:
+                        frames.close()
+                    if count == 0:
+                        raise RuntimeError(f"В последовательности масок нет кадров: {self.path}")
+                    if not self.loop:
+                        break
+                while pending:
+                    if not self._put(pending.popleft().result()):
+                        return
+        except Exception as e:
+            self.error = e
+        self._put(_END)
+
+    def get(self, block=False, timeout=None):
+        """
+        Следующий готовый результат. Без block при пустой очереди
+        возвращается None и засчитывается недобор (один раз, пока очередь
+        не пополнится). После конца последовательности (loop=False) тоже
+        None, а finished = True
+        """
+        if self.finished:
+            return None
+        try:
+            item = self.queue.get(block, timeout)
+        except queue.Empty:
+            if not self._starved:
+                self.underruns += 1
+                self._starved = True
+            return None
+        self._starved = False
+        if item is _END:
+            self.finished = True
+            if self.error is not None:
+                raise self.error
+            return None
+        self.consumed += 1
+        return item
+
+    def line(self):
+        """Строка для HUD"""
+        return f"маски: очередь {self.depth}/{self.queue.maxsize}, недоборов {self.underruns}"
+
+    def summary(self):
+        rendered = max(self.produced, 1)
+        return (f"кадров маски показано {self.consumed}, недоборов {self.underruns}, "
+                f"подготовка {self.render_seconds / rendered * 1000:.1f} мс/кадр в {self.workers} потоках")
@@ -0,0 +1,239 @@
+"""
+Векторизованное построение мозаик на NumPy.
+
+Обычная и обратная мозаика - это одна и та же сетка плиток, только обратная
+прижата к правому нижнему углу. Поэтому обе строятся из одного массива плиток
+за один проход: обратная - это тот же массив со сдвигом.
+
+VirtualMosaic хранит только плитку и правило укладки и собирает пиксели
+лишь запрошенной области (окна или полосы) - для огромных полотен, которые
+целиком в память не помещаются.
+
+Здесь же наложение маски (apply_mask_correct) - общий шаг для всех скриптов.
+
+Запуск `python mosaic.py` печатает сравнение скорости с прежним циклом paste.
+"""
+import time
+
+import numpy as np
+from PIL import Image
+
+from tracing import span
+
+# Радиус фильтра LANCZOS в пикселях (a = 3); при уменьшении растет с масштабом
+LANCZOS_SUPPORT = 3
+
+
+def _tile_array(base_texture):
+    """Возвращает исходную текстуру как массив (высота, ширина, 3)"""
+    return np.asarray(base_texture.convert('RGB'))
+
+
+def reverse_offset(output_size, tile_size):
+    """
+    Сдвиг обратной мозаики относительно обычной.
+
+    Плитки обратной мозаики уложены от правого нижнего угла, значит пиксель
+    (x, y) берется из плитки в точке ((x + dx) % w, (y + dy) % h)
+    """
+    return (-output_size[0]) % tile_size[0], (-output_size[1]) % tile_size[1]
+
+
+def _tile_field(tile, width, height):
+    """Заполняет массив width x height повторением плитки (одна векторная операция)"""
+    tex_height, tex_width = tile.shape[:2]
+    band = np.tile(tile, (1, -(-width // tex_width), 1))[:, :width]
+    return np.take(band, np.arange(height) % tex_height, axis=0)
+
+
+def _field_view(field, x, y, width, height):
+    """Создает RGB-изображение из окна массива без промежуточной копии окна"""
+    row_stride = field.strides[0]
+    start = y * row_stride + x * 3
+    data = memoryview(field.reshape(-1))[start:start + (height - 1) * row_stride + width * 3]
+    return Image.frombuffer('RGB', (width, height), data, 'raw', 'RGB', row_stride, 1)
+
+
+def create_mosaic_pair(base_texture, output_size=(1920, 1080)):
+    """
+    Создает обычную и обратную мозаики за один проход
+    """
+    with span('mosaic.tile'):
+        tile = _tile_array(base_texture)
+    width, height = output_size
+    offset_x, offset_y = reverse_offset(output_size, base_texture.size)
+
+    # Одно поле с запасом на сдвиг - обе мозаики являются его окнами
+    with span('mosaic.field', size=f"{width + offset_x}x{height + offset_y}"):
+        field = _tile_field(tile, width + offset_x, height + offset_y)
+
+    with span('mosaic.normal'):
+        mosaic_normal = _field_view(field, 0, 0, width, height)
+    with span('mosaic.reverse'):
+        mosaic_reverse = _field_view(field, offset_x, offset_y, width, height)
+    return mosaic_normal, mosaic_reverse
+
+
+def create_mosaic_texture(base_texture, output_size=(1920, 1080), reverse_direction=False):
+    """
+    Создает мозаику из текстуры с возможностью размножения в разных направлениях
+    """
+    with span('mosaic.reverse' if reverse_direction else 'mosaic.normal'):
+        return VirtualMosaic(base_texture, output_size, reverse_direction).materialize()
+
+
+class VirtualMosaic:
+    """
+    Мозаика без целого кадра в памяти: плитка и сдвиг укладки. Пиксель
+    (x, y) - это пиксель плитки ((x + dx) % w, (y + dy) % h), поэтому любая
+    область собирается из одной плитки, сколь угодно большой ни был размер
+    """
+
+    def __init__(self, base_texture, size=(1920, 1080), reverse_direction=False, tile=None):
+        self.tile = _tile_array(base_texture) if tile is None else tile
+        self.size = tuple(size)
+        tile_size = (self.tile.shape[1], self.tile.shape[0])
+        if not reverse_direction:
+            # Классическое размножение: сверху вниз, слева направо
+            self.offset = (0, 0)
+        else:
+            # Обратное размножение: снизу вверх, справа налево
+            self.offset = reverse_offset(self.size, tile_size)
+
+    @classmethod
+    def pair(cls, base_texture, size=(1920, 1080)):
+        """Обычная и обратная мозаики с общей плиткой"""
+        tile = _tile_array(base_texture)
+        return cls(None, size, False, tile), cls(None, size, True, tile)
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    @property
+    def nbytes(self):
+        """Сколько памяти занимает сама мозаика (только плитка)"""
+        return self.tile.nbytes
+
+    def array(self, box=None):
+        """Пиксели области box = (left, top, right, bottom) как массив (высота, ширина, 3)"""
+        left, top, right, bottom = box or (0, 0) + self.size
+        tile_height, tile_width = self.tile.shape[:2]
+        # Плитку поворачиваем так, чтобы ее начало пришлось на угол области
+        shifted = np.roll(self.tile, (-((top + self.offset[1]) % tile_height),
+                                      -((left + self.offset[0]) % tile_width)), axis=(0, 1))
+        return _tile_field(shifted, right - left, bottom - top)
+
+    def region(self, box=None):
+        """Область box как RGB-изображение (собирается только она)"""
+        field = self.array(box)
+        return _field_view(field, 0, 0, field.shape[1], field.shape[0])
+
+    def crop(self, box):
+        """Как Image.crop: область box (мозаику можно подставлять вместо изображения)"""
+        return self.region(box)
+
+    def bands(self, band_height):
+        """Полосы во всю ширину по band_height строк: пары (top, изображение)"""
+        for top in range(0, self.height, band_height):
+            yield top, self.region((0, top, self.width, min(top + band_height, self.height)))
+
+    def materialize(self):
+        """Мозаика целиком (как create_mosaic_texture)"""
+        return self.region()
+
+
+def mask_source(mask):
+    """
+    Та часть маски, от которой зависит альфа-канал и которую масштабирует
+    LANCZOS: у RGBA-маски - ее альфа-канал, L и RGB - как есть, остальные
+    режимы переводятся в L до масштабирования (P и 1 Pillow иначе молча
+    масштабирует как NEAREST, а LA - с домножением на альфу)
+    """
+    if mask.mode == 'RGBA':
+        return mask.getchannel('A')
+    if mask.mode not in ('L', 'RGB'):
+        return mask.convert('L')
+    return mask
+
+
+def mask_alpha(mask, size, box=None):
+    """
+    Альфа-канал текстуры с маской заданного размера: у RGBA-маски берется ее
+    альфа-канал, иначе сама маска в оттенках серого. box - область маски,
+    которую надо растянуть на size (по умолчанию вся маска)
+    """
+    with span('mask.resize', size=f"{size[0]}x{size[1]}"):
+        # Изменяем размер маски под размер мозаики
+        alpha = mask_source(mask).resize(size, Image.Resampling.LANCZOS, box=box)
+        return alpha if alpha.mode == 'L' else alpha.convert('L')
+
+
+def apply_mask_correct(mosaic, mask):
+    """
+    Применяет маску к мозаичной текстуре
+    """
+    alpha = mask_alpha(mask, mosaic.size)
+    with span('mask.composite'):
+        # Конвертируем мозаику в RGBA
+        mosaic_rgba = mosaic.convert('RGBA')
+
+        # Альфа-канал результата - маска нужного размера (на месте, без split/merge)
+        mosaic_rgba.putalpha(alpha)
+    return mosaic_rgba
+
+
+def _create_mosaic_texture_paste(base_texture, output_size=(1920, 1080), reverse_direction=False):
+    """Прежняя реализация на вложенных циклах paste - только для сравнения скорости"""
+    tex_width, tex_height = base_texture.size
+    mosaic = Image.new('RGB', output_size)
+
+    if not reverse_direction:
+        for y in range(0, output_size[1], tex_height):
+            for x in range(0, output_size[0], tex_width):
+                mosaic.paste(base_texture, (x, y))
+    else:
+        for y in range(output_size[1] - tex_height, -tex_height, -tex_height):
+            for x in range(output_size[0] - tex_width, -tex_width, -tex_width):
+                mosaic.paste(base_texture, (x, y))
+
+    return mosaic
+
+
+def _measure(function, repeat=3):
+    """Лучшее время из нескольких запусков, в миллисекундах"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    """Сравнивает скорость NumPy-мозаики с циклом paste"""
+    sizes = [(1920, 1080), (3840, 2160), (7680, 4320)]
+    tiles = [100, 16]
+
+    print("Размер       Плитка  paste (обе), мс  NumPy (пара), мс  Ускорение")
+    for output_size in sizes:
+        for tile_size in tiles:
+            rng = np.random.default_rng(0)
+            base_texture = Image.fromarray(rng.integers(0, 256, (tile_size, tile_size, 3), dtype=np.uint8))
+
+            paste_ms = _measure(lambda: (
+                _create_mosaic_texture_paste(base_texture, output_size, False),
+                _create_mosaic_texture_paste(base_texture, output_size, True),
+            ), repeat=1)
+            numpy_ms = _measure(lambda: create_mosaic_pair(base_texture, output_size))
+
+            size_label = f"{output_size[0]}x{output_size[1]}"
+            print(f"{size_label:<12} {tile_size:>6}  {paste_ms:>15.1f}  {numpy_ms:>16.1f}  {paste_ms / numpy_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
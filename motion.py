@@ -0,0 +1,144 @@
+"""
+Произвольное движение фона прокрутки через заранее посчитанные таблицы.
+
+genlin.py умеет только вертикальную прокрутку (сдвиг source_rect). Здесь
+фон может двигаться по горизонтали, по диагонали, от центра (radial),
+вращаться (rotate) или течь по карте смещений (displace). Вся геометрия
+(корни, арктангенсы, смещения) считается один раз: для каждого пикселя
+экрана таблица хранит целый индекс в "плоскости" текстур, а движение во
+времени - это сдвиг по плоскости на целое число строк и столбцов.
+
+Плоскость - периодичное поле 2x2 из двух мозаик ([обычная, обратная],
+[обратная, обычная]) размером 2H x 2W с запасом на максимальный сдвиг.
+Поэтому сдвиг кадра сводится к началу среза плоской плоскости, и кадр -
+это один векторный gather (np.take) по готовой таблице индексов: без
+Python по пикселям и без тригонометрии в цикле. Вертикальное движение
+совпадает с лентой genlin.py и render.py.
+
+Полярные виды берут радиус как строку плоскости, а угол - как столбец
+(2W столбцов на полный оборот).
+"""
+import math
+
+import numpy as np
+from PIL import Image
+
+MOTIONS = ('vertical', 'horizontal', 'diagonal', 'radial', 'rotate', 'displace')
+# Сдвиг по плоскости (столбцы, строки) на пиксель движения
+DIRECTIONS = {
+    'vertical': (0, 1),
+    'horizontal': (1, 0),
+    'diagonal': (1, 1),
+    # Источник ближе к центру, чем пиксель: узор расходится кольцами
+    'radial': (0, -1),
+    'rotate': (1, 0),
+    'displace': (0, 1),
+}
+# Размах карты смещений по умолчанию, пикселей (значение канала 0 или 255)
+DISPLACEMENT_AMPLITUDE = 32
+
+
+def load_displacement(path, size, amplitude=DISPLACEMENT_AMPLITUDE):
+    """
+    Карта смещений из изображения: красный канал - смещение по x, зеленый -
+    по y (128 - без смещения), растянутая на размер кадра
+    """
+    with Image.open(path) as image:
+        image = image.convert('RGB').resize(size, Image.Resampling.BILINEAR)
+    array = np.asarray(image, dtype=np.float32)
+    scale = amplitude / 128.0
+    return (array[..., 0] - 128) * scale, (array[..., 1] - 128) * scale
+
+
+class MotionField:
+    """
+    Таблица источников движения для кадра size: для каждого пикселя строка
+    и столбец плоскости (int32) при нулевом сдвиге, и направление сдвига
+    """
+
+    def __init__(self, kind, size, displacement=None):
+        if kind not in MOTIONS:
+            raise ValueError(f"Неизвестный вид движения: {kind} (доступны: {', '.join(MOTIONS)})")
+        if kind == 'displace' and displacement is None:
+            raise ValueError("Для движения displace нужна карта смещений")
+        self.kind = kind
+        self.size = size
+        width, height = size
+        self.period = (height * 2, width * 2)  # период плоскости: строки, столбцы
+        self.direction = DIRECTIONS[kind]
+
+        y, x = np.mgrid[0:height, 0:width]
+        if kind in ('radial', 'rotate'):
+            # Полярные координаты от центра кадра: радиус - строка, угол - столбец
+            dx = x - (width - 1) / 2.0
+            dy = y - (height - 1) / 2.0
+            rows = np.hypot(dx, dy)
+            cols = (np.arctan2(dy, dx) / (2 * math.pi) + 0.5) * self.period[1]
+        elif kind == 'displace':
+            shift_x, shift_y = displacement
+            rows = y + shift_y
+            cols = x + shift_x
+        else:
+            rows, cols = y, x
+        self.rows = (np.floor(rows).astype(np.int64) % self.period[0]).astype(np.int32)
+        self.cols = (np.floor(cols).astype(np.int64) % self.period[1]).astype(np.int32)
+
+    @property
+    def cycle(self):
+        """Через сколько пикселей движения картинка повторяется"""
+        ux, uy = self.direction
+        rows = self.period[0] if uy else 1
+        cols = self.period[1] if ux else 1
+        return rows * cols // math.gcd(rows, cols)
+
+    def shift(self, position):
+        """Сдвиг по плоскости (строки, столбцы) для целой позиции движения"""
+        ux, uy = self.direction
+        return position * uy % self.period[0], position * ux % self.period[1]
+
+
+def motion_plane(texture1, texture2):
+    """Периодичная плоскость 2x2 из двух мозаик (массивы NumPy одной формы)"""
+    top = np.concatenate((texture1, texture2), axis=1)
+    bottom = np.concatenate((texture2, texture1), axis=1)
+    return np.concatenate((top, bottom), axis=0)
+
+
+class MotionSampler:
+    """
+    Кадры движения одним gather. Плоскость заранее продлена на
+    максимальный сдвиг, а таблица переведена в плоские индексы, поэтому
+    сдвиг кадра - это только начало среза плоскости.
+    bounds (x, y, ширина, высота) - считать только эту часть кадра
+    (например, где сквозь маску виден фон)
+    """
+
+    def __init__(self, field, plane, bounds=None):
+        self.field = field
+        x, y, width, height = bounds or (0, 0) + tuple(field.size)
+        self.bounds = (x, y, width, height)
+        rows = field.rows[y:y + height, x:x + width]
+        cols = field.cols[y:y + height, x:x + width]
+
+        # Запас на сдвиг нужен только по тем осям, по которым идет движение
+        ux, uy = field.direction
+        plane_rows = int(rows.max()) + 1 + (field.period[0] - 1 if uy else 0)
+        plane_cols = int(cols.max()) + 1 + (field.period[1] - 1 if ux else 0)
+        plane = np.take(plane, np.arange(plane_rows), axis=0, mode='wrap')
+        plane = np.take(plane, np.arange(plane_cols), axis=1, mode='wrap')
+        self.plane_shape = (plane_rows, plane_cols)
+        # Пиксель плоскости - одна строка плоского массива (int32 или RGB)
+        self.flat = np.ascontiguousarray(plane).reshape((plane_rows * plane_cols,) + plane.shape[2:])
+        index_type = np.int32 if self.flat.shape[0] < 2 ** 31 else np.int64
+        self.index = (rows.astype(index_type) * plane_cols + cols).astype(index_type)
+
+    @property
+    def nbytes(self):
+        return self.flat.nbytes + self.index.nbytes
+
+    def gather(self, position, out=None):
+        """Кадр (область bounds) для целой позиции движения"""
+        dy, dx = self.field.shift(position)
+        offset = dy * self.plane_shape[1] + dx
+        return np.take(self.flat[offset:], self.index, axis=0, out=out)
+
@@ -0,0 +1,304 @@
+"""
+Процедурный шум вместо файла текстуры.
+
+Текстура 100x100, размноженная мозаикой, дает заметные швы плиток и ровно
+две фазы. Шум строится сразу в полном размере кадра (векторно, NumPy) и
+воспроизводим по зерну. Вместо пути к текстуре указывается спецификация
+noise:ВИД[:ЗЕРНО][:mono], например noise:blue:7:
+- white - белый шум, все пиксели независимы;
+- value - сглаженный шум по решетке (несколько октав), крупное зерно;
+- blue - синий шум: белый, у которого через БПФ подавлены низкие частоты,
+  мелкое зерно без комков.
+mono - одинаковое значение во всех каналах (черно-белый шум).
+
+Обычная и обратная "мозаики" - два независимых поля шума (зерно и зерно + 1).
+
+Динамический режим (NoiseRing): каждый кадр показа - новый шум, а объект
+под маской остается неподвижным. Кадры заранее готовит фоновый поток в
+кольцо поверхностей, цикл отрисовки генератор случайных чисел не вызывает.
+"""
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from lazy import lazy_import
+
+pygame = lazy_import('pygame')
+
+NOISE_PREFIX = 'noise:'
+NOISE_KINDS = ('white', 'value', 'blue')
+# Шаг решетки value-шума (первой октавы), пикселей
+VALUE_CELL = 8
+VALUE_OCTAVES = 3
+# Число корзин гистограммы при выравнивании значений шума
+LEVEL_BINS = 4096
+
+
+class NoiseSpec:
+    """Вид шума, зерно и режим каналов из строки noise:ВИД[:ЗЕРНО][:mono]"""
+
+    def __init__(self, kind='white', seed=0, mono=False):
+        if kind not in NOISE_KINDS:
+            raise ValueError(f"Неизвестный вид шума: {kind} (доступны: {', '.join(NOISE_KINDS)})")
+        self.kind = kind
+        self.seed = seed
+        self.mono = mono
+
+    @classmethod
+    def parse(cls, text):
+        if not is_noise_spec(text):
+            raise ValueError(f"Не спецификация шума: {text}")
+        parts = text[len(NOISE_PREFIX):].split(':')
+        mono = parts[-1] == 'mono'
+        if mono:
+            parts = parts[:-1]
+        if not 1 <= len(parts) <= 2:
+            raise ValueError(f"Ожидается noise:ВИД[:ЗЕРНО][:mono], получено: {text}")
+        return cls(parts[0], int(parts[1]) if len(parts) == 2 else 0, mono)
+
+    @property
+    def channels(self):
+        return 1 if self.mono else 3
+
+    def __str__(self):
+        return f"{NOISE_PREFIX}{self.kind}:{self.seed}" + (":mono" if self.mono else "")
+
+
+def is_noise_spec(path):
+    """Задана ли вместо файла текстуры спецификация шума"""
+    return isinstance(path, str) and path.startswith(NOISE_PREFIX)
+
+
+def _uniform_levels(field):
+    """
+    Переводит поле (каналы, высота, ширина) в равномерно распределенные
+    уровни 0..255 (высота, ширина, каналы): выравнивание гистограммы каждого
+    канала по LEVEL_BINS корзинам - без сортировки, за линейное время
+    """
+    channels, height, width = field.shape
+    levels = np.empty((height, width, channels), dtype=np.uint8)
+    for channel in range(channels):
+        values = field[channel]
+        low, high = float(values.min()), float(values.max())
+        bins = ((values - low) * ((LEVEL_BINS - 1) / max(high - low, 1e-12))).astype(np.intp)
+        # Доля значений не выше корзины -> уровень
+        cumulative = np.cumsum(np.bincount(bins.ravel(), minlength=LEVEL_BINS))
+        table = (cumulative * 256 // (cumulative[-1] + 1)).astype(np.uint8)
+        levels[..., channel] = table[bins]
+    return levels
+
+
+def white_noise(rng, size, channels=3):
+    """Белый шум: независимые равномерные значения"""
+    width, height = size
+    return rng.integers(0, 256, (height, width, channels), dtype=np.uint8)
+
+
+def _smooth_axis(length, step):
+    # Узел решетки слева от центра пикселя и гладкий (smoothstep) вес правого узла
+    position = (np.arange(length, dtype=np.float32) + 0.5) / step
+    index = position.astype(np.intp)
+    weight = position - index
+    return index, weight * weight * (3 - 2 * weight)
+
+
+def value_noise(rng, size, channels=3, cell=VALUE_CELL, octaves=VALUE_OCTAVES):
+    """Value-шум: случайная решетка с гладкой интерполяцией, октавы с убывающей амплитудой"""
+    width, height = size
+    total = np.zeros((channels, height, width), dtype=np.float32)
+    amplitude = 1.0
+    for octave in range(octaves):
+        step = max(1, cell >> octave)
+        grid = rng.random((channels, height // step + 2, width // step + 2), dtype=np.float32)
+        x_index, x_weight = _smooth_axis(width, step)
+        y_index, y_weight = _smooth_axis(height, step)
+        y_weight = y_weight[:, None]
+        # Сначала по строкам решетки, потом между строками
+        rows = grid[:, :, x_index] * (1 - x_weight) + grid[:, :, x_index + 1] * x_weight
+        total += amplitude * (rows[:, y_index] * (1 - y_weight) + rows[:, y_index + 1] * y_weight)
+        amplitude /= 2
+    return _uniform_levels(total)
+
+
+def blue_noise(rng, size, channels=3):
+    """
+    Синий шум: спектр белого шума умножается на sqrt(частоты) (мощность
+    растет с частотой, низкие подавлены), затем значения выравниваются
+    """
+    width, height = size
+    white = rng.standard_normal((channels, height, width), dtype=np.float32)
+    spectrum = np.fft.rfft2(white)
+    radius = np.hypot(np.fft.fftfreq(height)[:, None], np.fft.rfftfreq(width)[None, :])
+    spectrum *= np.sqrt(radius)
+    return _uniform_levels(np.fft.irfft2(spectrum, s=(height, width)).astype(np.float32))
+
+
+NOISE_FUNCTIONS = {'white': white_noise, 'value': value_noise, 'blue': blue_noise}
+
+
+def noise_array(spec, size, seed_offset=0):
+    """Поле шума (высота, ширина, 3) uint8 для спецификации и размера"""
+    rng = np.random.default_rng((spec.seed, seed_offset))
+    field = NOISE_FUNCTIONS[spec.kind](rng, size, spec.channels)
+    if spec.mono:
+        field = np.repeat(field, 3, axis=2)
+    return field
+
+
+def noise_image(spec, size, seed_offset=0):
+    """Поле шума как RGB-изображение"""
+    return Image.fromarray(noise_array(spec, size, seed_offset), 'RGB')
+
+
+def noise_pair(spec, size):
+    """Обычная и обратная текстуры: два независимых поля шума одного вида"""
+    return noise_image(spec, size, 0), noise_image(spec, size, 1)
+
+
+class NoiseFrames:
+    """
+    Заполняет 32-битные поверхности новым шумом. Белый шум - это просто
+    случайные биты (PCG64 отдает их быстрее всего), остальные виды дороги,
+    поэтому их поле строится один раз, а каждый кадр - его случайный
+    циклический сдвиг (спектр шума при сдвиге не меняется)
+    """
+
+    def __init__(self, spec, size):
+        self.spec = spec
+        self.size = size
+        self.rng = np.random.default_rng((spec.seed, 2))
+        self.field = None
+        if spec.kind != 'white':
+            surface = pygame.Surface(size, 0, 32)
+            pygame.surfarray.blit_array(surface, noise_array(spec, size, 2).swapaxes(0, 1))
+            self.field = np.ascontiguousarray(pygame.surfarray.array2d(surface).T, dtype=np.uint32)
+
+    def fill(self, surface):
+        """Рисует новый кадр шума в поверхность (32 бита на пиксель, размер size)"""
+        width, height = self.size
+        # Пока есть ссылки на буфер, поверхность заблокирована - blit ее не примет
+        buffer = surface.get_buffer()
+        pixels = np.frombuffer(buffer, np.uint32).reshape(height, -1)[:, :width]
+        if self.field is not None:
+            dy = int(self.rng.integers(height))
+            dx = int(self.rng.integers(width))
+            field = self.field
+            pixels[:height - dy, :width - dx] = field[dy:, dx:]
+            pixels[:height - dy, width - dx:] = field[dy:, :dx]
+            pixels[height - dy:, :width - dx] = field[:dy, dx:]
+            pixels[height - dy:, width - dx:] = field[:dy, :dx]
+        elif self.spec.mono:
+            # Один случайный байт на пиксель, размноженный во все каналы
+            gray = self.rng.bit_generator.random_raw(-(-width * height // 8)).view(np.uint8)
+            pixels[...] = gray[:width * height].reshape(height, width) * np.uint32(0x010101)
+        else:
+            bits = self.rng.bit_generator.random_raw(-(-width * height // 2)).view(np.uint32)
+            pixels[...] = bits[:width * height].reshape(height, width)
+        del pixels, buffer
+
+
+class NoiseRing:
+    """
+    Кольцо заранее готовых кадров динамического шума.
+
+    Фоновый поток берет свободный слот, заполняет его новым шумом и
+    накладывает сверху overlay (текстуру с маской - неподвижный объект).
+    get() отдает следующий готовый слот; слот, который сейчас на экране,
+    не перезаписывается, пока его не сменит следующий. Если готовых нет -
+    недобор, на экране остается прежний кадр
+    """
+
+    def __init__(self, spec, overlay, depth=4):
+        self.spec = spec
+        # Своя копия: blit блокирует исходную поверхность, а основной поток
+        # может рисовать ту же текстуру одновременно с фоновым
+        self.overlay = overlay.copy()
+        self.size = overlay.get_size()
+        self.frames = NoiseFrames(spec, self.size)
+        self.slots = [pygame.Surface(self.size, 0, 32) for _ in range(max(2, depth + 1))]
+        self.free = list(range(len(self.slots)))
+        self.ready = []
+        self.shown = None
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+        self.error = None
+        self.produced = 0
+        self.consumed = 0
+        self.underruns = 0
+        self.fill_seconds = 0.0
+        self._starved = False
+
+    @property
+    def depth(self):
+        return len(self.ready)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._produce, name='noise-ring', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def _produce(self):
+        try:
+            while True:
+                with self.condition:
+                    while not self.free and not self.stopped:
+                        self.condition.wait()
+                    if self.stopped:
+                        return
+                    slot = self.free.pop(0)
+                started = time.perf_counter()
+                surface = self.slots[slot]
+                self.frames.fill(surface)
+                surface.blit(self.overlay, (0, 0))
+                self.fill_seconds += time.perf_counter() - started
+                with self.condition:
+                    self.ready.append(slot)
+                    self.produced += 1
+                    self.condition.notify_all()
+        except Exception as e:
+            with self.condition:
+                self.error = e
+                self.condition.notify_all()
+
+    def get(self, block=False):
+        """Следующий готовый кадр (поверхность) или None, если готовых нет"""
+        if self.error is not None:
+            raise self.error
+        with self.condition:
+            while block and not self.ready and not self.stopped:
+                # Поток упал, пока ждали: кадров больше не будет
+                if self.error is not None:
+                    raise self.error
+                self.condition.wait(0.05)
+            if not self.ready:
+                if not self._starved:
+                    self.underruns += 1
+                    self._starved = True
+                return None
+            self._starved = False
+            slot = self.ready.pop(0)
+            if self.shown is not None:
+                self.free.append(self.shown)
+            self.shown = slot
+            self.consumed += 1
+            self.condition.notify_all()
+        return self.slots[slot]
+
+    def line(self):
+        """Строка для HUD"""
+        return f"шум: готово {self.depth}/{len(self.slots) - 1}, недоборов {self.underruns}"
+
+    def summary(self):
+        produced = max(self.produced, 1)
+        return (f"кадров шума показано {self.consumed}, недоборов {self.underruns}, "
+                f"подготовка {self.fill_seconds / produced * 1000:.1f} мс/кадр")
@@ -0,0 +1,23 @@
+"""
+Общие параметры демонстраций и рендера: разбор размеров из командной
+строки и длина фазы мерцания в кадрах.
+
+Модуль без побочных эффектов при импорте (не трогает pygame и SDL), поэтому
+его можно импортировать и из оконных демонстраций, и из офлайн-рендера.
+"""
+
+
+def parse_size(value):
+    """Разбирает размер вида 1920x1080"""
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def parse_sizes(value):
+    """Разбирает список размеров вида 1920x1080,3840x2160"""
+    return [parse_size(item) for item in value.split(',')]
+
+
+def frames_per_phase(switch_interval, fps):
+    """Сколько кадров длится одна фаза мерцания при заданной частоте кадров"""
+    return max(1, round(switch_interval * fps))
@@ -0,0 +1,218 @@
+"""
+Подготовка трех текстур для демонстрации и рендера: обычной мозаики,
+обратной мозаики и мозаики с маской.
+
+Общий для generator.py, generatorfast.py и genlin.py этап: построение (или
+загрузка из кэша) и сохранение результатов в папку. Сохранение идет в
+фоновых потоках, пока скрипт готовит демонстрацию; вместо PNG можно писать
+несжатые файлы кадра (framefile). Если вход и параметры не менялись, файлы
+результатов не перезаписываются. Вместо файла текстуры можно задать
+процедурный шум (noise:ВИД[:ЗЕРНО], см. noise.py).
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from cache import file_digest, make_key
+from framefile import save_frame
+from mosaic import apply_mask_correct, create_mosaic_pair
+from noise import NoiseSpec, is_noise_spec, noise_pair
+from tracing import span
+
+# Фильтр масштабирования маски в apply_mask_correct (входит в ключ кэша)
+RESAMPLING = 'lanczos'
+SAVED_KEYS_FILE = '.cache_keys.json'
+FRAME_EXTENSION = '.illf'
+# Форматы сохранения результатов: PNG или несжатый файл кадра (framefile)
+SAVE_EXTENSIONS = {'png': '.png', 'raw': FRAME_EXTENSION}
+
+
+def output_names(output_size=(1920, 1080), output_format='png'):
+    """Имена файлов результатов для заданного размера и формата"""
+    size = f"{output_size[0]}x{output_size[1]}"
+    extension = SAVE_EXTENSIONS[output_format]
+    return {
+        'normal': f'mosaic_normal_{size}{extension}',
+        'masked': f'mosaic_with_mask_{size}{extension}',
+        'reverse': f'mosaic_reverse_{size}{extension}',
+    }
+
+
+def save_texture(image, path, compress_level=None):
+    """
+    Сохраняет текстуру в PNG (с заданным уровнем сжатия 0-9) или, для .illf,
+    в несжатый файл кадра, который открывается без декодирования
+    """
+    with span('save', file=os.path.basename(path)):
+        if path.endswith(FRAME_EXTENSION):
+            return save_frame(image, path)
+        if compress_level is None:
+            image.save(path, 'PNG')
+        else:
+            image.save(path, 'PNG', compress_level=compress_level)
+        return path
+
+
+def texture_keys(texture_path, mask_path, output_size=(1920, 1080)):
+    """Ключи кэша трех текстур по содержимому входных файлов и параметрам"""
+    # Шум целиком задается своей спецификацией
+    texture_hash = make_key(str(NoiseSpec.parse(texture_path))) if is_noise_spec(texture_path) \
+        else file_digest(texture_path)
+    mask_hash = file_digest(mask_path)
+    size = f"{output_size[0]}x{output_size[1]}"
+    return {
+        'normal': make_key('mosaic', texture_hash, size, 'normal'),
+        'reverse': make_key('mosaic', texture_hash, size, 'reverse'),
+        'masked': make_key('masked', texture_hash, mask_hash, size, RESAMPLING),
+    }
+
+
+def build_textures(texture_path, mask_path, output_size=(1920, 1080), cache=None, keys=None,
+                   on_ready=None):
+    """
+    Строит (или берет из кэша) три текстуры.
+    on_ready(роль, изображение, из_кэша) вызывается для каждой текстуры, как
+    только она готова ('normal', 'reverse', 'masked') - например, чтобы сразу
+    начать сохранение.
+    Возвращает (mosaic_normal, mosaic_reverse, mosaic_with_mask, из_кэша)
+    """
+    notify = on_ready or (lambda role, image, from_cache: None)
+
+    if cache is not None:
+        keys = keys or texture_keys(texture_path, mask_path, output_size)
+        with span('cache.get'):
+            mosaic_normal = cache.get(keys['normal'])
+            mosaic_reverse = cache.get(keys['reverse'])
+            mosaic_with_mask = cache.get(keys['masked'])
+        if None not in (mosaic_normal, mosaic_reverse, mosaic_with_mask):
+            notify('normal', mosaic_normal, True)
+            notify('reverse', mosaic_reverse, True)
+            notify('masked', mosaic_with_mask, True)
+            return mosaic_normal, mosaic_reverse, mosaic_with_mask, True
+
+    if is_noise_spec(texture_path):
+        # Шум строится сразу во весь кадр: два независимых поля
+        with span('noise', spec=texture_path):
+            mosaic_normal, mosaic_reverse = noise_pair(NoiseSpec.parse(texture_path), output_size)
+    else:
+        # Обычная и обратная мозаики строятся за один проход
+        with span('load.texture'):
+            base_texture = Image.open(texture_path)
+            base_texture.load()
+        mosaic_normal, mosaic_reverse = create_mosaic_pair(base_texture, output_size)
+    notify('normal', mosaic_normal, False)
+    notify('reverse', mosaic_reverse, False)
+    with span('load.mask'):
+        mask = Image.open(mask_path)
+        mask.load()
+    mosaic_with_mask = apply_mask_correct(mosaic_normal, mask)
+    notify('masked', mosaic_with_mask, False)
+
+    if cache is not None:
+        with span('cache.put'):
+            cache.put(keys['normal'], mosaic_normal)
+            cache.put(keys['reverse'], mosaic_reverse)
+            cache.put(keys['masked'], mosaic_with_mask)
+    return mosaic_normal, mosaic_reverse, mosaic_with_mask, False
+
+
+def _load_saved_keys(output_dir):
+    try:
+        with open(os.path.join(output_dir, SAVED_KEYS_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+class TextureSaver:
+    """
+    Сохраняет текстуры в фоновых потоках, пока основной поток занят дальше.
+    Pillow сжимает PNG без GIL, поэтому файлы пишутся параллельно. Файл, уже
+    записанный из тех же входных данных, не перезаписывается
+    """
+
+    def __init__(self, output_dir, names, keys, compress_level=None, workers=3):
+        self.output_dir = output_dir
+        self.names = names
+        self.keys = keys
+        self.compress_level = compress_level
+        self.saved_keys = _load_saved_keys(output_dir)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='save')
+        self.pending = {}
+        self.skipped = 0
+        self.encode_seconds = 0.0  # суммарное время записи файлов в фоновых потоках
+        self.wait_seconds = 0.0    # сколько основной поток ждал в wait()
+
+    def path(self, role):
+        return os.path.join(self.output_dir, self.names[role])
+
+    def submit(self, role, image):
+        """Ставит текстуру в очередь на сохранение (или пропускает, если файл актуален)"""
+        name = self.names[role]
+        key = self.keys.get(role)
+        if key is not None:
+            # Уровень сжатия меняет файл, поэтому тоже входит в ключ
+            key = make_key(key, self.compress_level)
+            if self.saved_keys.get(name) == key and os.path.exists(self.path(role)):
+                self.skipped += 1
+                return None
+        future = self.executor.submit(self._save, image, self.path(role))
+        self.pending[name] = (future, key)
+        return future
+
+    def _save(self, image, path):
+        started = time.perf_counter()
+        save_texture(image, path, self.compress_level)
+        return time.perf_counter() - started
+
+    def wait(self):
+        """Дожидается всех сохранений и запоминает ключи записанных файлов"""
+        started = time.perf_counter()
+        for name, (future, key) in self.pending.items():
+            self.encode_seconds += future.result()
+            if key is not None:
+                self.saved_keys[name] = key
+            else:
+                self.saved_keys.pop(name, None)
+        self.executor.shutdown()
+        with open(os.path.join(self.output_dir, SAVED_KEYS_FILE), 'w') as file:
+            json.dump(self.saved_keys, file, indent=2)
+        self.wait_seconds = time.perf_counter() - started
+        return len(self.pending)
+
+    def summary(self):
+        return (f"записано файлов: {len(self.pending)}, без изменений: {self.skipped}, "
+                f"запись {self.encode_seconds:.2f} с в фоне, ожидание {self.wait_seconds:.2f} с")
+
+
+STEP_TITLES = {
+    'normal': "1. Создание мозаичной текстуры...",
+    'reverse': "2. Создание обратной мозаики...",
+    'masked': "3. Создание текстуры с маской...",
+}
+
+
+def prepare_textures(texture_path, mask_path, output_dir, output_size=(1920, 1080), cache=None,
+                     output_format='png', compress_level=None):
+    """
+    Строит три текстуры и ставит их на сохранение в output_dir, печатая ход
+    работы. Сохранение идет в фоне: перед выходом вызовите saver.wait().
+    Возвращает (mosaic_normal, mosaic_reverse, mosaic_with_mask, saver)
+    """
+    keys = texture_keys(texture_path, mask_path, output_size) if cache is not None else {}
+    saver = TextureSaver(output_dir, output_names(output_size, output_format), keys, compress_level)
+
+    def on_ready(role, image, from_cache):
+        saver.submit(role, image)
+        print(f"{STEP_TITLES[role]} {'из кэша!' if from_cache else 'готово!'}")
+
+    print()
+    mosaic_normal, mosaic_reverse, mosaic_with_mask, _ = build_textures(
+        texture_path, mask_path, output_size, cache, keys, on_ready)
+    if cache is not None:
+        print(f"🗄️  Кэш: {cache.summary()}")
+
+    return mosaic_normal, mosaic_reverse, mosaic_with_mask, saver
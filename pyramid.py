@@ -0,0 +1,198 @@
+"""
+Кэш масштабированных текстур для окон разного размера.
+
+Исходные поверхности хранятся в полном размере, а их копии под каждый
+используемый размер окна - в кэше по ключу (имя, размер, фильтр) с пределом
+памяти (давно не нужные размеры вытесняются первыми). Масштабирование идет
+в фоновом потоке: цикл отрисовки запрашивает размер через level() и, пока
+он не готов, показывает прежний. Вместе с текстурами в том же потоке
+считается производное для размера (запеченные кадры, области перерисовки) -
+функция derive, которую дает демонстрация. Размеры дисплеев, которые будут
+нужны, можно подготовить заранее (prewarm).
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy import lazy_import
+from tracing import span
+
+pygame = lazy_import('pygame')
+
+FILTERS = ('nearest', 'smooth')
+# Типичные дисплеи: от 720p до 4K
+DISPLAY_SIZES = ((1280, 720), (1920, 1080), (2560, 1440), (3840, 2160))
+
+
+def scale_surface(surface, size, scale_filter='nearest'):
+    """
+    Масштабирует поверхность: nearest - ближайший сосед (как раньше в
+    add_texture), smooth - сглаживание (при сильном уменьшении без ряби)
+    """
+    if surface.get_size() == tuple(size):
+        return surface
+    with span('pygame.scale', size=f"{size[0]}x{size[1]}", filter=scale_filter):
+        if scale_filter == 'smooth' and surface.get_bitsize() in (24, 32):
+            return pygame.transform.smoothscale(surface, size)
+        return pygame.transform.scale(surface, size)
+
+
+def surface_bytes(surface):
+    return surface.get_pitch() * surface.get_height()
+
+
+class Level:
+    """Все текстуры для одного размера окна и производное от них"""
+
+    def __init__(self, size, surfaces, derived=None):
+        self.size = size
+        self.surfaces = surfaces
+        self.derived = derived
+
+
+class SurfacePyramid:
+    """Масштабированные копии исходных текстур по размерам окна"""
+
+    def __init__(self, scale_filter='nearest', max_bytes=768 * 1024 * 1024, derive=None):
+        if scale_filter not in FILTERS:
+            raise ValueError(f"Неизвестный фильтр масштабирования: {scale_filter}")
+        self.scale_filter = scale_filter
+        self.max_bytes = max_bytes
+        self.derive = derive  # derive(size, surfaces) -> производное для размера
+        self.sources = OrderedDict()
+        self.scaled = OrderedDict()  # (имя, размер, фильтр) -> поверхность
+        self.derived = {}  # размер -> результат derive
+        self.pending = {}  # размер -> Future
+        self.waiting = set()  # размеры, которые просили, пока их не было в кэше
+        self.generation = 0  # меняется при замене исходных текстур
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pyramid')
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cached_bytes(self):
+        return sum(surface_bytes(surface) for surface in self.scaled.values())
+
+    def set_source(self, name, surface, scaled=None):
+        """
+        Задает (или заменяет) исходную текстуру. scaled - уже готовые копии
+        {размер: поверхность}, которые можно сразу положить в кэш
+        """
+        self.sources[name] = surface
+        self.generation += 1
+        self.derived.clear()
+        for key in [key for key in self.scaled if key[0] == name]:
+            del self.scaled[key]
+        for size, surface in (scaled or {}).items():
+            self._store(name, tuple(size), surface)
+
+    def _store(self, name, size, surface):
+        key = (name, size, self.scale_filter)
+        self.scaled[key] = surface
+        self.scaled.move_to_end(key)
+        # Вытесняем давно не нужные размеры, но не только что положенный
+        while self.cached_bytes > self.max_bytes and len(self.scaled) > 1:
+            oldest = next(iter(self.scaled))
+            if oldest[1] == size:
+                break
+            del self.scaled[oldest]
+            self.derived.pop(oldest[1], None)
+
+    def surface(self, name, size):
+        """Копия текстуры для размера: из кэша или масштабируется сразу (в текущем потоке)"""
+        size = tuple(size)
+        key = (name, size, self.scale_filter)
+        surface = self.scaled.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.scaled.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = scale_surface(self.sources[name], size, self.scale_filter)
+        self._store(name, size, surface)
+        return surface
+
+    def _build(self, size, generation, sources, cached):
+        # Фоновый поток: только читает переданные ему поверхности
+        surfaces = OrderedDict()
+        for name, source in sources.items():
+            surface = cached.get(name)
+            surfaces[name] = surface if surface is not None else scale_surface(source, size, self.scale_filter)
+        derived = self.derive(size, list(surfaces.values())) if self.derive else None
+        return generation, Level(size, surfaces, derived)
+
+    def request(self, size):
+        """Заказывает фоновую подготовку размера (если его еще нет и он не готовится)"""
+        size = tuple(size)
+        if not self.sources or size in self.pending or self._cached_level(size) is not None:
+            return
+        cached = {name: self.scaled.get((name, size, self.scale_filter)) for name in self.sources}
+        self.misses += 1
+        self.pending[size] = self.executor.submit(self._build, size, self.generation,
+                                                  dict(self.sources), cached)
+
+    def prewarm(self, sizes=DISPLAY_SIZES):
+        """Заранее готовит текстуры для размеров дисплеев, которые понадобятся"""
+        for size in sizes:
+            self.request(size)
+
+    def _cached_level(self, size):
+        keys = [(name, size, self.scale_filter) for name in self.sources]
+        if not all(key in self.scaled for key in keys):
+            return None
+        if self.derive is not None and size not in self.derived:
+            return None
+        for key in keys:
+            self.scaled.move_to_end(key)
+        return Level(size, OrderedDict((key[0], self.scaled[key]) for key in keys), self.derived.get(size))
+
+    def _collect(self):
+        """Забирает из фонового потока готовые размеры (в потоке отрисовки)"""
+        for size, future in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[size]
+            generation, level = future.result()
+            if generation != self.generation:
+                # Исходные текстуры заменили, пока шло масштабирование
+                continue
+            for name, surface in level.surfaces.items():
+                self._store(name, size, surface)
+            if self.derive is not None:
+                self.derived[size] = level.derived
+
+    def level(self, size, wait=False):
+        """
+        Текстуры для размера окна. Если их нет - заказывает фоновую подготовку
+        и возвращает None (с wait=True - дожидается)
+        """
+        size = tuple(size)
+        self._collect()
+        level = self._cached_level(size)
+        if level is not None:
+            # Дождались заказанного размера - это не попадание в кэш
+            if size in self.waiting:
+                self.waiting.discard(size)
+            else:
+                self.hits += 1
+            return level
+        self.waiting.add(size)
+        self.request(size)
+        if not wait:
+            return None
+        while True:
+            self.pending[size].result()
+            self._collect()
+            level = self._cached_level(size)
+            if level is not None:
+                self.waiting.discard(size)
+                return level
+            self.request(size)
+
+    def summary(self):
+        sizes = sorted({key[1] for key in self.scaled})
+        listed = ", ".join(f"{width}x{height}" for width, height in sizes)
+        return (f"размеров в кэше {len(sizes)} ({listed}), {self.cached_bytes / (1024 * 1024):.0f} МБ, "
+                f"из кэша {self.hits}, масштабирований {self.misses}")
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
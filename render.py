@@ -0,0 +1,371 @@
+"""
+Офлайн-рендер "невидимых" видео без окна pygame.
+
+Берет ту же текстуру и маску, что и generator.py / genlin.py, считает кадры
+потоково (по одному) и сразу пишет их в Y4M, сырой RGB-поток или через
+ffmpeg в обычный видеофайл. Все кадры в памяти не хранятся.
+
+Примеры:
+    python render.py 01.jpg maska.png -o flicker.y4m --fps 60 --duration 10
+    python render.py 01.jpg maska.png --mode scroll --scroll-speed 3 -o scroll.mp4
+    python render.py 01.jpg maska.png --format raw -o - | ffplay -f rawvideo ...
+"""
+import argparse
+import itertools
+import os
+import subprocess
+import sys
+import time
+from fractions import Fraction
+
+import numpy as np
+from PIL import Image
+
+from cache import TextureCache
+from compose import compose_frame
+from maskseq import MaskPrefetcher
+from mosaic import VirtualMosaic, mask_alpha
+from motion import MOTIONS, MotionField, MotionSampler, load_displacement, motion_plane
+from noise import is_noise_spec
+from options import frames_per_phase, parse_size
+from pipeline import build_textures
+from tracing import finish as finish_trace, span, tracer
+
+
+def split_overlay(overlay):
+    """
+    Разделяет RGBA-текстуру с маской на цвет и альфа-канал (один раз на весь
+    рендер). Уже разделенная пара (цвет, альфа) возвращается как есть
+    """
+    if isinstance(overlay, tuple):
+        return overlay
+    return overlay.convert('RGB'), overlay.getchannel('A')
+
+
+def flicker_frames(mosaic_normal, mosaic_reverse, overlay, fps=60, duration=10.0, switch_interval=0.1,
+                   sequence=None):
+    """
+    Генератор кадров мерцания: фон попеременно обычная/обратная мозаика,
+    сверху текстура с маской. sequence - итератор пар кадров фаз
+    (flicker_phases) по кадрам видео для движущейся маски
+    """
+    overlay_rgb, overlay_alpha = split_overlay(overlay)
+
+    # При статичной маске возможных кадров всего два - собираем их один раз
+    phases = (
+        compose_frame(mosaic_normal, overlay_rgb, overlay_alpha),
+        compose_frame(mosaic_reverse, overlay_rgb, overlay_alpha),
+    )
+    step = frames_per_phase(switch_interval, fps)
+
+    for index, sequence_phases in zip(range(int(round(duration * fps))), sequence or itertools.repeat(None)):
+        yield (sequence_phases or phases)[(index // step) % 2]
+
+
+def flicker_phases(mosaic_normal, mosaic_reverse, alpha):
+    """
+    Оба кадра мерцания для альфа-канала маски. Текстура с маской - это та
+    же обычная мозаика, поэтому кадр фазы 0 от маски не зависит
+    """
+    return mosaic_normal, compose_frame(mosaic_reverse, mosaic_normal, alpha)
+
+
+def scroll_frames(texture1, texture2, overlay, fps=60, duration=10.0, scroll_speed=2, sequence=None):
+    """
+    Генератор кадров прокрутки: лента texture1 + texture2 бесконечно едет
+    под текстурой с маской (как в genlin.py). sequence - итератор
+    альфа-каналов по кадрам видео для движущейся маски
+    """
+    overlay_rgb, overlay_alpha = split_overlay(overlay)
+    width, height = texture1.size
+    textures = (texture1, texture2)
+    position = 0.0
+
+    for _, sequence_alpha in zip(range(int(round(duration * fps))), sequence or itertools.repeat(None)):
+        # Окно высотой в экран из ленты длиной в две текстуры, с переходом через край
+        offset = int(position)
+        first = textures[offset // height]
+        second = textures[(offset // height + 1) % 2]
+        offset %= height
+
+        frame = Image.new('RGB', (width, height))
+        frame.paste(first.crop((0, offset, width, height)), (0, 0))
+        if offset:
+            frame.paste(second.crop((0, 0, width, offset)), (0, height - offset))
+        frame.paste(overlay_rgb, (0, 0), sequence_alpha or overlay_alpha)
+        yield frame
+
+        position += scroll_speed
+        if position >= height * 2:
+            position -= height * 2
+
+
+def motion_frames(texture1, texture2, overlay, field, fps=60, duration=10.0, scroll_speed=2, sequence=None):
+    """
+    Генератор кадров произвольного движения фона (motion.py): каждый кадр -
+    один gather по заранее посчитанной таблице, сверху текстура с маской.
+    sequence - как у scroll_frames
+    """
+    overlay_rgb, overlay_alpha = split_overlay(overlay)
+    with span('motion.prepare', kind=field.kind):
+        plane = motion_plane(np.asarray(texture1.convert('RGB')), np.asarray(texture2.convert('RGB')))
+        sampler = MotionSampler(field, plane)
+    position = 0.0
+
+    for _, sequence_alpha in zip(range(int(round(duration * fps))), sequence or itertools.repeat(None)):
+        with span('motion.gather'):
+            frame = Image.fromarray(sampler.gather(int(position)), 'RGB')
+        frame.paste(overlay_rgb, (0, 0), sequence_alpha or overlay_alpha)
+        yield frame
+
+        position += scroll_speed
+        if position >= field.cycle:
+            position -= field.cycle
+
+
+def sequence_items(prefetcher, fps, mask_fps):
+    """
+    Для каждого кадра видео - подготовленный кадр маски, которому он
+    соответствует по времени. Если кадр маски еще не готов, ждет его: в
+    офлайн-рендере ожидание не срок кадра, поэтому недоборы не считаются
+    """
+    current = None
+    shown = -1
+    for index in itertools.count():
+        mask_index = index * Fraction(mask_fps) // Fraction(fps)
+        while shown < mask_index and not prefetcher.finished:
+            item = prefetcher.get(block=True)
+            if item is None:
+                break
+            current = item
+            shown += 1
+        yield current
+
+
+class FrameWriter:
+    """Базовый писатель кадров: повторный кадр не перекодируется"""
+
+    def __init__(self, stream, size, fps):
+        self.stream = stream
+        self.size = size
+        self.fps = Fraction(fps)
+        self.frames_written = 0
+        self._last_frame = None
+        self._last_payload = None
+
+    def write(self, frame):
+        if frame is not self._last_frame:
+            self._last_frame = frame
+            with span('render.encode'):
+                self._last_payload = self.encode(frame)
+        with span('render.write'):
+            self.stream.write(self._last_payload)
+        self.frames_written += 1
+
+    def encode(self, frame):
+        return frame.tobytes()
+
+    def close(self):
+        self.stream.flush()
+        if self.stream is not sys.stdout.buffer:
+            self.stream.close()
+
+
+class RawWriter(FrameWriter):
+    """Сырой поток RGB24 без заголовков (для ffmpeg -f rawvideo -pix_fmt rgb24)"""
+
+
+class Y4MWriter(FrameWriter):
+    """YUV4MPEG2 с полным разрешением цвета (C444)"""
+
+    def __init__(self, stream, size, fps):
+        super().__init__(stream, size, fps)
+        header = 'YUV4MPEG2 W{} H{} F{}:{} Ip A1:1 C444 XCOLORRANGE=FULL\n'.format(
+            size[0], size[1], self.fps.numerator, self.fps.denominator)
+        self.stream.write(header.encode('ascii'))
+
+    def encode(self, frame):
+        y, cb, cr = frame.convert('YCbCr').split()
+        return b'FRAME\n' + y.tobytes() + cb.tobytes() + cr.tobytes()
+
+
+class FFmpegWriter(FrameWriter):
+    """Передает сырые кадры в ffmpeg, который кодирует их в видеофайл"""
+
+    def __init__(self, path, size, fps, codec='libx264'):
+        fps = Fraction(fps)
+        command = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{size[0]}x{size[1]}', '-r', f'{fps.numerator}/{fps.denominator}',
+            '-i', '-',
+            '-c:v', codec, '-pix_fmt', 'yuv420p',
+            path,
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        super().__init__(self.process.stdin, size, fps)
+
+    def close(self):
+        super().close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg завершился с кодом {self.process.returncode}")
+
+
+def open_writer(output, size, fps, output_format=None, codec='libx264'):
+    """Выбирает писателя по формату или расширению файла ('-' - стандартный вывод)"""
+    if output_format is None:
+        extension = os.path.splitext(output)[1].lower()
+        if output == '-' or extension == '.y4m':
+            output_format = 'y4m'
+        elif extension in ('.raw', '.rgb'):
+            output_format = 'raw'
+        else:
+            output_format = 'ffmpeg'
+
+    if output_format == 'ffmpeg':
+        if output == '-':
+            raise ValueError("ffmpeg не умеет писать видеофайл в стандартный вывод, укажите файл")
+        return FFmpegWriter(output, size, fps, codec)
+
+    stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    if output_format == 'y4m':
+        return Y4MWriter(stream, size, fps)
+    if output_format == 'raw':
+        return RawWriter(stream, size, fps)
+    raise ValueError(f"Неизвестный формат вывода: {output_format}")
+
+
+def render(frames, writer):
+    """Прогоняет генератор кадров через писателя, возвращает число кадров"""
+    try:
+        for frame in frames:
+            writer.write(frame)
+    finally:
+        writer.close()
+    return writer.frames_written
+
+
+def main(argv=None):
+    """Точка входа офлайн-рендера"""
+    # Рендер работает без дисплея: глушим приветствие pygame и окно SDL.
+    # Только здесь, а не при импорте: демонстрации берут из render функции
+    # и должны открывать настоящее окно
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    parser = argparse.ArgumentParser(description="Офлайн-рендер невидимых видео без окна")
+    parser.add_argument('texture', help="файл начальной текстуры (100x100, jpg) или шум noise:ВИД[:ЗЕРНО][:mono]")
+    parser.add_argument('mask', help="файл маски (png)")
+    parser.add_argument('-o', '--output', default='render.y4m',
+                        help="файл результата (.y4m, .raw или видео через ffmpeg), '-' - stdout")
+    parser.add_argument('--mode', choices=('flicker', 'scroll'), default='flicker')
+    parser.add_argument('--format', choices=('y4m', 'raw', 'ffmpeg'), default=None,
+                        help="формат вывода (по умолчанию по расширению)")
+    parser.add_argument('--codec', default='libx264', help="кодек ffmpeg")
+    parser.add_argument('--fps', default='60', help="частота кадров, например 60 или 30000/1001")
+    parser.add_argument('--duration', type=float, default=10.0, help="длина ролика в секундах")
+    parser.add_argument('--size', type=parse_size, default=(1920, 1080), help="размер кадра, например 1920x1080")
+    parser.add_argument('--switch-interval', type=float, default=0.1, help="интервал мерцания в секундах")
+    parser.add_argument('--scroll-speed', type=float, default=2, help="скорость прокрутки, пикселей за кадр")
+    parser.add_argument('--motion', choices=MOTIONS, default='vertical',
+                        help="движение фона в режиме scroll (vertical - обычная прокрутка)")
+    parser.add_argument('--displacement', help="карта смещений для --motion displace (R - x, G - y, 128 - ноль)")
+    parser.add_argument('--mask-sequence', help="движущаяся маска: папка PNG-кадров или видеофайл")
+    parser.add_argument('--mask-fps', default='30', help="частота кадров движущейся маски")
+    parser.add_argument('--prefetch-depth', type=int, default=8, help="сколько кадров маски готовить заранее")
+    parser.add_argument('--prefetch-workers', type=int, help="потоков подготовки кадров маски")
+    parser.add_argument('--virtual', action='store_true',
+                        help="не держать мозаики целиком: собирать из плитки только нужные области "
+                             "(для огромных полотен; кэш не используется)")
+    parser.add_argument('--no-cache', action='store_true', help="не использовать кэш готовых текстур")
+    parser.add_argument('--cache-dir', help="папка кэша (по умолчанию ~/.cache/illusion)")
+    parser.add_argument('--cache-size', type=int, default=2048, help="предельный размер кэша, МБ")
+    parser.add_argument('--trace', nargs='?', const='', metavar='FILE',
+                        help="замерить этапы (время и память) и напечатать сводку; "
+                             "с FILE - сохранить трассу Chrome (JSON)")
+    args = parser.parse_args(argv)
+    if args.motion != 'vertical' and args.mode != 'scroll':
+        parser.error("--motion работает только в режиме --mode scroll")
+    if (args.motion == 'displace') != bool(args.displacement):
+        parser.error("--displacement задается вместе с --motion displace")
+    if args.motion != 'vertical' and args.virtual:
+        parser.error("--motion строит плоскость из целых мозаик и с --virtual не работает")
+    if args.virtual and is_noise_spec(args.texture):
+        parser.error("--virtual собирает мозаику из плитки, шум noise:... с ним не работает")
+    if args.trace is not None:
+        tracer.enable()
+
+    # При выводе в stdout сообщения уходят в stderr, чтобы не портить поток
+    log = sys.stderr if args.output == '-' else sys.stdout
+    fps = Fraction(args.fps)
+
+    if args.virtual:
+        # В памяти только плитка; текстура с маской - это обычная мозаика
+        # (один кадр) и альфа-канал маски
+        with Image.open(args.texture) as base_texture:
+            mosaic_normal, mosaic_reverse = VirtualMosaic.pair(base_texture, args.size)
+        with Image.open(args.mask) as mask:
+            mosaic_with_mask = (mosaic_normal.materialize(), mask_alpha(mask, args.size))
+        base_rgb = mosaic_with_mask[0]
+        print(f"🧩 Виртуальная мозаика: плитка {mosaic_normal.nbytes / 1024:.0f} КБ", file=log)
+    else:
+        cache = None if args.no_cache else TextureCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        mosaic_normal, mosaic_reverse, mosaic_with_mask, from_cache = build_textures(
+            args.texture, args.mask, args.size, cache)
+        base_rgb = mosaic_normal
+        if from_cache:
+            print("🗄️  Текстуры взяты из кэша", file=log)
+
+    # Движущаяся маска: кадры маски готовятся в фоне, пока пишутся предыдущие
+    prefetcher = sequence = None
+    if args.mask_sequence:
+        if args.mode == 'flicker':
+            def prepare(mask):
+                return flicker_phases(base_rgb, mosaic_reverse, mask_alpha(mask, args.size))
+        else:
+            def prepare(mask):
+                return mask_alpha(mask, args.size)
+        prefetcher = MaskPrefetcher(args.mask_sequence, args.size, prepare,
+                                    args.prefetch_depth, args.prefetch_workers).start()
+        sequence = sequence_items(prefetcher, fps, args.mask_fps)
+        print(f"🎭 Движущаяся маска: {args.mask_sequence}, {float(Fraction(args.mask_fps)):g} кадр/с", file=log)
+
+    if args.mode == 'flicker':
+        step = frames_per_phase(args.switch_interval, fps)
+        if args.switch_interval * fps < 1:
+            print(f"⚠️  Интервал {args.switch_interval} с короче кадра при {float(fps):g} fps - "
+                  f"фаза будет меняться каждый кадр", file=log)
+        print(f"🎬 Мерцание: смена фазы каждые {step} кадр(а) "
+              f"({float(fps) / step:g} смен/сек)", file=log)
+        frames = flicker_frames(mosaic_normal, mosaic_reverse, mosaic_with_mask,
+                                fps, args.duration, args.switch_interval, sequence)
+    elif args.motion != 'vertical':
+        displacement = load_displacement(args.displacement, args.size) if args.displacement else None
+        field = MotionField(args.motion, args.size, displacement)
+        print(f"🎬 Движение {args.motion}: {args.scroll_speed:g} px/кадр", file=log)
+        frames = motion_frames(mosaic_normal, mosaic_reverse, mosaic_with_mask, field,
+                               fps, args.duration, args.scroll_speed, sequence)
+    else:
+        print(f"🎬 Прокрутка: {args.scroll_speed:g} px/кадр", file=log)
+        frames = scroll_frames(mosaic_normal, mosaic_reverse, mosaic_with_mask,
+                               fps, args.duration, args.scroll_speed, sequence)
+
+    writer = open_writer(args.output, args.size, fps, args.format, args.codec)
+    started = time.perf_counter()
+    try:
+        count = render(frames, writer)
+    finally:
+        if prefetcher is not None:
+            prefetcher.stop()
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ Записано кадров: {count} за {elapsed:.1f} с ({count / max(elapsed, 1e-9):.1f} кадр/с)", file=log)
+    if args.output != '-':
+        print(f"📁 Результат: {os.path.abspath(args.output)}", file=log)
+    if prefetcher is not None:
+        print(f"🎭 Движущаяся маска: {prefetcher.summary()}", file=log)
+    finish_trace(args.trace, log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Планировщик мерцания по кадрам дисплея.
+
+Экран не может сменить картинку чаще, чем обновляется сам, поэтому фаза
+считается в показанных кадрах (вертикальных развертках): "менять каждые N
+кадров". Интервал в секундах переводится в N с округлением, а если он короче
+одного кадра - выдается предупреждение. Фактическая частота смен измеряется
+по perf_counter.
+"""
+import time
+from collections import deque
+
+from lazy import lazy_import
+
+pygame = lazy_import('pygame')
+
+
+def detect_refresh_rate(default=60):
+    """
+    Частота обновления текущего дисплея в Гц (или default, если узнать нельзя -
+    функции запроса частоты есть не во всех сборках pygame)
+    """
+    for name in ('get_current_refresh_rate', 'get_desktop_refresh_rates'):
+        getter = getattr(pygame.display, name, None)
+        if getter is None:
+            continue
+        try:
+            rate = getter()
+        except pygame.error:
+            continue
+        if isinstance(rate, (list, tuple)):
+            rate = rate[0] if rate else 0
+        if rate and rate > 0:
+            return rate
+    return default
+
+
+class FlickerScheduler:
+    """Считает фазы мерцания в кадрах дисплея и измеряет реальную частоту смен"""
+
+    def __init__(self, refresh_rate, switch_interval=None, switch_every=None, window=240):
+        self.refresh_rate = refresh_rate
+        self.requested_interval = switch_interval
+        if switch_every is None:
+            switch_every = max(1, round(switch_interval * refresh_rate))
+        self.switch_every = int(switch_every)
+        self.frame_count = 0
+        self.phase = 0
+        self.switch_count = 0
+        self.switch_times = deque(maxlen=window)
+
+    @property
+    def nominal_rate(self):
+        """Частота смен, которую дает расписание при идеальной развертке"""
+        return self.refresh_rate / self.switch_every
+
+    @property
+    def requested_rate(self):
+        """Частота смен, которую просили (по интервалу в секундах)"""
+        if self.requested_interval:
+            return 1 / self.requested_interval
+        return self.nominal_rate
+
+    def warning(self):
+        """Текст предупреждения, если запрошенный интервал дисплей показать не может"""
+        if self.requested_interval and self.requested_interval * self.refresh_rate < 1:
+            return (f"Интервал {self.requested_interval} с короче одного кадра дисплея "
+                    f"({1 / self.refresh_rate:.4f} с при {self.refresh_rate} Гц): "
+                    f"максимум {self.nominal_rate:g} смен/сек, а не {self.requested_rate:g}")
+        return None
+
+    def advance(self):
+        """Отмечает показанный кадр; возвращает True, если фаза сменилась"""
+        self.frame_count += 1
+        if self.frame_count % self.switch_every:
+            return False
+        self.phase = (self.phase + 1) % 2
+        self.switch_count += 1
+        self.switch_times.append(time.perf_counter())
+        return True
+
+    def reset_measurement(self):
+        """Сбрасывает замер частоты (например, после паузы)"""
+        self.switch_times.clear()
+
+    def achieved_rate(self):
+        """Фактическая частота смен за последнее окно замера (смен/сек)"""
+        if len(self.switch_times) < 2:
+            return 0.0
+        elapsed = self.switch_times[-1] - self.switch_times[0]
+        return (len(self.switch_times) - 1) / elapsed if elapsed > 0 else 0.0
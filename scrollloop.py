@@ -0,0 +1,332 @@
+"""
+Компактный формат цикла прокрутки: одна лента и смещения вместо видео.
+
+Каждый кадр прокрутки genlin.py - это окно высотой в экран из ленты
+текстура1 + текстура2 на позиции scroll_position под неподвижной текстурой
+с маской. При постоянной скорости позиция через scroll_loop_frames кадров
+возвращается в начало, так что цикл целиком задают лента, текстура с
+маской и таблица смещений по кадрам. Лента хранится с повтором первой
+текстуры в конце (текстура1 + текстура2 + текстура1), поэтому окно любого
+кадра - непрерывная область и рисуется одним blit, без разреза на стыке.
+
+Формат (little-endian), пиксели в порядке экрана (BGRA), как в framestore:
+    заголовок, 128 байт:  4s магия b'ILSL', H версия, H размер заголовка,
+                          I ширина, I высота экрана, I число кадров цикла,
+                          I/I частота кадров (дробь), I/I скорость прокрутки
+                          (дробь, пикселей за кадр), B смешивание соседних
+                          позиций (subpixel), Q смещение таблицы позиций,
+                          Q смещение таблицы долей, Q смещение ленты,
+                          Q смещение текстуры с маской
+    таблица позиций: uint32 на кадр - верхняя строка окна в ленте
+    таблица долей: uint8 на кадр - прозрачность следующей позиции (subpixel)
+    лента (ширина x 3 высоты) и текстура с маской - с границы страницы
+
+Плеер открывает файл через mmap; поверхности pygame ссылаются на его
+страницы. Цикл 1280x720 занимает около 15 МБ вместо гигабайтов видео.
+
+Примеры:
+    python scrollloop.py export 01.jpg maska.png -o loop.illscroll --size 1280x720 --scroll-speed 2
+    python scrollloop.py play loop.illscroll
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from fractions import Fraction
+
+import numpy as np
+
+from cache import TextureCache
+from dirty import mask_dirty_rects, rects_coverage
+from framestore import ALIGNMENT, frame_bytes
+from lazy import lazy_import
+from options import parse_size
+from pipeline import build_textures
+from stats import FrameStats
+
+pygame = lazy_import('pygame')
+
+MAGIC = b'ILSL'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIIIIIIB3xQQQQ')
+HEADER_SIZE = 128
+
+
+def scroll_step(scroll_speed):
+    """Скорость прокрутки как точная дробь: позиция не накапливает ошибку float"""
+    return Fraction(scroll_speed).limit_denominator(1000)
+
+
+def scroll_loop_frames(scroll_speed, period):
+    """Через сколько кадров прокрутка со скоростью scroll_speed возвращается в ту же позицию"""
+    return (scroll_step(scroll_speed) / period).denominator
+
+
+def loop_positions(scroll_speed, height, subpixel=True):
+    """
+    Позиции всех кадров цикла прокрутки по ленте из двух текстур высотой
+    height: целые строки (uint32) и доли следующей строки 0..255 (uint8),
+    как их рисует genlin.py. Без subpixel доли нулевые
+    """
+    step = scroll_step(scroll_speed)
+    period = height * 2
+    count = scroll_loop_frames(scroll_speed, period)
+    # Позиция кадра k - k * step по кругу; считаем в целых: k * p / q
+    numerators = np.arange(count, dtype=np.int64) * step.numerator % (period * step.denominator)
+    whole = numerators // step.denominator
+    if subpixel:
+        alpha = (numerators % step.denominator) * 255 // step.denominator
+    else:
+        alpha = np.zeros(count, dtype=np.int64)
+    return whole.astype(np.uint32), alpha.astype(np.uint8)
+
+
+def _align(value, alignment=ALIGNMENT):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def write_loop(path, texture1, texture2, overlay, scroll_speed=2, fps=60, subpixel=True):
+    """
+    Записывает цикл прокрутки (атомарно, через временный файл). Текстуры -
+    PIL Image или поверхности pygame одного размера. Возвращает число кадров
+    """
+    size, _, first = frame_bytes(texture1)
+    width, height = size
+    if frame_bytes(texture2)[0] != size or frame_bytes(overlay)[0] != size:
+        raise ValueError("Текстуры цикла прокрутки должны быть одного размера")
+    _, _, second = frame_bytes(texture2)
+    _, _, overlay_data = frame_bytes(overlay)
+    whole, alpha = loop_positions(scroll_speed, height, subpixel)
+    step = scroll_step(scroll_speed)
+    fps = Fraction(fps)
+
+    positions_offset = HEADER_SIZE
+    alphas_offset = positions_offset + whole.nbytes
+    strip_offset = _align(alphas_offset + alpha.nbytes)
+    overlay_offset = _align(strip_offset + len(first) * 2 + len(second))
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, HEADER_SIZE, width, height, len(whole),
+                               fps.numerator, fps.denominator, step.numerator, step.denominator,
+                               int(subpixel), positions_offset, alphas_offset, strip_offset,
+                               overlay_offset).ljust(HEADER_SIZE, b'\0'))
+        file.write(whole.tobytes())
+        file.write(alpha.tobytes())
+        file.seek(strip_offset)
+        # Первая текстура повторяется в конце: окно на стыке остается непрерывным
+        file.write(first)
+        file.write(second)
+        file.write(first)
+        file.seek(overlay_offset)
+        file.write(overlay_data)
+    os.replace(temp_path, path)
+    return len(whole)
+
+
+class ScrollLoop:
+    """Открытый через mmap цикл прокрутки: лента, текстура с маской и позиции кадров"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, header_size, width, height, count, fps_num, fps_den, speed_num, speed_den,
+         subpixel, positions_offset, alphas_offset, strip_offset, overlay_offset) = HEADER.unpack_from(self.mapped)
+        if magic != MAGIC:
+            raise ValueError(f"Это не цикл прокрутки: {path}")
+        if version != VERSION:
+            raise ValueError(f"Неподдерживаемая версия цикла прокрутки: {version}")
+        if overlay_offset + width * height * 4 > len(self.mapped):
+            raise ValueError(f"Цикл прокрутки обрезан: {path}")
+        self.size = (width, height)
+        self.fps = Fraction(fps_num, fps_den)
+        self.scroll_speed = Fraction(speed_num, speed_den)
+        self.subpixel = bool(subpixel)
+        self.positions = np.frombuffer(self.mapped, np.uint32, count, positions_offset)
+        self.alphas = np.frombuffer(self.mapped, np.uint8, count, alphas_offset)
+        self.strip_offset = strip_offset
+        self.overlay_offset = overlay_offset
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def nbytes(self):
+        return len(self.mapped)
+
+    def _surface(self, offset, height):
+        width = self.size[0]
+        return pygame.image.frombuffer(memoryview(self.mapped)[offset:offset + width * height * 4],
+                                       (width, height), 'BGRA')
+
+    def strip_surface(self):
+        """Лента (ширина x 3 высоты экрана) без копирования; смешивание выключено"""
+        surface = self._surface(self.strip_offset, self.size[1] * 3)
+        surface.set_alpha(None)
+        return surface
+
+    def overlay_surface(self):
+        """Текстура с маской без копирования"""
+        return self._surface(self.overlay_offset, self.size[1])
+
+    def frame(self, index):
+        """(строка окна в ленте, доля следующей строки 0..255) для кадра цикла"""
+        index %= len(self.positions)
+        return int(self.positions[index]), int(self.alphas[index])
+
+    def close(self):
+        self.positions = self.alphas = None
+        try:
+            self.mapped.close()
+        except BufferError:
+            # Поверхности еще ссылаются на страницы - отображение закроется вместе с ними
+            pass
+
+
+class LoopPlayer:
+    """
+    Показ цикла прокрутки: окно ленты - один blit на область, где сквозь
+    маску видна прокрутка, сверху текстура с маской. При доле смешивания
+    поверх с прозрачностью кладется кадр следующей строки
+    """
+
+    def __init__(self, loop, screen):
+        self.loop = loop
+        self.screen = screen
+        self.strip = loop.strip_surface()
+        self.overlay = loop.overlay_surface()
+        self.rects = mask_dirty_rects(self.overlay)
+        self.blend_surface = None
+
+    def draw(self, index, rects=None):
+        """Рисует кадр цикла в области rects (по умолчанию - где видна прокрутка)"""
+        rects = self.rects if rects is None else rects
+        row, alpha = self.loop.frame(index)
+        for rect in rects:
+            self.screen.blit(self.strip, rect, rect.move(0, row))
+        for rect in rects:
+            self.screen.blit(self.overlay, rect, rect)
+        if alpha:
+            # Следующая позиция собирается целиком (лента и маска) и ложится
+            # с прозрачностью - так же, как в genlin.py, байт в байт
+            if self.blend_surface is None:
+                self.blend_surface = pygame.Surface(self.loop.size, 0, self.screen)
+            for rect in rects:
+                self.blend_surface.blit(self.strip, rect, rect.move(0, row + 1))
+                self.blend_surface.blit(self.overlay, rect, rect)
+            self.blend_surface.set_alpha(alpha)
+            for rect in rects:
+                self.screen.blit(self.blend_surface, rect, rect)
+            self.blend_surface.set_alpha(None)
+        return rects
+
+
+def play(path, max_frames=None, max_fps=None):
+    """Показывает цикл прокрутки в окне его размера; ESC - выход, ПРОБЕЛ - пауза"""
+    pygame.display.init()
+    with ScrollLoop(path) as loop:
+        screen = pygame.display.set_mode(loop.size)
+        pygame.display.set_caption("Цикл прокрутки")
+        player = LoopPlayer(loop, screen)
+        print(f"🔁 Цикл прокрутки: {len(loop)} кадров, {loop.size[0]}x{loop.size[1]}, "
+              f"{float(loop.scroll_speed):g} px/кадр, файл {loop.nbytes / 1024 / 1024:.1f} МБ")
+        print(f"   Перерисовывается областей: {len(player.rects)} "
+              f"({rects_coverage(player.rects, loop.size):.0%} экрана)")
+
+        stats = FrameStats()
+        clock = pygame.time.Clock()
+        fps = float(loop.fps) if max_fps is None else max_fps
+        index = 0
+        paused = False
+        full_redraw = True
+        running = True
+        while running:
+            stats.begin_frame()
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        running = False
+                    elif event.key == pygame.K_SPACE:
+                        paused = not paused
+            stats.mark('events')
+            if full_redraw:
+                player.draw(index, [screen.get_rect()])
+                pygame.display.flip()
+                full_redraw = False
+            elif not paused:
+                pygame.display.update(player.draw(index))
+            stats.mark('blit')
+            if not paused:
+                index = (index + 1) % len(loop)
+            clock.tick(fps)
+            stats.mark('idle')
+            stats.end_frame()
+            if max_frames and stats.frame_count >= max_frames:
+                running = False
+
+        print("\n⏱️  Время кадра (последние кадры):")
+        for line in stats.lines():
+            print(f"   {line}")
+        del player
+    pygame.quit()
+
+
+def main(argv=None):
+    """Точка входа: экспорт, показ и сведения о цикле прокрутки"""
+    parser = argparse.ArgumentParser(description="Компактный цикл прокрутки: лента и смещения вместо видео")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="построить текстуры и записать цикл прокрутки")
+    export.add_argument('texture', help="файл начальной текстуры или шум noise:ВИД[:ЗЕРНО]")
+    export.add_argument('mask', help="файл маски (png)")
+    export.add_argument('-o', '--output', default='loop.illscroll', help="файл цикла")
+    export.add_argument('--size', type=parse_size, default=(1280, 720), help="размер кадра, например 1280x720")
+    export.add_argument('--scroll-speed', type=float, default=2, help="скорость прокрутки, пикселей за кадр")
+    export.add_argument('--fps', default='60', help="частота кадров показа")
+    export.add_argument('--no-subpixel', action='store_true', help="без смешивания соседних позиций")
+    export.add_argument('--no-cache', action='store_true', help="не использовать кэш готовых текстур")
+    export.add_argument('--cache-dir', help="папка кэша (по умолчанию ~/.cache/illusion)")
+    player = commands.add_parser('play', help="показать цикл прокрутки")
+    player.add_argument('loop', help="файл цикла")
+    player.add_argument('--fps', type=float, default=None, help="частота показа (по умолчанию - из файла)")
+    info = commands.add_parser('info', help="сведения о цикле прокрутки")
+    info.add_argument('loop', help="файл цикла")
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        cache = None if args.no_cache else TextureCache(args.cache_dir)
+        started = time.perf_counter()
+        mosaic_normal, mosaic_reverse, mosaic_with_mask, from_cache = build_textures(
+            args.texture, args.mask, args.size, cache)
+        count = write_loop(args.output, mosaic_normal, mosaic_reverse, mosaic_with_mask,
+                           args.scroll_speed, args.fps, not args.no_subpixel)
+        video_bytes = count * args.size[0] * args.size[1] * 3
+        print(f"🔁 Цикл прокрутки: {count} кадров при {args.scroll_speed:g} px/кадр "
+              f"({count / float(Fraction(args.fps)):.1f} с), за {time.perf_counter() - started:.1f} с"
+              f"{' (текстуры из кэша)' if from_cache else ''}")
+        print(f"📁 {os.path.abspath(args.output)}: {os.path.getsize(args.output) / 1024 / 1024:.1f} МБ "
+              f"вместо {video_bytes / 1024 / 1024:.0f} МБ несжатого видео")
+    elif args.command == 'play':
+        play(args.loop, max_fps=args.fps)
+    else:
+        with ScrollLoop(args.loop) as loop:
+            seconds = len(loop) / loop.fps
+            print(f"{args.loop}: {loop.size[0]}x{loop.size[1]}, {len(loop)} кадров "
+                  f"({float(seconds):.1f} с при {float(loop.fps):g} кадр/с), "
+                  f"скорость {float(loop.scroll_speed):g} px/кадр, "
+                  f"смешивание {'вкл' if loop.subpixel else 'выкл'}, {loop.nbytes / 1024 / 1024:.1f} МБ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
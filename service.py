@@ -0,0 +1,586 @@
+"""
+Локальный сервис подготовки текстур и роликов для редакторов.
+
+Запуск каждого скрипта - это старт интерпретатора, импорт Pillow и NumPy и
+холодные кэши, то есть секунды на каждый клик. Сервис запускается один раз
+и держит пул "прогретых" процессов-исполнителей, а последние результаты -
+в памяти (LRU с ограничением объема). Одинаковые запросы, пришедшие
+одновременно, считаются один раз. Число запросов в работе ограничено, а
+лишние сверх очереди получают 503.
+
+HTTP на localhost или Unix-сокет (--socket). Текстура и маска передаются
+как multipart/form-data (поля texture и mask; вместо файла текстуры можно
+передать шум noise:ВИД[:ЗЕРНО]):
+    POST /textures/normal|reverse|masked?size=1920x1080&format=png|illf&compress=0-9
+    POST /clip?mode=flicker|scroll&size=&fps=&duration=&switch_interval=&scroll_speed=&format=y4m|raw|mp4
+    GET  /metrics - очередь, запросы в работе, задержки, кэш (JSON)
+    GET  /health
+
+Пример:
+    python service.py --port 8765 --workers 2
+    curl -F texture=@01.jpg -F mask=@maska.png "http://127.0.0.1:8765/textures/masked" -o masked.png
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import signal
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.parser import BytesParser
+from email.policy import HTTP
+from fractions import Fraction
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+from batch import limit_memory
+from cache import make_key
+from mosaic import apply_mask_correct, create_mosaic_pair
+from noise import NoiseSpec, is_noise_spec
+from pipeline import FRAME_EXTENSION, build_textures, save_texture
+from render import flicker_frames, open_writer, parse_size, render, scroll_frames
+
+ROLES = ('normal', 'reverse', 'masked')
+TEXTURE_FORMATS = {'png': ('.png', 'image/png'), 'illf': (FRAME_EXTENSION, 'application/octet-stream')}
+CLIP_FORMATS = {'y4m': ('.y4m', 'video/x-yuv4mpeg'), 'raw': ('.raw', 'application/octet-stream'),
+                'mp4': ('.mp4', 'video/mp4')}
+# Сколько наборов текстур помнит процесс-исполнитель: normal, reverse и
+# masked одной пары обычно запрашиваются подряд
+WORKER_MEMO_SIZE = 2
+# По скольким последним запросам считаются перцентили задержки
+LATENCY_WINDOW = 1000
+MAX_CLIP_SECONDS = 60.0
+# Наибольшая сторона результата, пикселей
+MAX_SIDE = 16384
+
+
+class ServiceError(Exception):
+    """Ошибка запроса с HTTP-кодом ответа"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# --- Процесс-исполнитель ---
+
+_memo = OrderedDict()
+
+
+def warm_worker(memory_limit=None):
+    """
+    Инициализация процесса пула: Pillow при первом вызове подгружает
+    плагины и кодеки, NumPy - свои модули. Платим за это при старте
+    сервиса, а не в первом запросе
+    """
+    if memory_limit:
+        limit_memory(memory_limit)
+    Image.init()
+    normal, _ = create_mosaic_pair(Image.new('RGB', (4, 4)), (16, 16))
+    apply_mask_correct(normal, Image.new('L', (16, 16)))
+
+
+def ping(delay=0.0):
+    # Задержка не дает одному процессу забрать все ping и оставить остальные непрогретыми
+    time.sleep(delay)
+    return os.getpid()
+
+
+def worker_textures(task):
+    """Три текстуры для пары из задания (из памяти процесса, если уже строились)"""
+    key = (task['texture_digest'], task['mask_digest'], task['size'])
+    textures = _memo.get(key)
+    if textures is not None:
+        _memo.move_to_end(key)
+        return textures, True
+
+    texture = task['texture']
+    if not is_noise_spec(texture):
+        texture = io.BytesIO(texture)
+    textures = build_textures(texture, io.BytesIO(task['mask']), task['size'])[:3]
+    _memo[key] = textures
+    while len(_memo) > WORKER_MEMO_SIZE:
+        _memo.popitem(last=False)
+    return textures, False
+
+
+def run_task(task):
+    """
+    Выполняет задание в процессе пула: пишет результат в файл task['path']
+    и возвращает (время, были ли текстуры уже в памяти процесса)
+    """
+    started = time.perf_counter()
+    (mosaic_normal, mosaic_reverse, mosaic_with_mask), warm = worker_textures(task)
+    if task['kind'] == 'texture':
+        image = {'normal': mosaic_normal, 'reverse': mosaic_reverse, 'masked': mosaic_with_mask}[task['role']]
+        save_texture(image, task['path'], task['compress'])
+    else:
+        fps = Fraction(task['fps'])
+        if task['mode'] == 'flicker':
+            frames = flicker_frames(mosaic_normal, mosaic_reverse, mosaic_with_mask,
+                                    fps, task['duration'], task['switch_interval'])
+        else:
+            frames = scroll_frames(mosaic_normal, mosaic_reverse, mosaic_with_mask,
+                                   fps, task['duration'], task['scroll_speed'])
+        output_format = 'ffmpeg' if task['format'] == 'mp4' else task['format']
+        render(frames, open_writer(task['path'], task['size'], fps, output_format))
+    return time.perf_counter() - started, warm
+
+
+# --- Сервер ---
+
+class ResultCache:
+    """Последние результаты в памяти: LRU с ограничением общего объема"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # ключ -> (данные, тип содержимого)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def fits(self, size):
+        return size <= self.max_bytes
+
+    def put(self, key, data, content_type):
+        """Кладет результат, вытесняя давно не запрошенные; слишком большой не кладется"""
+        if not self.fits(len(data)):
+            return False
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old[0])
+            self.entries[key] = (data, content_type)
+            self.nbytes += len(data)
+            while self.nbytes > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+                self.evictions += 1
+        return True
+
+    def metrics(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+def percentile(values, fraction):
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class RenderService:
+    """
+    Пул прогретых процессов, кэш результатов и учет запросов.
+
+    Запрос сначала ищется в кэше, затем среди выполняющихся (одинаковые
+    ждут один результат). Иначе он ждет свободного места: в работе не больше
+    max_concurrent заданий, а ждущих сверх max_queue сервис отклоняет
+    """
+
+    def __init__(self, workers=None, max_concurrent=None, max_queue=32, cache_bytes=512 * 1024 * 1024,
+                 tasks_per_child=None, memory_limit=None, spool_dir=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or self.workers
+        self.max_queue = max_queue
+        self.tasks_per_child = tasks_per_child
+        self.memory_limit = memory_limit
+        self.cache = ResultCache(cache_bytes)
+        self.spool_dir = spool_dir or tempfile.mkdtemp(prefix='illusion-service-')
+        self.slots = threading.BoundedSemaphore(self.max_concurrent)
+        self.lock = threading.Lock()
+        self.inflight = {}  # ключ -> Future с результатом (или None, если он не влез в кэш)
+        self.queued = 0
+        self.running = 0
+        self.counters = {'requests': 0, 'errors': 0, 'rejected': 0, 'shared': 0, 'pool_restarts': 0,
+                         'warm_worker_hits': 0}
+        self.latencies = {}  # конечная точка -> deque секунд
+        self.started = time.time()
+        self.pool = self.make_pool()
+
+    def make_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, max_tasks_per_child=self.tasks_per_child,
+                                   initializer=warm_worker, initargs=(self.memory_limit,))
+
+    def warm_up(self):
+        """Поднимает все процессы пула заранее, чтобы первый запрос их не ждал"""
+        futures = [self.pool.submit(ping, 0.1) for _ in range(self.workers)]
+        return len({future.result() for future in futures})
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def record(self, endpoint, seconds, ok=True):
+        with self.lock:
+            self.counters['requests'] += 1
+            if not ok:
+                self.counters['errors'] += 1
+            self.latencies.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def _execute(self, task):
+        """Отправляет задание в пул (с ограничением числа одновременных)"""
+        with self.lock:
+            if self.queued >= self.max_queue:
+                self.counters['rejected'] += 1
+                raise ServiceError(503, f"Очередь заполнена ({self.max_queue}), повторите позже")
+            self.queued += 1
+        self.slots.acquire()
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            pool = self.pool
+            try:
+                seconds, warm = pool.submit(run_task, task).result()
+            except BrokenProcessPool:
+                # Упавший процесс ломает весь пул - поднимаем новый для следующих запросов
+                with self.lock:
+                    if self.pool is pool:
+                        self.pool = self.make_pool()
+                        self.counters['pool_restarts'] += 1
+                raise ServiceError(500, "Процесс-исполнитель аварийно завершился")
+            if warm:
+                with self.lock:
+                    self.counters['warm_worker_hits'] += 1
+            return seconds
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.slots.release()
+
+    def process(self, key, task, content_type, respond):
+        """
+        Отдает результат задания через respond(данные или путь к файлу,
+        тип содержимого, источник): 'cache' - из кэша, 'shared' - посчитан
+        для одновременного такого же запроса, 'worker' - посчитан сейчас
+        """
+        entry = self.cache.get(key)
+        if entry is not None:
+            return respond(entry[0], entry[1], 'cache')
+
+        with self.lock:
+            shared = self.inflight.get(key)
+            if shared is None:
+                future = self.inflight[key] = Future()
+        if shared is not None:
+            data = shared.result()
+            if data is not None:
+                with self.lock:
+                    self.counters['shared'] += 1
+                return respond(data, content_type, 'shared')
+            # Результат не влез в кэш и уже отдан другому запросу - считаем сами
+            future = Future()
+
+        task = dict(task, path=os.path.join(self.spool_dir, uuid.uuid4().hex + task['extension']))
+        data = None
+        try:
+            self._execute(task)
+            if self.cache.fits(os.path.getsize(task['path'])):
+                with open(task['path'], 'rb') as file:
+                    data = file.read()
+                self.cache.put(key, data, content_type)
+                return respond(data, content_type, 'worker')
+            # Большие ролики не держим в памяти, а отдаем прямо из файла
+            return respond(task['path'], content_type, 'worker')
+        finally:
+            future.set_result(data)
+            with self.lock:
+                if self.inflight.get(key) is future:
+                    del self.inflight[key]
+            if os.path.exists(task['path']):
+                os.remove(task['path'])
+
+    def metrics(self):
+        with self.lock:
+            latency = {}
+            for endpoint, values in self.latencies.items():
+                ordered = sorted(values)
+                latency[endpoint] = {
+                    'count': len(ordered),
+                    'p50_ms': percentile(ordered, 0.5) * 1000,
+                    'p95_ms': percentile(ordered, 0.95) * 1000,
+                    'max_ms': ordered[-1] * 1000,
+                }
+            return {
+                'uptime_seconds': time.time() - self.started,
+                'workers': self.workers,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_depth': self.queued,
+                'running': self.running,
+                'inflight_keys': len(self.inflight),
+                **self.counters,
+                'latency': latency,
+                'cache': self.cache.metrics(),
+            }
+
+
+def _upload_digest(value):
+    if isinstance(value, str):
+        return str(NoiseSpec.parse(value))
+    return hashlib.sha256(value).hexdigest()
+
+
+def parse_uploads(content_type, body):
+    """Поля texture и mask из тела multipart/form-data"""
+    if not content_type or not content_type.startswith('multipart/form-data'):
+        raise ServiceError(400, "Ожидается multipart/form-data с полями texture и mask")
+    message = BytesParser(policy=HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        if name:
+            fields[name] = (part.get_filename(), part.get_payload(decode=True))
+
+    if 'mask' not in fields or 'texture' not in fields:
+        raise ServiceError(400, "Нужны поля texture и mask")
+    filename, texture = fields['texture']
+    # Текстовое поле texture - спецификация шума
+    if filename is None:
+        texture = texture.decode('utf-8').strip()
+        if not is_noise_spec(texture):
+            raise ServiceError(400, "Поле texture - файл текстуры или шум noise:ВИД[:ЗЕРНО]")
+    else:
+        _check_image('texture', texture)
+    _check_image('mask', fields['mask'][1])
+    return texture, fields['mask'][1]
+
+
+def _check_image(name, data):
+    """Загруженный файл должен читаться как изображение - иначе 400, а не ошибка в процессе пула"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise ServiceError(400, f"Поле {name} - не изображение или файл поврежден")
+
+
+def _query_value(query, name, default, convert=str):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return convert(values[0])
+    except (TypeError, ValueError, ZeroDivisionError):
+        raise ServiceError(400, f"Неверный параметр {name}: {values[0]}")
+
+
+def make_task(path, query, texture, mask):
+    """Задание для процесса пула и ключ его результата по пути и параметрам запроса"""
+    size = _query_value(query, 'size', (1920, 1080), parse_size)
+    if not all(0 < side <= MAX_SIDE for side in size):
+        raise ServiceError(400, f"Размер - от 1x1 до {MAX_SIDE}x{MAX_SIDE}")
+    task = {'texture': texture, 'mask': mask, 'texture_digest': _upload_digest(texture),
+            'mask_digest': _upload_digest(mask), 'size': size}
+
+    if path.startswith('/textures/'):
+        role = path[len('/textures/'):]
+        if role not in ROLES:
+            raise ServiceError(404, f"Неизвестная текстура: {role} (доступны: {', '.join(ROLES)})")
+        output_format = _query_value(query, 'format', 'png')
+        if output_format not in TEXTURE_FORMATS:
+            raise ServiceError(400, f"Неизвестный формат: {output_format}")
+        compress = _query_value(query, 'compress', None, int)
+        if compress is not None and not 0 <= compress <= 9:
+            raise ServiceError(400, "Уровень сжатия compress - от 0 до 9")
+        extension, content_type = TEXTURE_FORMATS[output_format]
+        task.update(kind='texture', role=role, compress=compress, extension=extension)
+        params = (role, output_format, compress)
+    elif path == '/clip':
+        mode = _query_value(query, 'mode', 'flicker')
+        output_format = _query_value(query, 'format', 'y4m')
+        if mode not in ('flicker', 'scroll') or output_format not in CLIP_FORMATS:
+            raise ServiceError(400, f"Неизвестный режим или формат: {mode}, {output_format}")
+        duration = _query_value(query, 'duration', 2.0, float)
+        if not 0 < duration <= MAX_CLIP_SECONDS:
+            raise ServiceError(400, f"Длина ролика - от 0 до {MAX_CLIP_SECONDS:g} с")
+        fps = _query_value(query, 'fps', Fraction(60), Fraction)
+        switch_interval = _query_value(query, 'switch_interval', 0.1, float)
+        if fps <= 0 or not switch_interval > 0:
+            raise ServiceError(400, "fps и switch_interval должны быть больше нуля")
+        extension, content_type = CLIP_FORMATS[output_format]
+        task.update(kind='clip', mode=mode, format=output_format, extension=extension,
+                    fps=str(fps), duration=duration, switch_interval=switch_interval,
+                    scroll_speed=_query_value(query, 'scroll_speed', 2.0, float))
+        params = (mode, output_format, task['fps'], duration, task['switch_interval'], task['scroll_speed'])
+    else:
+        raise ServiceError(404, f"Неизвестный адрес: {path}")
+
+    key = make_key('service', task['kind'], task['texture_digest'], task['mask_digest'], size, *params)
+    return key, task, content_type
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Разбор HTTP-запросов; сама работа - в RenderService"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'IllusionService/1.0'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def send_json(self, status, payload, headers=()):
+        data = json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/metrics':
+            self.send_json(200, self.service.metrics())
+        elif path == '/health':
+            self.send_json(200, {'ok': True, 'workers': self.service.workers})
+        else:
+            self.send_json(404, {'error': f"Неизвестный адрес: {path}"})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        endpoint = '/textures' if url.path.startswith('/textures/') else url.path
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > self.server.max_upload:
+                self.close_connection = True
+                raise ServiceError(413, f"Запрос больше {self.server.max_upload // (1024 * 1024)} МБ")
+            body = self.rfile.read(length)
+            texture, mask = parse_uploads(self.headers.get('Content-Type'), body)
+            key, task, content_type = make_task(url.path, parse_qs(url.query), texture, mask)
+
+            def respond(result, result_type, source):
+                self.send_result(result, result_type, source, started)
+
+            self.service.process(key, task, content_type, respond)
+            self.service.record(endpoint, time.perf_counter() - started)
+        except ServiceError as e:
+            self.service.record(endpoint, time.perf_counter() - started, ok=False)
+            self.send_json(e.status, {'error': str(e)}, [('Retry-After', '1')] if e.status == 503 else [])
+        except Exception as e:
+            self.service.record(endpoint, time.perf_counter() - started, ok=False)
+            self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def send_result(self, result, content_type, source, started):
+        size = len(result) if isinstance(result, bytes) else os.path.getsize(result)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(size))
+        self.send_header('X-Illusion-Source', source)
+        self.send_header('X-Illusion-Seconds', f"{time.perf_counter() - started:.3f}")
+        self.end_headers()
+        if isinstance(result, bytes):
+            self.wfile.write(result)
+        else:
+            with open(result, 'rb') as file:
+                shutil.copyfileobj(file, self.wfile, 1024 * 1024)
+
+    def log_message(self, format, *args):
+        # На Unix-сокете адреса клиента нет - печатаем только сам запрос
+        if self.server.verbose:
+            print(f"🌐 {format % args}")
+            sys.stdout.flush()
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, max_upload, verbose=True):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+        self.max_upload = max_upload
+        self.verbose = verbose
+
+
+class ServiceUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service, max_upload, verbose=True):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, ServiceHandler)
+        self.service = service
+        self.max_upload = max_upload
+        self.verbose = verbose
+
+
+def main(argv=None):
+    """Точка входа сервиса"""
+    parser = argparse.ArgumentParser(description="Локальный сервис подготовки текстур и роликов")
+    parser.add_argument('--host', default='127.0.0.1', help="адрес (по умолчанию только локальный)")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help="слушать Unix-сокет вместо TCP")
+    parser.add_argument('--workers', type=int, default=None, help="процессов в пуле (по умолчанию - все ядра)")
+    parser.add_argument('--max-concurrent', type=int, default=None,
+                        help="заданий в работе одновременно (по умолчанию - по числу процессов)")
+    parser.add_argument('--max-queue', type=int, default=32, help="сколько запросов может ждать, остальным - 503")
+    parser.add_argument('--cache-size', type=int, default=512, help="объем кэша результатов в памяти, МБ")
+    parser.add_argument('--max-upload', type=int, default=256, help="предельный размер запроса, МБ")
+    parser.add_argument('--tasks-per-child', type=int, default=None,
+                        help="после стольких заданий процесс пула перезапускается")
+    parser.add_argument('--memory-limit', type=int, default=None,
+                        help="предел памяти одного процесса, МБ (только Unix)")
+    parser.add_argument('--quiet', action='store_true', help="не печатать каждый запрос")
+    args = parser.parse_args(argv)
+
+    service = RenderService(args.workers, args.max_concurrent, args.max_queue, args.cache_size * 1024 * 1024,
+                            args.tasks_per_child, args.memory_limit * 1024 * 1024 if args.memory_limit else None)
+    started = time.perf_counter()
+    processes = service.warm_up()
+    print(f"🔥 Пул прогрет: процессов {processes} за {time.perf_counter() - started:.1f} с")
+
+    max_upload = args.max_upload * 1024 * 1024
+    if args.socket:
+        server = ServiceUnixServer(args.socket, service, max_upload, not args.quiet)
+        where = args.socket
+    else:
+        server = ServiceHTTPServer((args.host, args.port), service, max_upload, not args.quiet)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    print(f"🚀 Сервис слушает {where} (метрики: /metrics), Ctrl+C - остановка")
+    sys.stdout.flush()
+    # По SIGTERM тоже останавливаемся штатно: убираем сокет и временные файлы
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Остановка...")
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Замер времени каждого кадра демонстрации.
+
+Кадр делится на участки: обработка событий, blit, flip (показ кадра) и
+простой внутри clock.tick. Для каждого участка хранится скользящее окно
+последних кадров, по которому считаются p50/p95/p99. Статистику можно
+показать поверх картинки (F1) и выгрузить в JSON или CSV после выхода.
+"""
+import csv
+import json
+import time
+from collections import deque
+
+from lazy import lazy_import
+
+pygame = lazy_import('pygame')
+
+SECTIONS = ('events', 'blit', 'flip', 'idle')
+
+
+def percentile(sorted_values, q):
+    """Перцентиль q (0..100) по уже отсортированному списку, с интерполяцией"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
+
+
+class FrameStats:
+    """Скользящая статистика времени кадра по участкам, в миллисекундах"""
+
+    def __init__(self, window=600):
+        self.window = window
+        self.samples = {name: deque(maxlen=window) for name in SECTIONS + ('total',)}
+        self.frame_count = 0
+        self.extra_lines = []  # функции, которые дописывают строки в lines() (очереди и т.п.)
+        self._current = None
+        self._frame_start = 0.0
+        self._mark = 0.0
+
+    def begin_frame(self):
+        """Начинает замер нового кадра"""
+        self._frame_start = self._mark = time.perf_counter()
+        self._current = dict.fromkeys(SECTIONS, 0.0)
+
+    def mark(self, section):
+        """Относит время с предыдущей отметки к участку section"""
+        now = time.perf_counter()
+        self._current[section] += (now - self._mark) * 1000
+        self._mark = now
+
+    def end_frame(self):
+        """Завершает кадр и добавляет его в окно"""
+        for name in SECTIONS:
+            self.samples[name].append(self._current[name])
+        self.samples['total'].append((time.perf_counter() - self._frame_start) * 1000)
+        self.frame_count += 1
+
+    def summary(self):
+        """Словарь участок -> p50/p95/p99/среднее/максимум за окно"""
+        result = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            result[name] = {
+                'p50': percentile(ordered, 50),
+                'p95': percentile(ordered, 95),
+                'p99': percentile(ordered, 99),
+                'mean': sum(ordered) / len(ordered) if ordered else 0.0,
+                'max': ordered[-1] if ordered else 0.0,
+            }
+        return result
+
+    def lines(self):
+        """Строки для вывода на экран или в консоль"""
+        summary = self.summary()
+        total = summary['total']['mean']
+        fps = 1000 / total if total else 0.0
+        lines = [f"кадров: {self.frame_count}  FPS: {fps:.1f}",
+                 f"{'мс':<7}{'p50':>7}{'p95':>7}{'p99':>7}"]
+        for name in SECTIONS + ('total',):
+            values = summary[name]
+            lines.append(f"{name:<7}{values['p50']:>7.2f}{values['p95']:>7.2f}{values['p99']:>7.2f}")
+        lines.extend(line() for line in self.extra_lines)
+        return lines
+
+    def export(self, path):
+        """Сохраняет статистику: .csv - покадрово, иначе JSON со сводкой и кадрами"""
+        columns = SECTIONS + ('total',)
+        rows = list(zip(*(self.samples[name] for name in columns)))
+
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(('frame',) + columns)
+                first = self.frame_count - len(rows)
+                for index, row in enumerate(rows):
+                    writer.writerow((first + index,) + tuple(f"{value:.4f}" for value in row))
+        else:
+            with open(path, 'w') as file:
+                json.dump({
+                    'frames_total': self.frame_count,
+                    'window': self.window,
+                    'summary_ms': self.summary(),
+                    'frames_ms': [dict(zip(columns, row)) for row in rows],
+                }, file, indent=2)
+
+
+class StatsHud:
+    """Непрозрачная панель со статистикой в углу экрана (постоянного размера)"""
+
+    def __init__(self, stats, position=(10, 10), refresh_frames=15):
+        self.stats = stats
+        self.refresh_frames = refresh_frames
+        pygame.font.init()
+        self.font = pygame.font.SysFont('monospace', 14)
+        line_height = self.font.get_linesize()
+        width = self.font.size('M' * 36)[0] + 12
+        height = line_height * (len(SECTIONS) + 3 + len(stats.extra_lines)) + 12
+        self.rect = pygame.Rect(position, (width, height))
+        self.panel = pygame.Surface(self.rect.size)
+        self._rendered_at = None
+
+    def draw(self, surface):
+        """Рисует панель (текст обновляется раз в refresh_frames кадров), возвращает ее прямоугольник"""
+        if self._rendered_at is None or self.stats.frame_count - self._rendered_at >= self.refresh_frames:
+            self.panel.fill((0, 0, 0))
+            for index, line in enumerate(self.stats.lines()):
+                text = self.font.render(line, True, (0, 255, 0))
+                self.panel.blit(text, (6, 6 + index * self.font.get_linesize()))
+            self._rendered_at = self.stats.frame_count
+        surface.blit(self.panel, self.rect)
+        return self.rect
@@ -0,0 +1,471 @@
+"""
+Потоковая подготовка текстур полосами - для огромных масок и размеров.
+
+apply_mask_correct масштабирует маску целиком и держит в памяти несколько
+полноразмерных копий, поэтому на масках 16K памяти не хватает. Здесь три
+текстуры считаются горизонтальными полосами: мозаики собираются из плитки
+(VirtualMosaic), а для альфа-канала полосы масштабируется только кусок
+исходной маски - строки, которые захватывает фильтр LANCZOS, с теми же
+весами, что и у полного масштабирования. Полосы стыкуются без швов и
+совпадают с полным расчетом байт в байт. Готовые полосы сразу дописываются
+в файлы (PNG или ILLF), целиком результат в памяти не бывает. PNG-маска
+тоже читается по строкам сверху вниз (PngRowReader), целиком в память она
+не загружается. Полосы можно считать в пуле процессов.
+
+Пример:
+    python stream.py 01.jpg mask_16k.png --size 15360x8640 -o projection --workers 4
+"""
+import argparse
+import io
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from framefile import FrameFileWriter
+from mosaic import LANCZOS_SUPPORT, VirtualMosaic, mask_source
+from noise import is_noise_spec
+from options import parse_size
+from pipeline import FRAME_EXTENSION, output_names
+from tracing import finish as finish_trace, run_traced, span, tracer
+
+BAND_HEIGHT = 256
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COLOR_TYPES = {'L': 0, 'RGB': 2, 'RGBA': 6}
+# Сколько сжатых данных копить до записи очередного блока IDAT
+PNG_CHUNK_BYTES = 1024 * 1024
+# Байт на пиксель у 8-битного PNG -> (тип цвета, режим), под которым Pillow
+# снимает фильтры строк с той же шириной шага фильтра
+PNG_UNFILTER_TYPES = {1: (0, 'L'), 2: (4, 'LA'), 3: (2, 'RGB'), 4: (6, 'RGBA')}
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# Сколько строк маски распаковывать за один шаг
+READ_ROWS = 256
+# Точность целочисленных весов фильтра в Pillow (8 бит значения + 2 на перехлест)
+PRECISION_BITS = 32 - 8 - 2
+
+
+class PngStreamWriter:
+    """
+    PNG, который пишется полосами: строки фильтруются (фильтр Up - разность с
+    предыдущей строкой, мозаике он подходит лучше всего) и сжимаются по мере
+    поступления. Файл появляется под своим именем только после close()
+    """
+
+    def __init__(self, path, size, mode, compress_level=None):
+        if mode not in PNG_COLOR_TYPES:
+            raise ValueError(f"Неподдерживаемый режим PNG: {mode}")
+        self.path = path
+        self.size = size
+        self.mode = mode
+        self.rows = 0
+        self.previous = None
+        self.pending = []
+        self.pending_bytes = 0
+        self.compressor = zlib.compressobj(6 if compress_level is None else compress_level)
+        self.temp_path = f"{path}.{os.getpid()}.tmp"
+        self.file = open(self.temp_path, 'wb')
+        self.file.write(PNG_SIGNATURE)
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', size[0], size[1], 8, PNG_COLOR_TYPES[mode], 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)) + kind + data)
+        self.file.write(struct.pack('>I', zlib.crc32(kind + data)))
+
+    def _compressed(self, data):
+        if data:
+            self.pending.append(data)
+            self.pending_bytes += len(data)
+        if self.pending_bytes >= PNG_CHUNK_BYTES:
+            self._flush_idat()
+
+    def _flush_idat(self):
+        if self.pending:
+            self._chunk(b'IDAT', b''.join(self.pending))
+        self.pending = []
+        self.pending_bytes = 0
+
+    def write(self, band):
+        """Дописывает полосу (изображение во всю ширину кадра)"""
+        if band.mode != self.mode or band.width != self.size[0]:
+            raise ValueError("Полоса не совпадает с кадром по режиму или ширине")
+        rows = np.asarray(band).reshape(band.height, -1)
+        if self.previous is None:
+            # Для первой строки предыдущая по стандарту - нулевая
+            self.previous = np.zeros(rows.shape[1], dtype=np.uint8)
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 2  # фильтр Up
+        np.subtract(rows[0], self.previous, out=filtered[0, 1:])
+        np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+        self.previous = rows[-1].copy()
+        self._compressed(self.compressor.compress(filtered.tobytes()))
+        self.rows += band.height
+
+    def close(self):
+        self._compressed(self.compressor.flush())
+        self._flush_idat()
+        self._chunk(b'IEND', b'')
+        self.file.close()
+        if self.rows != self.size[1]:
+            os.remove(self.temp_path)
+            raise ValueError(f"Записано строк {self.rows} из {self.size[1]}: {self.path}")
+        os.replace(self.temp_path, self.path)
+        return self.path
+
+
+def open_band_writer(path, size, mode, compress_level=None):
+    """Писатель полос по расширению: .illf - файл кадра, иначе PNG"""
+    if path.endswith(FRAME_EXTENSION):
+        return FrameFileWriter(path, size, mode)
+    return PngStreamWriter(path, size, mode, compress_level)
+
+
+class PngRowReader:
+    """
+    Строки PNG-маски по порядку сверху вниз без загрузки всего файла.
+
+    Данные IDAT распаковываются потоково (zlib), а фильтры строк снимает сам
+    Pillow: каждый шаг заворачивается в маленький PNG, первой строкой
+    которого идет уже раскодированная предыдущая строка без фильтра. В памяти
+    только строки, которые еще могут понадобиться (crop идет сверху вниз).
+    Поддерживаются неперемежающиеся PNG глубиной до 8 бит; для остальных
+    open_mask_rows загружает маску целиком
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            if self.file.read(8) != PNG_SIGNATURE:
+                raise ValueError(f"Это не PNG: {path}")
+            self.idat = self._idat_chunks()
+            header = next(self.idat)
+            self.width, self.height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', header)
+            if depth > 8 or interlace or color_type not in PNG_CHANNELS:
+                raise ValueError(f"Построчно читаются только PNG до 8 бит без перемежения: {path}")
+            bits = depth * PNG_CHANNELS[color_type]
+            self.stride = (self.width * bits + 7) // 8
+            self.pixel_bytes = max(1, bits // 8)
+            with Image.open(path) as image:
+                self.mode = image.mode
+                self.rawmode = image.tile[0].args
+                self.palette = image.getpalette() if image.mode == 'P' else None
+        except BaseException:
+            self.file.close()
+            raise
+        self.decompressor = zlib.decompressobj()
+        self.pending = b''
+        self.position = 0  # сколько строк уже распаковано
+        self.top = 0  # первая строка в rows
+        self.rows = b''
+        self.last = bytes(self.stride)  # предыдущая строка без фильтра (до первой - нули)
+
+    def _idat_chunks(self):
+        """Первым - данные IHDR, дальше содержимое блоков IDAT по порядку"""
+        while True:
+            length, kind = struct.unpack('>I4s', self.file.read(8))
+            data = self.file.read(length)
+            self.file.read(4)
+            if kind in (b'IHDR', b'IDAT'):
+                yield data
+            elif kind == b'IEND':
+                return
+
+    def _filtered(self, size):
+        """Следующие size байт распакованного потока (строки с байтом фильтра)"""
+        parts = [self.pending]
+        have = len(self.pending)
+        while have < size:
+            data = self.decompressor.unconsumed_tail or next(self.idat, b'')
+            if not data:
+                raise ValueError("PNG обрезан: строк меньше, чем в заголовке")
+            part = self.decompressor.decompress(data, size - have)
+            parts.append(part)
+            have += len(part)
+        data = b''.join(parts)
+        self.pending = data[size:]
+        return data[:size]
+
+    def _unfilter(self, count):
+        """Снимает фильтры со следующих count строк; возвращает байты строк"""
+        color_type, mode = PNG_UNFILTER_TYPES[self.pixel_bytes]
+        width = self.stride // self.pixel_bytes
+        data = b'\0' + self.last + self._filtered(count * (self.stride + 1))
+        png = [PNG_SIGNATURE]
+        for kind, payload in ((b'IHDR', struct.pack('>IIBBBBB', width, count + 1, 8, color_type, 0, 0, 0)),
+                              (b'IDAT', zlib.compress(data, 0)), (b'IEND', b'')):
+            png.append(struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload)))
+        with Image.open(io.BytesIO(b''.join(png))) as image:
+            if image.mode != mode:
+                raise ValueError(f"Неожиданный режим при снятии фильтров: {image.mode}")
+            rows = image.tobytes()[self.stride:]
+        self.last = rows[-self.stride:]
+        self.position += count
+        return rows
+
+    def crop(self, box):
+        """Строки [top, bottom) во всю ширину как изображение (box как у Image.crop)"""
+        _, top, _, bottom = box
+        if top < self.top:
+            raise ValueError("Строки маски читаются только сверху вниз")
+        # Строки выше top больше не понадобятся
+        skip = min(top, self.position) - self.top
+        self.rows = self.rows[skip * self.stride:]
+        self.top += skip
+        while self.position < top:
+            # Пропуск: строки распаковываются, но не хранятся
+            self._unfilter(min(READ_ROWS, top - self.position))
+            self.top = self.position
+        parts = [self.rows]
+        while self.position < bottom:
+            parts.append(self._unfilter(min(READ_ROWS, bottom - self.position)))
+        self.rows = b''.join(parts)
+        data = self.rows[(top - self.top) * self.stride:(bottom - self.top) * self.stride]
+        strip = Image.frombytes(self.mode, (self.width, bottom - top), data, 'raw', self.rawmode)
+        if self.palette is not None:
+            strip.putpalette(self.palette)
+        return mask_source(strip)
+
+    def close(self):
+        self.file.close()
+
+
+def open_mask_rows(path):
+    """
+    Маска для band_tasks: PNG читается построчно (PngRowReader), остальное
+    загружается целиком (только канал, от которого зависит альфа)
+    """
+    try:
+        return PngRowReader(path)
+    except (ValueError, struct.error):
+        with Image.open(path) as mask:
+            mask = mask_source(mask)
+            mask.load()
+        return mask
+
+
+def lanczos(x):
+    """Фильтр LANCZOS (a = 3) в точности как в Pillow: sinc(x) * sinc(x / 3)"""
+    if not -LANCZOS_SUPPORT <= x < LANCZOS_SUPPORT:
+        return 0.0
+    if x == 0.0:
+        return 1.0
+    near = x * math.pi
+    far = x / LANCZOS_SUPPORT * math.pi
+    return math.sin(near) / near * (math.sin(far) / far)
+
+
+def vertical_weights(in_height, out_height, top, bottom):
+    """
+    Веса вертикального прохода LANCZOS для строк результата [top, bottom)
+    при масштабировании всей маски с высоты in_height на out_height. Расчет
+    повторяет Pillow (precompute_coeffs и целые веса с точностью 22 бита)
+    операция в операцию, поэтому полоса совпадает с полным resize байт в байт -
+    resize с box считает центры пикселей от начала области и на дробном
+    масштабе расходится с полным на единицу в отдельных пикселях.
+    Возвращает (первая строка маски, индексы строк от нее, веса); индексы и
+    веса - массивы (bottom - top, ksize)
+    """
+    scale = in_height / out_height
+    filterscale = max(scale, 1.0)
+    support = LANCZOS_SUPPORT * filterscale
+    step = 1.0 / filterscale
+    ksize = math.ceil(support) * 2 + 1
+    starts = np.zeros(bottom - top, dtype=np.int64)
+    counts = np.zeros(bottom - top, dtype=np.int64)
+    weights = np.zeros((bottom - top, ksize), dtype=np.int32)
+    for row in range(top, bottom):
+        center = (row + 0.5) * scale
+        low = max(int(center - support + 0.5), 0)
+        count = min(int(center + support + 0.5), in_height) - low
+        values = [lanczos((x + low - center + 0.5) * step) for x in range(count)]
+        total = 0.0
+        for value in values:
+            total += value
+        for x, value in enumerate(values):
+            if total != 0.0:
+                value /= total
+            weights[row - top, x] = int(value * (1 << PRECISION_BITS) + (-0.5 if value < 0 else 0.5))
+        starts[row - top] = low
+        counts[row - top] = count
+    first = int(starts.min())
+    # У лишних весов (нулевых) индекс - последняя строка окна, за кусок маски он не выходит
+    taps = np.minimum(np.arange(ksize)[None, :], counts[:, None] - 1)
+    return first, starts[:, None] - first + taps, weights
+
+
+def band_alpha(strip, width, taps=None):
+    """
+    Альфа-канал полосы текстуры с маской из куска маски strip. Горизонтальный
+    проход делает Pillow (для каждой строки он тот же, что и при полном
+    масштабировании), вертикальный - numpy с весами taps = (индексы строк
+    куска, веса) из vertical_weights; None - высота не меняется, кусок и есть
+    полоса
+    """
+    if strip.width != width:
+        strip = strip.resize((width, strip.height), Image.Resampling.LANCZOS)
+    if taps is None:
+        alpha = strip
+    else:
+        rows = np.asarray(strip)
+        indices, weights = taps
+        shape = (len(weights),) + (1,) * (rows.ndim - 1)
+        total = np.full((len(weights),) + rows.shape[1:], 1 << (PRECISION_BITS - 1), dtype=np.int32)
+        for tap in range(weights.shape[1]):
+            total += rows[indices[:, tap]] * weights[:, tap].reshape(shape)
+        alpha = Image.fromarray(np.clip(total >> PRECISION_BITS, 0, 255).astype(np.uint8), strip.mode)
+    return alpha if alpha.mode == 'L' else alpha.convert('L')
+
+
+def render_band(tile, size, top, bottom, strip, taps):
+    """
+    Считает одну полосу трех текстур (в этом процессе или в процессе пула).
+    Возвращает (обычная, обратная, с маской) как изображения высотой bottom - top
+    """
+    width = size[0]
+    with span('mosaic.normal', top=top):
+        normal = VirtualMosaic(None, size, False, tile).region((0, top, width, bottom))
+    with span('mosaic.reverse', top=top):
+        reverse = VirtualMosaic(None, size, True, tile).region((0, top, width, bottom))
+    with span('mask.resize', top=top):
+        alpha = band_alpha(strip, width, taps)
+    with span('mask.composite', top=top):
+        masked = normal.convert('RGBA')
+        masked.putalpha(alpha)
+    return normal, reverse, masked
+
+
+def band_strip(mask, height, top, bottom):
+    """
+    Кусок маски и веса для band_alpha, чтобы получить строки [top, bottom)
+    альфа-канала высотой height
+    """
+    if mask.height == height:
+        return mask.crop((0, top, mask.width, bottom)), None
+    # Из маски отрезаются ровно те строки, на которые у полосы есть веса
+    first, indices, weights = vertical_weights(mask.height, height, top, bottom)
+    strip = mask.crop((0, first, mask.width, first + int(indices.max()) + 1))
+    return strip, (indices, weights)
+
+
+def band_tasks(tile, mask, size, band_height):
+    """Аргументы render_band для каждой полосы сверху вниз"""
+    height = size[1]
+    for top in range(0, height, band_height):
+        bottom = min(top + band_height, height)
+        yield (tile, size, top, bottom) + band_strip(mask, height, top, bottom)
+
+
+def stream_textures(texture_path, mask_path, output_dir, output_size, output_format='png',
+                    compress_level=None, band_height=BAND_HEIGHT, workers=0, on_band=None):
+    """
+    Строит три текстуры полосами и сразу пишет их в output_dir.
+    workers > 0 - полосы считаются в пуле процессов (по порядку, не больше
+    двух полос на процесс в работе). Возвращает словарь путей по ролям
+    """
+    if is_noise_spec(texture_path):
+        raise ValueError("Полосами собирается только мозаика из плитки, шум noise:... не поддерживается")
+    with Image.open(texture_path) as base_texture:
+        tile = np.asarray(base_texture.convert('RGB'))
+    # Маска читается полосами строк по мере надобности
+    mask = open_mask_rows(mask_path)
+
+    names = output_names(output_size, output_format)
+    os.makedirs(output_dir, exist_ok=True)
+    modes = {'normal': 'RGB', 'reverse': 'RGB', 'masked': 'RGBA'}
+    writers = {role: open_band_writer(os.path.join(output_dir, names[role]), output_size, mode, compress_level)
+               for role, mode in modes.items()}
+
+    def write(bands):
+        for role, band in zip(('normal', 'reverse', 'masked'), bands):
+            with span('save', file=names[role]):
+                writers[role].write(band)
+        if on_band is not None:
+            on_band(writers['normal'].rows, output_size[1])
+
+    try:
+        tasks = band_tasks(tile, mask, output_size, band_height)
+        if not workers:
+            for task in tasks:
+                write(render_band(*task))
+        else:
+            traced = tracer.enabled
+
+            def collect(future):
+                if not traced:
+                    return future.result()
+                # Записи участков из процесса пула переносим в трассу этого процесса
+                bands, events = future.result()
+                tracer.add_events(events)
+                return bands
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for task in tasks:
+                    pending.append(pool.submit(run_traced, render_band, *task) if traced
+                                   else pool.submit(render_band, *task))
+                    if len(pending) >= workers * 2:
+                        write(collect(pending.popleft()))
+                while pending:
+                    write(collect(pending.popleft()))
+    except BaseException:
+        for writer in writers.values():
+            writer.file.close()
+            if os.path.exists(writer.temp_path):
+                os.remove(writer.temp_path)
+        raise
+    finally:
+        mask.close()
+    return {role: writer.close() for role, writer in writers.items()}
+
+
+def main(argv=None):
+    """Точка входа потоковой подготовки"""
+    parser = argparse.ArgumentParser(description="Подготовка текстур полосами для огромных масок и размеров")
+    parser.add_argument('texture', help="файл начальной текстуры")
+    parser.add_argument('mask', help="файл маски (PNG)")
+    parser.add_argument('-o', '--output', default='mosaic_textures', help="папка результатов")
+    parser.add_argument('--size', type=parse_size, default=None,
+                        help="размер текстур (по умолчанию - размер маски)")
+    parser.add_argument('--band-height', type=int, default=BAND_HEIGHT, help="высота полосы, строк")
+    parser.add_argument('--workers', type=int, default=0, help="процессов для полос (0 - в этом процессе)")
+    parser.add_argument('--save-format', choices=('png', 'raw'), default='png',
+                        help="формат файлов результатов: png или несжатый файл кадра .illf")
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=None, metavar='0-9',
+                        help="уровень сжатия PNG (0 - без сжатия, быстрее всего)")
+    parser.add_argument('--trace', nargs='?', const='', metavar='FILE',
+                        help="замерить этапы (время и память) и напечатать сводку; "
+                             "с FILE - сохранить трассу Chrome (JSON)")
+    args = parser.parse_args(argv)
+    if args.trace is not None:
+        tracer.enable()
+
+    size = args.size
+    if size is None:
+        with Image.open(args.mask) as mask:
+            size = mask.size
+    print(f"=== Потоковая подготовка {size[0]}x{size[1]}: полосы по {args.band_height} строк, "
+          f"процессов: {args.workers or 1} ===")
+
+    def progress(rows, height):
+        print(f"\r   Готово строк: {rows}/{height} ({rows / height:.0%})", end='')
+        sys.stdout.flush()
+
+    started = time.perf_counter()
+    paths = stream_textures(args.texture, args.mask, args.output, size, args.save_format,
+                            args.compress_level, args.band_height, args.workers, progress)
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ Готово за {elapsed:.1f} с")
+    for path in paths.values():
+        print(f"  • {path}")
+    finish_trace(args.trace)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Сцена layers.py: объекты слоев с маской видны поверх фона и анимируются"""
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+from PIL import Image, ImageDraw
+
+from layers import Compositor, build_layer
+
+SIZE = (320, 180)
+OBJECTS = {'cat.png': (30, 40, 110, 120), 'dog.png': (190, 50, 290, 150)}
+
+
+def centre(box):
+    return (box[0] + box[2]) // 2, (box[1] + box[3]) // 2
+
+
+def make_scene(tmp_path):
+    """Неподвижный фон и два мерцающих объекта с масками (белые вокруг, черные на объекте)"""
+    rng = np.random.default_rng(0)
+    for name in ('back.png', 'cat_texture.png', 'dog_texture.png'):
+        Image.fromarray(rng.integers(0, 256, (20, 24, 3), dtype=np.uint8), 'RGB').save(tmp_path / name)
+    for name, box in OBJECTS.items():
+        mask = Image.new('L', SIZE, 255)
+        ImageDraw.Draw(mask).ellipse(box, fill=0)
+        mask.save(tmp_path / name)
+    specs = [
+        {'name': 'фон', 'texture': str(tmp_path / 'back.png')},
+        {'name': 'кот', 'texture': str(tmp_path / 'cat_texture.png'), 'mask': str(tmp_path / 'cat.png'),
+         'animation': 'flicker', 'interval': 0.1},
+        {'name': 'пес', 'texture': str(tmp_path / 'dog_texture.png'), 'mask': str(tmp_path / 'dog.png'),
+         'animation': 'flicker', 'interval': 0.2, 'phase': 1},
+    ]
+    return [build_layer(spec, SIZE, fps=60, order=index) for index, spec in enumerate(specs)]
+
+
+def render(compositor, frame):
+    target = pygame.Surface(SIZE)
+    compositor.draw(target, frame, full=True)
+    return pygame.surfarray.array3d(target).transpose(1, 0, 2)
+
+
+def test_masked_objects_flicker_over_background(tmp_path):
+    compositor = Compositor(SIZE, make_scene(tmp_path))
+    first = render(compositor, 0)
+    # Кот меняет фазу каждые 6 кадров, пес - каждые 12: к кадру 18 сменились оба
+    later = render(compositor, 18)
+    for box in OBJECTS.values():
+        x, y = centre(box)
+        assert not np.array_equal(first[y, x], later[y, x])
+    # Вне объектов виден неподвижный фон
+    changed = np.any(first != later, axis=2)
+    assert not changed[0:30, :].any() and not changed[:, 120:180].any()
+
+
+def test_dirty_rects_cover_only_objects(tmp_path):
+    layers = make_scene(tmp_path)
+    compositor = Compositor(SIZE, layers)
+    reference = Compositor(SIZE, layers)
+    full = pygame.Surface(SIZE)
+    incremental = pygame.Surface(SIZE)
+    compositor.draw(incremental, 0, full=True)
+    for frame in range(1, 30):
+        dirty = compositor.draw(incremental, frame)
+        for rect in dirty:
+            assert rect.width * rect.height < SIZE[0] * SIZE[1] / 4
+        reference.draw(full, frame, full=True)
+        assert np.array_equal(pygame.surfarray.array3d(incremental), pygame.surfarray.array3d(full))
@@ -0,0 +1,53 @@
+"""Полосовая подготовка stream.py совпадает с обычной pipeline.build_textures"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from pipeline import build_textures
+from stream import PngRowReader, stream_textures
+
+OUTPUT_SIZE = (480, 270)
+
+
+def make_mask(mode, size=(250, 150)):
+    """Маска с плавным переходом и резкими краями, в нужном режиме"""
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    gray = ((x * 255 // size[0]) ^ (y * 7 % 256)).astype(np.uint8)
+    gray[40:90, 60:160] = 255
+    image = Image.fromarray(gray, 'L')
+    if mode == 'P':
+        return image.convert('P', palette=Image.Palette.ADAPTIVE, colors=16)
+    if mode == 'LA':
+        return Image.merge('LA', (image, image.point(lambda value: 255 - value)))
+    return image.convert(mode)
+
+
+@pytest.mark.parametrize('mode', ['L', 'P', '1', 'LA', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('mask_size', [(250, 150), (1000, 700)])
+def test_stream_matches_build_textures(tmp_path, mode, mask_size):
+    texture_path = str(tmp_path / 'texture.png')
+    mask_path = str(tmp_path / 'mask.png')
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 256, (40, 30, 3), dtype=np.uint8), 'RGB').save(texture_path)
+    make_mask(mode, mask_size).save(mask_path)
+
+    expected = build_textures(texture_path, mask_path, OUTPUT_SIZE)[:3]
+    paths = stream_textures(texture_path, mask_path, str(tmp_path / 'out'), OUTPUT_SIZE, band_height=64)
+    for role, image in zip(('normal', 'reverse', 'masked'), expected):
+        with Image.open(paths[role]) as streamed:
+            assert streamed.mode == image.mode
+            assert np.array_equal(np.asarray(streamed), np.asarray(image)), role
+
+
+@pytest.mark.parametrize('mode', ['L', 'P', '1', 'LA', 'RGB', 'RGBA'])
+def test_png_row_reader_matches_full_load(tmp_path, mode):
+    mask_path = str(tmp_path / 'mask.png')
+    make_mask(mode).save(mask_path)
+    reader = PngRowReader(mask_path)
+    with Image.open(mask_path) as mask:
+        for top, bottom in ((0, 10), (5, 70), (70, 71), (120, 150)):
+            expected = mask.crop((0, top, mask.width, bottom))
+            expected = expected.getchannel('A') if mode == 'RGBA' else expected
+            expected = expected if expected.mode in ('L', 'RGB') else expected.convert('L')
+            assert np.array_equal(np.asarray(reader.crop((0, top, reader.width, bottom))), np.asarray(expected))
+    reader.close()
@@ -0,0 +1,241 @@
+"""
+Трассировка этапов подготовки текстур.
+
+Этапы (загрузка, построение мозаик, масштабирование маски, наложение,
+сохранение, перевод в pygame, масштабирование под окно) обернуты в
+span(имя). Пока трассировка выключена, span возвращает один общий пустой
+объект и ничего не замеряет. Включенная (--trace) записывает для каждого
+участка время и память:
+- rss - сколько прибавила резидентная память процесса (видны и буферы
+  Pillow, которых tracemalloc не видит);
+- alloc - пик выделений Python и NumPy внутри участка по tracemalloc.
+
+Записи выгружаются в формате Chrome trace (chrome://tracing, Perfetto) или
+печатаются сводной таблицей по этапам.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def resident_bytes():
+    """Текущая резидентная память процесса (на Linux; иначе пиковая по getrusage)"""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # На macOS ru_maxrss в байтах, на остальных Unix - в КБ
+    scale = 1 if os.uname().sysname == 'Darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class _NullSpan:
+    """Участок при выключенной трассировке: ничего не делает"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Один замеряемый участок"""
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0.0
+        self.rss = 0
+        self.alloc_start = 0
+        self.alloc_peak = 0
+
+    def __enter__(self):
+        self.tracer._enter(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._exit(self)
+        return False
+
+
+class Tracer:
+    """
+    Собирает участки всех потоков процесса. Память (RSS и tracemalloc) общая
+    на процесс, поэтому при параллельных участках она засчитывается каждому
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.open_spans = []
+        self.lock = threading.Lock()
+        self.started_tracemalloc = False
+
+    def enable(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def _update_peaks(self):
+        # Пик tracemalloc один на процесс: раздаем его открытым участкам и сбрасываем
+        current, peak = tracemalloc.get_traced_memory()
+        for span in self.open_spans:
+            span.alloc_peak = max(span.alloc_peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def _enter(self, span):
+        with self.lock:
+            current = self._update_peaks()
+            span.alloc_start = span.alloc_peak = current
+            self.open_spans.append(span)
+        span.rss = resident_bytes()
+        span.start = time.perf_counter()
+
+    def _exit(self, span):
+        finished = time.perf_counter()
+        rss = resident_bytes()
+        with self.lock:
+            self._update_peaks()
+            self.open_spans.remove(span)
+            self.events.append({
+                'name': span.name,
+                'start': span.start,
+                'seconds': finished - span.start,
+                'rss': rss - span.rss,
+                'alloc': span.alloc_peak - span.alloc_start,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'thread': threading.current_thread().name,
+                'args': span.args,
+            })
+
+    def drain(self):
+        """Забирает накопленные записи (например, чтобы передать из процесса пула)"""
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def add_events(self, events):
+        """Добавляет записи, снятые в другом процессе"""
+        with self.lock:
+            self.events.extend(events)
+
+
+tracer = Tracer()
+
+
+def span(name, **args):
+    """
+    Контекстный менеджер участка трассировки: with span('mosaic.field'): ...
+    При выключенной трассировке - общий пустой объект
+    """
+    if not tracer.enabled:
+        return NULL_SPAN
+    return Span(tracer, name, args)
+
+
+def chrome_trace(events):
+    """Записи в формате Chrome trace event (полные события 'X', время в мкс)"""
+    trace_events = []
+    threads = {}
+    origin = min((event['start'] for event in events), default=0.0)
+    for event in events:
+        threads[(event['pid'], event['tid'])] = event['thread']
+        args = dict(event['args'])
+        args.update(rss_bytes=event['rss'], alloc_bytes=event['alloc'])
+        trace_events.append({
+            'name': event['name'],
+            'cat': event['name'].split('.')[0],
+            'ph': 'X',
+            'ts': (event['start'] - origin) * 1e6,
+            'dur': event['seconds'] * 1e6,
+            'pid': event['pid'],
+            'tid': event['tid'],
+            'args': {key: value if isinstance(value, (int, float, bool)) or value is None else str(value)
+                     for key, value in args.items()},
+        })
+    for (pid, tid), name in threads.items():
+        trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                             'args': {'name': name}})
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+
+def write_chrome_trace(path, events=None):
+    """Сохраняет записи в JSON для chrome://tracing или Perfetto"""
+    with open(path, 'w') as file:
+        json.dump(chrome_trace(tracer.events if events is None else events), file)
+    return path
+
+
+def summary_table(events=None):
+    """Сводная таблица по этапам: число участков, время, память"""
+    events = tracer.events if events is None else events
+    if not events:
+        return "трассировка пуста"
+    stages = {}
+    for event in events:
+        stage = stages.setdefault(event['name'], {'count': 0, 'seconds': 0.0, 'max': 0.0, 'rss': 0, 'alloc': 0})
+        stage['count'] += 1
+        stage['seconds'] += event['seconds']
+        stage['max'] = max(stage['max'], event['seconds'])
+        stage['rss'] += event['rss']
+        stage['alloc'] = max(stage['alloc'], event['alloc'])
+
+    megabyte = 1024 * 1024
+    lines = [f"{'Этап':<24} {'раз':>5} {'всего, мс':>10} {'сред., мс':>10} {'макс., мс':>10} "
+             f"{'RSS, МБ':>8} {'пик alloc, МБ':>14}"]
+    for name, stage in sorted(stages.items(), key=lambda item: -item[1]['seconds']):
+        lines.append(f"{name:<24} {stage['count']:>5} {stage['seconds'] * 1000:>10.1f} "
+                     f"{stage['seconds'] * 1000 / stage['count']:>10.2f} {stage['max'] * 1000:>10.1f} "
+                     f"{stage['rss'] / megabyte:>8.1f} {stage['alloc'] / megabyte:>14.1f}")
+    return "\n".join(lines)
+
+
+def finish(path=None, file=None):
+    """Печатает сводную таблицу (в file, по умолчанию stdout) и, если задан путь, сохраняет Chrome trace"""
+    if not tracer.enabled and not tracer.events:
+        return
+    print("\n⏱️  Трассировка этапов:", file=file)
+    print(summary_table(), file=file)
+    if path:
+        write_chrome_trace(path)
+        print(f"📈 Трасса сохранена: {os.path.abspath(path)} (открыть в chrome://tracing или ui.perfetto.dev)",
+              file=file)
+
+
+def run_traced(function, *args):
+    """
+    Выполняет function(*args) с включенной трассировкой (в процессе пула) и
+    возвращает (результат, записи) - записи добавляются к трассе основного
+    процесса через tracer.add_events
+    """
+    tracer.enable()
+    try:
+        return function(*args), tracer.drain()
+    finally:
+        tracer.disable()
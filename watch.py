@@ -0,0 +1,284 @@
+"""
+Горячая перезагрузка текстуры и маски во время демонстрации.
+
+FileWatcher опрашивает время изменения и размер файлов. TextureReloader
+при изменении пересчитывает текстуры в фоновом потоке, а цикл отрисовки
+забирает готовый результат через poll() и подменяет текстуры целиком между
+кадрами:
+- изменилась текстура - обе мозаики и текстура с маской строятся заново;
+- изменилась только маска - пересчитываются только плитки, где новая маска
+  отличается от прежней (с запасом на радиус фильтра LANCZOS).
+"""
+import functools
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageChops
+
+from mosaic import LANCZOS_SUPPORT, apply_mask_correct, create_mosaic_pair, mask_source
+from stream import band_alpha, band_strip
+
+TILE_SIZE = 64
+# Шаг карты изменений маски, пикселей маски
+CELL = 8
+# Если изменилась большая часть плиток, дешевле пересчитать маску целиком
+PARTIAL_LIMIT = 0.5
+
+
+class FileWatcher:
+    """
+    Следит за файлами опросом os.stat. Изменение засчитывается, когда файл
+    не менялся между двумя проверками - недописанный файл не читается
+    """
+
+    def __init__(self, paths, interval=0.5):
+        self.paths = list(paths)
+        self.interval = interval
+        self.stamps = {path: self._stamp(path) for path in self.paths}
+        self.pending = {}
+        self.next_check = 0.0
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def changed(self):
+        """Файлы, изменившиеся с прошлого раза (проверка не чаще раза в interval)"""
+        now = time.monotonic()
+        if now < self.next_check:
+            return []
+        self.next_check = now + self.interval
+
+        changed = []
+        for path in self.paths:
+            stamp = self._stamp(path)
+            if stamp is None or stamp == self.stamps[path]:
+                self.pending.pop(path, None)
+            elif self.pending.get(path) == stamp:
+                # Файл не менялся с прошлой проверки - запись закончена
+                del self.pending[path]
+                self.stamps[path] = stamp
+                changed.append(path)
+            else:
+                self.pending[path] = stamp
+        return changed
+
+
+def load_mask(path):
+    """Загружает маску целиком (файл не держится открытым)"""
+    with Image.open(path) as mask:
+        mask.load()
+        return mask.copy()
+
+
+def changed_pixels(old_mask, new_mask):
+    """
+    Карта (режим L, 255 - изменился) пикселей маски, от которых зависит
+    альфа-канал текстуры с маской. None - маски нельзя сравнить попиксельно
+    """
+    if old_mask.size != new_mask.size or old_mask.mode != new_mask.mode:
+        return None
+    if new_mask.mode == 'RGBA':
+        # У RGBA-маски альфа-канал результата берется только из ее альфа-канала
+        old_mask, new_mask = old_mask.getchannel('A'), new_mask.getchannel('A')
+    elif new_mask.mode not in ('L', 'RGB'):
+        return None
+    diff = ImageChops.difference(old_mask, new_mask)
+    if diff.mode != 'L':
+        diff = functools.reduce(ImageChops.lighter, diff.split())
+    return diff.point(lambda value: 255 if value else 0)
+
+
+def changed_boxes(old_mask, new_mask, output_size, tile_size=TILE_SIZE):
+    """
+    Области (left, top, right, bottom) результата размера output_size, которые
+    надо пересчитать после правки маски. None - пересчитать целиком
+    """
+    diff = changed_pixels(old_mask, new_mask)
+    if diff is None:
+        return None
+    if diff.getbbox() is None:
+        return []
+
+    # Изменения собираем по клеткам CELL x CELL: в уменьшенной карте клетка
+    # ненулевая, если в ней изменился хоть один пиксель (255 / CELL^2 > 0.5)
+    cells = np.asarray(diff.reduce(CELL)) > 0
+    # Таблица сумм: есть ли изменения в любом прямоугольнике клеток за O(1)
+    table = np.zeros((cells.shape[0] + 1, cells.shape[1] + 1), dtype=np.int32)
+    table[1:, 1:] = cells.cumsum(axis=0).cumsum(axis=1)
+
+    width, height = output_size
+    scale_x = new_mask.width / width
+    scale_y = new_mask.height / height
+    # Пиксель результата зависит от пикселей маски в радиусе фильтра
+    pad_x = LANCZOS_SUPPORT * max(1.0, 1 / scale_x) + 1
+    pad_y = LANCZOS_SUPPORT * max(1.0, 1 / scale_y) + 1
+
+    def cell_edges(length, pad, scale, cell_count):
+        starts = np.arange(0, length, tile_size)
+        stops = np.minimum(starts + tile_size, length)
+        lows = np.floor((starts - pad) * scale) // CELL
+        highs = -(-np.ceil((stops + pad) * scale) // CELL)
+        return (np.clip(lows, 0, cell_count).astype(int), np.clip(highs, 0, cell_count).astype(int))
+
+    x_low, x_high = cell_edges(width, pad_x, scale_x, cells.shape[1])
+    y_low, y_high = cell_edges(height, pad_y, scale_y, cells.shape[0])
+    counts = (table[y_high[:, None], x_high[None, :]] - table[y_low[:, None], x_high[None, :]]
+              - table[y_high[:, None], x_low[None, :]] + table[y_low[:, None], x_low[None, :]])
+    tiles = counts > 0
+    if tiles.mean() > PARTIAL_LIMIT:
+        return None
+
+    # Серии соседних плиток в строке - одна область
+    boxes = []
+    for row, flags in enumerate(tiles.tolist()):
+        top = row * tile_size
+        bottom = min(top + tile_size, height)
+        column = 0
+        while column < len(flags):
+            if not flags[column]:
+                column += 1
+                continue
+            start = column
+            while column < len(flags) and flags[column]:
+                column += 1
+            boxes.append((start * tile_size, top, min(column * tile_size, width), bottom))
+    return boxes
+
+
+def update_masked(masked, mask, boxes):
+    """
+    Копия текстуры с маской, где в областях boxes альфа-канал пересчитан по
+    новой маске. Строки областей считаются полосами, как в stream.py: resize
+    с box на дробном масштабе расходится с полным на единицу, а полоса
+    совпадает с apply_mask_correct байт в байт
+    """
+    result = masked.copy()
+    width, height = masked.size
+    # Альфа-канал RGBA-маски отделяем один раз на все области
+    source = mask_source(mask)
+    bands = {}
+    for left, top, right, bottom in boxes:
+        # Области одной строки плиток делят одну полосу
+        band = bands.get((top, bottom))
+        if band is None:
+            strip, taps = band_strip(source, height, top, bottom)
+            band = bands[top, bottom] = band_alpha(strip, width, taps)
+        region = result.crop((left, top, right, bottom))
+        region.putalpha(band.crop((left, 0, right, bottom - top)))
+        result.paste(region, (left, top))
+    return result
+
+
+def scale_box(box, from_size, to_size, margin=1):
+    """Переводит область из одного размера изображения в другой (с запасом и обрезкой по краям)"""
+    left, top, right, bottom = box
+    scale_x = to_size[0] / from_size[0]
+    scale_y = to_size[1] / from_size[1]
+    return (max(0, math.floor(left * scale_x) - margin), max(0, math.floor(top * scale_y) - margin),
+            min(to_size[0], math.ceil(right * scale_x) + margin),
+            min(to_size[1], math.ceil(bottom * scale_y) + margin))
+
+
+class ReloadUpdate:
+    """Результат перезагрузки: новые текстуры и измененные области (None - изменилось все)"""
+
+    def __init__(self, normal, reverse, masked, boxes):
+        self.normal = normal
+        self.reverse = reverse
+        self.masked = masked
+        self.boxes = boxes
+
+
+class TextureReloader:
+    """
+    Пересчитывает текстуры в фоновом потоке при изменении файлов.
+    prepare(update) выполняется там же и готовит то, что нужно потребителю
+    (например, поверхности pygame), чтобы цикл отрисовки только подменил их
+    """
+
+    def __init__(self, texture_path, mask_path, output_size, textures, prepare=None, interval=0.5):
+        self.texture_path = texture_path
+        self.mask_path = mask_path
+        self.output_size = output_size
+        self.normal, self.reverse, self.masked = textures
+        self.mask = load_mask(mask_path)
+        self.prepare = prepare or (lambda update: update)
+        self.watcher = FileWatcher([texture_path, mask_path], interval)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reload')
+        self.future = None
+        self.changed = set()
+        self.reloads = 0
+        self.errors = 0
+        self.last_update = None
+        self.last_seconds = 0.0
+
+    def poll(self):
+        """
+        Вызывается каждый кадр: запускает пересчет, если файлы изменились,
+        и возвращает готовый результат prepare (или None)
+        """
+        result = None
+        if self.future is not None and self.future.done():
+            future, self.future = self.future, None
+            try:
+                result = future.result()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️  Не удалось перезагрузить текстуры: {e}")
+
+        self.changed.update(self.watcher.changed())
+        if self.changed and self.future is None:
+            changed, self.changed = self.changed, set()
+            self.future = self.executor.submit(self._reload, changed)
+        return result
+
+    def _reload(self, changed):
+        started = time.perf_counter()
+        mask = load_mask(self.mask_path)
+        if self.texture_path in changed:
+            with Image.open(self.texture_path) as base_texture:
+                normal, reverse = create_mosaic_pair(base_texture, self.output_size)
+            masked = apply_mask_correct(normal, mask)
+            boxes = None
+        else:
+            normal, reverse = self.normal, self.reverse
+            boxes = changed_boxes(self.mask, mask, self.output_size)
+            if boxes is None:
+                masked = apply_mask_correct(normal, mask)
+            elif not boxes:
+                # Файл пересохранен без изменений
+                self.mask = mask
+                return None
+            else:
+                masked = update_masked(self.masked, mask, boxes)
+
+        update = ReloadUpdate(normal, reverse, masked, boxes)
+        result = self.prepare(update)
+        self.normal, self.reverse, self.masked, self.mask = normal, reverse, masked, mask
+        self.reloads += 1
+        self.last_update = update
+        self.last_seconds = time.perf_counter() - started
+        return result
+
+    def summary(self):
+        """Строка о последней перезагрузке"""
+        update = self.last_update
+        if update is None:
+            return "перезагрузок не было"
+        if update.boxes is None:
+            scope = "все текстуры"
+        else:
+            area = sum((right - left) * (bottom - top) for left, top, right, bottom in update.boxes)
+            scope = f"маска, {len(update.boxes)} обл. ({area / (self.output_size[0] * self.output_size[1]):.0%})"
+        return f"{scope} за {self.last_seconds * 1000:.0f} мс"
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)